@@ -0,0 +1,227 @@
+"""
+Batch review of a directory (or manifest) of PDFs.
+
+    python batch.py factsheets/ --output results.jsonl
+    python batch.py manifest.txt --extract-workers 4 --llm-concurrency 8
+
+Docling extraction runs in a process pool; the review stages of each document
+run in an asyncio pool bounded by --llm-concurrency. Every finished document is
+appended to the JSONL output and recorded in a checkpoint file, so rerunning the
+same command after a crash skips what is already done. A throughput/latency
+summary is printed at the end.
+
+At most --max-in-flight documents are being extracted or reviewed at once, so
+converted documents do not accumulate in memory ahead of the review stages.
+Identical files (same sha256) are reviewed once per run. A document whose
+stages reported an API error, an unparseable response or a failed disclosure
+extraction is recorded as failed and retried on the next run.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+def iter_documents(source: str) -> list:
+    """PDFs under a directory, or the paths listed in a manifest (.txt or .jsonl)."""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(".pdf"))
+        return sorted(paths)
+
+    base = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path = json.loads(line)["path"] if line.startswith("{") else line
+            paths.append(path if os.path.isabs(path) else os.path.join(base, path))
+    return paths
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_checkpoint(path: str) -> set:
+    """sha256 of every document already reviewed successfully."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line after a crash
+            if entry.get("status") == "ok":
+                done.add(entry["sha256"])
+    return done
+
+
+def _append_line(path: str, record: dict):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _extract(path: str) -> dict:
+    # Runs in a worker process; the docling converter is created once per worker.
+    from conversion_cache import convert_pdf
+
+    conversion = convert_pdf(path)
+    return {"markdown": conversion["markdown"], "pages": conversion["pages"], "seconds": conversion["seconds"]}
+
+
+def _as_json(value):
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return value
+    return value
+
+
+def _review(path: str, extraction: dict) -> dict:
+    import re
+
+    from test_pipeline import run_review_stages
+
+    clean_text = re.sub(r"<!-- image -->", "", extraction["markdown"])
+    stages = run_review_stages(clean_text, path, extraction["pages"])
+    stages["timings"]["conversion"] = extraction["seconds"]
+    return {name: _as_json(value) for name, value in stages.items()}
+
+
+def stage_failures(record: dict) -> list:
+    """
+    In-band failures of a reviewed document: the stages report API errors and
+    unparseable responses inside their results instead of raising.
+    """
+    failures = []
+    for stage in ("text_review", "multimodal", "synthesis"):
+        result = record.get(stage)
+        if not isinstance(result, dict):
+            continue
+        if str(result.get("overall_conclusion", "")).startswith("Gemini API error"):
+            failures.append(f"{stage}: {result['overall_conclusion']}")
+        if "raw_response" in result:
+            failures.append(f"{stage}: unparseable model response")
+        if result.get("failed_chunks"):
+            failures.append(f"{stage}: failed chunks {result['failed_chunks']}")
+        if (result.get("batches") or {}).get("failed"):
+            failures.append(f"{stage}: failed page batches {result['batches']['failed']}")
+    if "disclosure" in record and record["disclosure"] is None:
+        failures.append("disclosure: extraction failed")
+    return failures
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+async def run_batch(paths: list, output: str, checkpoint: str,
+                    extract_workers: int, llm_concurrency: int, max_in_flight: int = None) -> dict:
+    done = load_checkpoint(checkpoint)
+    loop = asyncio.get_running_loop()
+    llm_slots = asyncio.Semaphore(llm_concurrency)
+    # Documents between hashing and their result line. Extraction may run ahead of
+    # review by extract_workers documents, so converted markdown never piles up.
+    doc_slots = asyncio.Semaphore(max_in_flight or extract_workers + llm_concurrency)
+    seen = set()
+    latencies, counts = [], {"ok": 0, "failed": 0, "skipped": 0}
+    start = time.perf_counter()
+
+    async def process(pool, path):
+        async with doc_slots:
+            await _process(pool, path)
+
+    async def _process(pool, path):
+        doc_start = time.perf_counter()
+        sha256 = await asyncio.to_thread(file_sha256, path)
+        if sha256 in done or sha256 in seen:  # reviewed before, or a duplicate within this run
+            counts["skipped"] += 1
+            return
+        seen.add(sha256)
+        record = {"path": path, "sha256": sha256}
+        try:
+            extraction = await loop.run_in_executor(pool, _extract, path)
+            async with llm_slots:
+                record.update(await asyncio.to_thread(_review, path, extraction))
+            failures = stage_failures(record)
+            if failures:
+                # Not checkpointed as done, so a rerun retries the document
+                record.update(status="failed", error="; ".join(failures))
+            else:
+                record["status"] = "ok"
+        except Exception as e:
+            record.update(status="failed", error=f"{type(e).__name__}: {e}")
+        record["seconds"] = round(time.perf_counter() - doc_start, 3)
+
+        # Result first, then checkpoint: a crash in between only re-runs one document.
+        _append_line(output, record)
+        _append_line(checkpoint, {"path": path, "sha256": sha256, "status": record["status"]})
+        counts[record["status"]] += 1
+        latencies.append(record["seconds"])
+        print(f"[{sum(counts.values())}/{len(paths)}] {record['status']} {path} ({record['seconds']}s)",
+              file=sys.stderr)
+
+    with ProcessPoolExecutor(max_workers=extract_workers) as pool:
+        await asyncio.gather(*(process(pool, path) for path in paths))
+
+    import telemetry
+    from responses import parse_stats
+
+    wall = time.perf_counter() - start
+    processed = counts["ok"] + counts["failed"]
+    return {
+        "documents": len(paths),
+        **counts,
+        "wall_seconds": round(wall, 2),
+        "docs_per_minute": round(processed / wall * 60, 2) if wall and processed else 0.0,
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        "latency_max": round(max(latencies), 3) if latencies else 0.0,
+        "parse": parse_stats(),
+        "model_calls": telemetry.report()["stages"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Review a directory or manifest of PDFs.")
+    parser.add_argument("source", help="directory of PDFs, or a manifest (.txt paths / .jsonl with 'path')")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file, one result per document")
+    parser.add_argument("--checkpoint", help="progress file (default: <output>.checkpoint)")
+    parser.add_argument("--extract-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="docling extraction processes")
+    parser.add_argument("--llm-concurrency", type=int, default=4,
+                        help="documents in the review stages at once")
+    parser.add_argument("--max-in-flight", type=int,
+                        help="documents extracted or in review at once (default: extract workers + LLM concurrency)")
+    args = parser.parse_args(argv)
+
+    paths = iter_documents(args.source)
+    checkpoint = args.checkpoint or args.output + ".checkpoint"
+    summary = asyncio.run(run_batch(paths, args.output, checkpoint, args.extract_workers,
+                                    args.llm_concurrency, args.max_in_flight))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
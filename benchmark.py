@@ -0,0 +1,580 @@
+"""
+Offline benchmark of the review pipeline against a fake model backend.
+
+    python benchmark.py --out bench/base.json
+    python benchmark.py --latency '{"dist": "lognormal", "median": 0.8, "sigma": 0.6}' \\
+        --error-rate 0.02 --throttle-rate 0.05 --out bench/new.json
+    python benchmark.py compare bench/base.json bench/new.json --threshold 10
+
+Every model client the stages use is swapped for fake_backend.py (the shared
+google-genai client, the LangChain chat model of main.py and the Vertex models
+of complience.py), so nothing is sent to the API. The response cache is off
+and uploads / prefix caches stay in-process, so every run pays the fake
+latency and leaves nothing behind in .cache.
+
+Targets, each over every PDF of the corpus (default: the bundled PDFs, minus
+the SEC rule sources):
+
+- pipeline: test_pipeline.extract_text_from_pdf (docling conversion, then the
+  text, disclosure, multimodal and synthesis stages);
+- check_compliance: main.check_compliance over the first chunks of each PDF;
+- complience.*: the service stages (text, multimodal, batched multimodal,
+  synthesis, typo and disclosure review).
+
+A target whose module or dependencies cannot be imported is reported as
+skipped with the reason, and one whose every call failed as failed; neither
+is compared. Per target the result file holds p50/p95/mean/max latency per
+document and throughput (of the successful calls only), the process peak RSS after the target (a
+high-water mark, so it only grows from target to target), tracemalloc's peak
+and the allocations left behind by the target with their top sites, and the
+per-stage model-call telemetry. `compare` prints the change of each metric
+between two result files and, with --threshold, exits 1 on a regression.
+"""
+import argparse
+import contextlib
+import functools
+import glob
+import hashlib
+import importlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from batch import percentile
+from fake_backend import FakeChatModel, FakeGenaiClient, FakeModelBackend, FakeVertexModel
+import telemetry
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DISCLOSURE_LIBRARY = os.path.join(ROOT, "data", "Disclosure Library_TEMPLATE_DRAFT.xlsx")
+DEFAULT_LATENCY = {"dist": "lognormal", "median": 0.2, "sigma": 0.4}
+# Chunks of each PDF sent to check_compliance, and their size.
+COMPLIANCE_CHUNKS = 3
+COMPLIANCE_CHUNK_CHARS = 1500
+TOP_ALLOCATION_SITES = 5
+
+
+# ---------------------------------------------------------------------------
+# Canned responses
+# ---------------------------------------------------------------------------
+
+def _section(title: str, page: str, observations: str) -> dict:
+    return {
+        "section_title": title,
+        "page_number": page,
+        "observations": observations,
+        "rule_citation": "SEC Marketing Rule 206(4)-1(a)(1)",
+        "recommendations": "Add the standardized performance disclosure next to the figure.",
+        "category": "Performance",
+    }
+
+
+# The text and multimodal reviews share one finding, report a second one in
+# different words (left to the synthesis model) and one finding each of their own.
+TEXT_REVIEW = {
+    "document_name": "Benchmark (Text Review)",
+    "sections": [
+        _section("Yield presented without disclosure", "1", "The 7-day yield is shown without the standardized yield disclosure."),
+        _section("Past performance statement", "2", "Past performance is described as a guarantee of future results."),
+        _section("Missing fee disclosure", "3", "Expense ratio is shown without the gross expense ratio."),
+    ],
+    "overall_conclusion": "Non-compliant.",
+}
+MULTIMODAL_REVIEW = {
+    "document_name": "Benchmark (Multimodal Review)",
+    "sections": [
+        _section("Yield presented without disclosure", "1", "The 7-day yield is shown without the standardized yield disclosure."),
+        _section("Performance guarantee wording", "2", "Wording implies past performance guarantees future returns."),
+        _section("Chart without source", "4", "The allocation chart does not name its data source."),
+    ],
+    "overall_conclusion": "Non-compliant.",
+}
+
+RESPONSES = [
+    (r'\{"disclosures"', json.dumps({"disclosures": [
+        {"text": "Past performance does not guarantee future results.", "pages": "2"},
+        {"text": "An investment in the Fund is not insured or guaranteed by the FDIC.", "pages": "1,2"},
+    ]})),
+    (r"missing '%' symbols", json.dumps({"missing_percent_details": [
+        {"page": "1", "context": "Sector Allocation", "recommendation": "Insert '%' in the label: 'Sector Allocation (%)'."},
+    ]})),
+    (r"TEXT_CHUNK", json.dumps({
+        "compliance": "REJECT",
+        "REJECTION_EXPLANATION": "The statement 'Yields will not vary' is misleading under Rule 206(4)-1.",
+        "SINGLE_BEST_ALTERNATIVE": "Yields will vary.",
+    })),
+    (r'"classifications"', json.dumps({"comparison_summary": "Minor wording changes.", "classifications": []})),
+    (r"different versions of the same marketing collateral", json.dumps({
+        "comparison_summary": "Minor wording changes.", "differences": [],
+    })),
+    (r"Multimodal Review\)", json.dumps(MULTIMODAL_REVIEW)),
+    (r"Compliance Report Synthesizer", json.dumps({"document_name": "Benchmark", "sections": MULTIMODAL_REVIEW["sections"][1:2]})),
+]
+
+
+# ---------------------------------------------------------------------------
+# Fake backend wiring
+# ---------------------------------------------------------------------------
+
+def _import_complience():
+    """The service copy of complience.py (relative imports: only importable as part of its package)."""
+    try:
+        from services import compliance
+        return compliance
+    except ImportError:
+        sys.path.insert(0, os.path.dirname(ROOT))
+        return importlib.import_module(os.path.basename(ROOT) + ".complience")
+
+
+def _loaded_complience():
+    return next((m for name, m in sys.modules.items() if name.endswith(("complience", "services.compliance"))), None)
+
+
+def _module_copies(name: str) -> list:
+    """
+    The top-level module `name` plus, once complience is loaded, the copy its
+    package loaded (complience imports its siblings relatively, so it never
+    sees the top-level modules).
+    """
+    modules = [importlib.import_module(name)]
+    complience = _loaded_complience()
+    if complience is not None and complience.__package__:
+        copy = sys.modules.get(f"{complience.__package__}.{name}")
+        if copy is not None and copy is not modules[0]:
+            modules.append(copy)
+    return modules
+
+
+def _telemetry_for(target: str):
+    """The telemetry module the target's model calls are recorded in."""
+    return _module_copies("telemetry")[-1] if target.startswith("complience.") else telemetry
+
+
+@contextlib.contextmanager
+def fake_models(backend: FakeModelBackend):
+    """Point every model client at `backend`; the originals are restored on exit."""
+    chat_model = FakeChatModel(backend)
+    genai_client = FakeGenaiClient(backend)
+    patches = []
+    for clients in _module_copies("clients"):
+        patches += [
+            (clients, "_genai_client", genai_client),
+            (clients, "get_chat_model", lambda *args, **kwargs: chat_model),
+        ]
+    for llm_cache in _module_copies("llm_cache"):
+        patches.append((llm_cache, "CACHE_ENABLED", False))
+    for document_handle in _module_copies("document_handle"):
+        patches += [(document_handle, "DOCUMENT_STORE_BACKEND", "local"), (document_handle, "_store", None)]
+    for prefix_cache in _module_copies("prefix_cache"):
+        patches.append((prefix_cache, "PREFIX_CACHE_BACKEND", "local"))
+    if "main" in sys.modules:
+        patches.append((sys.modules["main"], "get_chat_model", patches[1][2]))
+    complience = _loaded_complience()
+    if complience is not None:
+        for name in ("review_model", "synthesis_model", "typo_model", "disclosure_model"):
+            patches.append((complience, name, FakeVertexModel(backend, "fake-" + name.replace("_", "-"))))
+
+    saved = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    for module, name, value in patches:
+        setattr(module, name, value)
+    try:
+        yield backend
+    finally:
+        for module, name, value in saved:
+            setattr(module, name, value)
+
+
+# ---------------------------------------------------------------------------
+# Corpus
+# ---------------------------------------------------------------------------
+
+def default_corpus() -> list:
+    return sorted(
+        p for p in glob.glob(os.path.join(ROOT, "*.pdf"))
+        if not os.path.basename(p).startswith("sec_rules")
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _converted(path: str):
+    """Docling conversion (served by the conversion cache when possible), or None."""
+    try:
+        from conversion_cache import convert_pdf
+
+        return convert_pdf(path)
+    except Exception:
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _pdfium_pages(path: str) -> list:
+    """Page map in docling's shape from the pypdfium2 text layer (docling not installed)."""
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(path)
+    try:
+        return [{"page_no": i + 1, "text": page.get_textpage().get_text_range()} for i, page in enumerate(pdf)]
+    finally:
+        pdf.close()
+
+
+def document_text(path: str) -> str:
+    conversion = _converted(path)
+    if conversion is not None:
+        return conversion["markdown"].replace("<!-- image -->", "")
+    return "\n\n".join(page["text"] for page in _pdfium_pages(path))
+
+
+def document_pages(path: str) -> list:
+    """
+    The page map the pipeline passes to the typo and disclosure stages, so
+    their local-detection paths are measured even without docling.
+    """
+    conversion = _converted(path)
+    return conversion["pages"] if conversion is not None else _pdfium_pages(path)
+
+
+def text_chunks(text: str, count: int = COMPLIANCE_CHUNKS, size: int = COMPLIANCE_CHUNK_CHARS) -> list:
+    """The first `count` chunks of about `size` characters, split at blank lines."""
+    chunks, current = [], ""
+    for block in text.split("\n\n"):
+        if current and len(current) + len(block) > size:
+            chunks.append(current)
+            if len(chunks) == count:
+                return chunks
+            current = ""
+        current = f"{current}\n\n{block}" if current else block
+    return chunks + [current] if current.strip() else chunks
+
+
+def _corpus_meta(corpus: list) -> list:
+    meta = []
+    for path in corpus:
+        with open(path, "rb") as f:
+            data = f.read()
+        meta.append({"name": os.path.basename(path), "bytes": len(data), "sha256": hashlib.sha256(data).hexdigest()})
+    return meta
+
+
+# ---------------------------------------------------------------------------
+# Targets: (name, build) where build(corpus, args) -> [(document, call), ...]
+# ---------------------------------------------------------------------------
+
+def _pipeline_calls(corpus, args):
+    from test_pipeline import extract_text_from_pdf
+
+    return [(path, functools.partial(extract_text_from_pdf, path)) for path in corpus]
+
+
+def _check_compliance_calls(corpus, args):
+    import main
+
+    # check_compliance refuses to run without a key; the fake chat model never uses it
+    os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+    # with --top-k, passages are retrieved from the whole bundled SEC corpus
+    rules = None if args.top_k else main.load_sec_rules()
+    return [
+        (path, functools.partial(main.check_compliance, chunk, rules, args.top_k))
+        for path in corpus
+        for chunk in text_chunks(document_text(path), args.chunks)
+    ]
+
+
+def _complience_calls(stage: str):
+    def build(corpus, args):
+        complience = _import_complience()
+        text_res, multi_res = dict(TEXT_REVIEW), dict(MULTIMODAL_REVIEW)
+        stages = {
+            "run_text_review": lambda path: complience.run_text_review(document_text(path)),
+            "run_multimodal_review": lambda path: complience.run_multimodal_review(path),
+            "run_multimodal_review_batched": lambda path: complience.run_multimodal_review_batched(path),
+            "run_synthesis_review": lambda path: complience.run_synthesis_review(text_res, multi_res, path),
+            "run_typo_analysis": lambda path: complience.run_typo_analysis(path, document_pages(path)),
+            "run_disclosure_analysis": lambda path: complience.run_disclosure_analysis(
+                DISCLOSURE_LIBRARY, path, document_pages(path)
+            ),
+        }
+        # Build the document text/pages now so conversion is not timed as part of the stage
+        for path in corpus:
+            document_text(path)
+            document_pages(path)
+        return [(path, functools.partial(stages[stage], path)) for path in corpus]
+
+    return build
+
+
+COMPLIENCE_STAGES = (
+    "run_text_review", "run_multimodal_review", "run_multimodal_review_batched",
+    "run_synthesis_review", "run_typo_analysis", "run_disclosure_analysis",
+)
+TARGETS = [("pipeline", _pipeline_calls), ("check_compliance", _check_compliance_calls)] + [
+    ("complience." + stage, _complience_calls(stage)) for stage in COMPLIENCE_STAGES
+]
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _allocation_sites(before, after) -> tuple:
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+    diffs = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+    grown = [d for d in diffs if d.size_diff > 0]
+    sites = [
+        {"site": str(d.traceback[0]), "kib": round(d.size_diff / 1024, 1), "blocks": d.count_diff}
+        for d in grown[:TOP_ALLOCATION_SITES]
+    ]
+    return sum(d.size_diff for d in grown), sum(max(d.count_diff, 0) for d in grown), sites
+
+
+def _run_calls(name: str, calls: list, errors: list, latencies: list = None, quiet: bool = True):
+    """Run every call; `latencies` gets the duration of each successful one."""
+    for document, call in calls:
+        output = io.StringIO()
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+                with _telemetry_for(name).scope(stage=name, document=document):
+                    result = call()
+            if result is None:
+                # extract_text_from_pdf prints "Error:..." and returns None
+                printed = [line for line in output.getvalue().splitlines() if line.startswith("Error:")]
+                errors.append(f"{os.path.basename(document)}: {printed[-1] if printed else 'returned None'}")
+                continue
+        except Exception as e:
+            errors.append(f"{os.path.basename(document)}: {type(e).__name__}: {e}")
+            continue
+        if latencies is not None:
+            latencies.append(time.perf_counter() - start)
+
+
+def measure(name: str, calls: list, backend: FakeModelBackend, args) -> dict:
+    for _ in range(args.warmup):
+        _run_calls(name, calls, [], quiet=not args.verbose)
+
+    target_telemetry = _telemetry_for(name)
+    target_telemetry.reset()
+    backend_before = dict(backend.stats)
+    latencies, errors = [], []
+    if args.trace:
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        _run_calls(name, calls, errors, latencies, quiet=not args.verbose)
+    wall = time.perf_counter() - start
+
+    if not latencies:
+        # every call failed: timings of the failures say nothing about the target
+        return {
+            "status": "failed",
+            "reason": errors[0] if errors else "no calls",
+            "calls": len(errors),
+            "errors": len(errors),
+            "error_samples": errors[:5],
+        }
+    result = {
+        "status": "ok",
+        "calls": len(latencies) + len(errors),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_seconds": round(wall, 3),
+        "throughput_per_second": round(len(latencies) / wall, 3) if wall else 0.0,
+        "latency": {
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "mean": round(sum(latencies) / len(latencies), 4),
+            "max": round(max(latencies), 4),
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "model_calls": target_telemetry.report()["stages"],
+        "backend": {key: round(backend.stats[key] - backend_before[key], 3) for key in backend.stats
+                    if key != "max_in_flight"},
+    }
+    if args.trace:
+        _, traced_peak = tracemalloc.get_traced_memory()
+        allocated, blocks, sites = _allocation_sites(before, tracemalloc.take_snapshot())
+        result["memory"] = {
+            "traced_peak_mb": round(traced_peak / (1024 * 1024), 2),
+            "allocated_mb": round(allocated / (1024 * 1024), 2),
+            "allocated_blocks": blocks,
+            "top_sites": sites,
+        }
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> dict:
+    corpus = [os.path.abspath(p) for p in args.pdfs] or default_corpus()
+    selected = [(name, build) for name, build in TARGETS if not args.targets or any(
+        name == t or name.startswith(t + ".") for t in args.targets
+    )]
+    responses = RESPONSES
+    if args.responses:
+        with open(args.responses, "r", encoding="utf-8") as f:
+            responses = [tuple(rule) for rule in json.load(f)] + RESPONSES
+    backend = FakeModelBackend(
+        latency_seconds=args.latency,
+        throttle_rate=args.throttle_rate,
+        error_rate=args.error_rate,
+        response_text=json.dumps(TEXT_REVIEW),
+        responses=responses,
+        seed=args.seed,
+    )
+
+    if args.trace:
+        tracemalloc.start()
+    results = {}
+    try:
+        for name, build in selected:
+            try:
+                calls = build(corpus, args)
+            except Exception as e:
+                results[name] = {"status": "skipped", "reason": f"{type(e).__name__}: {e}"}
+            else:
+                # after build(): the modules it imported have their model clients patched too
+                with fake_models(backend):
+                    results[name] = measure(name, calls, backend, args)
+            print(f"{name}: {results[name]['status']}", results[name].get("latency") or results[name].get("reason"),
+                      file=sys.stderr)
+    finally:
+        if args.trace:
+            tracemalloc.stop()
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus": _corpus_meta(corpus),
+            "settings": {
+                "latency": args.latency,
+                "throttle_rate": args.throttle_rate,
+                "error_rate": args.error_rate,
+                "seed": args.seed,
+                "iterations": args.iterations,
+                "warmup": args.warmup,
+                "tracemalloc": args.trace,
+                "top_k": args.top_k,
+            },
+        },
+        "targets": results,
+        "backend": backend.stats,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Comparison
+# ---------------------------------------------------------------------------
+
+# (path in a target result, True when higher is better)
+COMPARED_METRICS = [
+    (("errors",), False),
+    (("latency", "p50"), False),
+    (("latency", "p95"), False),
+    (("throughput_per_second",), True),
+    (("peak_rss_mb",), False),
+    (("memory", "traced_peak_mb"), False),
+    (("memory", "allocated_blocks"), False),
+]
+
+
+def _metric(result: dict, path: tuple):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(base: dict, new: dict, threshold: float = None) -> list:
+    """[(target, metric, base, new, change %, regression)] for every metric both runs have."""
+    rows = []
+    for target, base_result in base["targets"].items():
+        new_result = new["targets"].get(target)
+        if not new_result or base_result["status"] != "ok" or new_result["status"] != "ok":
+            continue
+        for path, higher_is_better in COMPARED_METRICS:
+            old, value = _metric(base_result, path), _metric(new_result, path)
+            if old is None or value is None:
+                continue
+            if old:
+                change = (value - old) / old * 100
+            else:  # e.g. errors going from 0 to some
+                change = 0.0 if value == old else (100.0 if value > old else -100.0)
+            worse = -change if higher_is_better else change
+            rows.append((target, ".".join(path), old, value, round(change, 1),
+                         threshold is not None and worse > threshold))
+    return rows
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["compare"]:
+        parser = argparse.ArgumentParser(prog="benchmark.py compare", description="Compare two benchmark result files.")
+        parser.add_argument("base")
+        parser.add_argument("new")
+        parser.add_argument("--threshold", type=float, help="exit 1 if a metric gets worse by more than this %%")
+        args = parser.parse_args(argv[1:])
+        with open(args.base, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.new, "r", encoding="utf-8") as f:
+            new = json.load(f)
+        rows = compare(base, new, args.threshold)
+        for target, metric, old, value, change, regression in rows:
+            print(f"{target:45} {metric:28} {old:>12} -> {value:<12} {change:+7.1f}%{'  REGRESSION' if regression else ''}")
+        for target in sorted(set(base["targets"]) ^ set(new["targets"])):
+            print(f"{target:45} only in {'base' if target in base['targets'] else 'new'}")
+        sys.exit(1 if any(row[-1] for row in rows) else 0)
+
+    parser = argparse.ArgumentParser(description="Benchmark the review stages against a fake model backend.")
+    parser.add_argument("pdfs", nargs="*", help="PDFs to benchmark (default: the bundled PDFs)")
+    parser.add_argument("--out", default="benchmark_results.json", help="JSON result file")
+    parser.add_argument("--targets", nargs="*", help="targets to run, e.g. pipeline check_compliance complience")
+    parser.add_argument("--latency", type=json.loads, default=DEFAULT_LATENCY,
+                        help='fake model latency: seconds, or a distribution such as \'{"dist": "normal", "mean": 1, "stddev": 0.3}\'')
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of calls failing with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failing with 500")
+    parser.add_argument("--responses", help="JSON list of [regex, response text] rules tried before the built-in ones")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", type=int, default=1, help="measured passes over the corpus")
+    parser.add_argument("--warmup", type=int, default=0, help="unmeasured passes before the measured ones")
+    parser.add_argument("--chunks", type=int, default=COMPLIANCE_CHUNKS, help="check_compliance chunks per PDF")
+    parser.add_argument("--top-k", type=int, help="check_compliance rule retrieval (default: full ruleset)")
+    parser.add_argument("--no-trace", dest="trace", action="store_false",
+                        help="skip tracemalloc (it slows allocation-heavy code down)")
+    parser.add_argument("--verbose", action="store_true", help="show the stages' own output")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    directory = os.path.dirname(os.path.abspath(args.out))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{args.out}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, default=str)
+    os.replace(tmp_path, args.out)
+    print(f"Wrote {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
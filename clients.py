@@ -0,0 +1,109 @@
+"""
+Process-wide registry of model clients.
+
+Every stage used to build its own genai.Client (or a ChatGoogleGenerativeAI per
+chunk), paying connection setup and TLS handshakes again and again. Clients
+are now created once per process and share a keep-alive HTTP connection pool.
+Calls go through the per-model governor (governor.py), which caps concurrency
+and request rate and retries throttled requests, and are recorded by telemetry.py.
+"""
+import json
+import logging
+import os
+import threading
+
+if __package__:
+    from .governor import governed_call
+    from .telemetry import track_call, track_stream
+else:  # imported as a top-level module by the stage scripts
+    from governor import governed_call
+    from telemetry import track_call, track_stream
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("GENAI_HTTP_MAX_CONNECTIONS", "32"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("GENAI_HTTP_MAX_KEEPALIVE", "16"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("GENAI_HTTP_KEEPALIVE_SECONDS", "120"))
+
+_lock = threading.Lock()
+_genai_client = None
+_chat_models = {}
+
+
+def _api_key():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return os.getenv("GEMINI_API_KEY")
+
+
+def _http_options():
+    import httpx
+    from google.genai import types
+
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+    )
+    return types.HttpOptions(client_args={"limits": limits}, async_client_args={"limits": limits})
+
+
+def get_genai_client():
+    """The shared google-genai client (created on first use)."""
+    global _genai_client
+    if _genai_client is None:
+        with _lock:
+            if _genai_client is None:
+                from google import genai
+
+                try:
+                    _genai_client = genai.Client(api_key=_api_key(), http_options=_http_options())
+                except Exception as e:
+                    # Older google-genai releases do not accept client_args.
+                    logger.warning("Falling back to default genai HTTP options: %s", e)
+                    _genai_client = genai.Client(api_key=_api_key())
+    return _genai_client
+
+
+def get_chat_model(model: str, temperature: float = 0, **kwargs):
+    """A shared ChatGoogleGenerativeAI per (model, temperature, options)."""
+    key = (model, temperature, json.dumps(kwargs, sort_keys=True, default=str))
+    with _lock:
+        llm = _chat_models.get(key)
+        if llm is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            llm = ChatGoogleGenerativeAI(model=model, temperature=temperature, **kwargs)
+            _chat_models[key] = llm
+    return llm
+
+
+def generate_content(model: str, contents, config=None):
+    """client.models.generate_content on the shared client, through the model's governor."""
+    client = get_genai_client()
+    return track_call(model, contents, lambda: governed_call(
+        model, lambda: client.models.generate_content(model=model, contents=contents, config=config)
+    ))
+
+
+def generate_content_stream(model: str, contents, config=None):
+    """
+    client.models.generate_content_stream on the shared client. Opening the
+    stream (up to the first chunk) goes through the governor, so throttling is
+    retried before anything has been yielded; later chunks are passed through.
+    """
+    client = get_genai_client()
+
+    def _open():
+        stream = iter(client.models.generate_content_stream(model=model, contents=contents, config=config))
+        return next(stream, None), stream
+
+    def _chunks():
+        first, stream = governed_call(model, _open)
+        if first is None:
+            return
+        yield first
+        yield from stream
+
+    yield from track_stream(model, contents, _chunks)
@@ -1,32 +1,100 @@
 import re
 import json
-import pandas as pd
+import hashlib
 from typing import List, Dict, Any # Added List, Dict, and Any import
 from vertexai.preview.generative_models import Part
 from .prompts import (
-    base_review_prompt_template,
+    base_review_prompt,
+    data_text,
+    typo_prompt_sys,
     text_input_instruction,
     multimodal_input_instruction,
     synthesis_prompt_template,
-    typo_date_prompt_sys,
     typo_date_prompt_user,
     false_positives_guardrails
 )
 from .models import review_model, synthesis_model, typo_model, disclosure_model
-from .utils import parse_response_to_json , run_ai_analysis
+from .responses import (
+    REVIEW_SCHEMA,
+    SYNTHESIS_SCHEMA,
+    COMPARISON_SCHEMA,
+    CHANGE_SUMMARY_SCHEMA,
+    TYPO_SCHEMA,
+    DISCLOSURE_SCHEMA,
+    json_config,
+    parse_review,
+    parse_typo,
+    parse_disclosures,
+    parse_comparison,
+    parse_change_summary
+)
+from .llm_cache import cached_generate
+from .governor import governed_call, governed_call_async
+from .telemetry import track_call, track_call_async
+from .disclosure_match import match_disclosures, disclosure_status
+from .disclosure_library import load_library
+from .disclosure_detect import detect_disclosures
+from .percent_detect import detect_missing_percent, snippets_text
+from .document_diff import content_hash, diff_versions
+from .report_merge import merge_reports, needs_model, synthesized_report
+from .multimodal_batches import review_batched
+from .mongo_store import AsyncMongoStore
+from .document_handle import open_document
 from config.logger import get_logger 
 import uuid # Import uuid
-from difflib import SequenceMatcher
 from bson import ObjectId
 from pymongo.database import Database
 from models.document_model import DocumentVersions # For type hinting
 from .prompts import document_comparison_prompt # Import the new prompt
-from starlette.concurrency import run_in_threadpool
+from .prompts import document_change_summary_prompt
 from models.comaparision_results_model import ComparisonResultsModel # Import the new model
 from datetime import datetime # Import datetime for timestamp
 from models.schemas import SelectionRegion # New import for PDF processing
 from .prompts import tell_me_why_prompt_template # Import the new prompt template
 
+logger = get_logger(__name__)
+
+
+_AI_ERROR_PREFIXES = ("BLOCKED:", "NO_CONTENT_OR_SAFETY_INFO", "API_ERROR:")
+
+
+def _model_identity(model) -> tuple:
+    """Model name and generation config used as part of the response cache key."""
+    return (
+        getattr(model, "_model_name", repr(model)),
+        getattr(model, "_generation_config", None),
+    )
+
+
+def _generate_text(model, content, generation_config=None) -> str:
+    model_name = _model_identity(model)[0]
+    response = track_call(model_name, content, lambda: governed_call(
+        model_name,
+        lambda: model.generate_content(content, generation_config=generation_config),
+    ))
+    parts = response.candidates[0].content.parts
+    return "".join(p.text for p in parts).strip()
+
+
+def _cached_model_text(model, content, key_parts, generation_config=None) -> str:
+    model_name, config = _model_identity(model)
+    if generation_config is not None:
+        config = {"model": config, "request": generation_config}
+    return cached_generate(
+        model_name, config, key_parts, lambda: _generate_text(model, content, generation_config)
+    )
+
+
+def _model_json(model, content, key_parts, schema: dict, source_label: str) -> str:
+    """
+    Response text of a call constrained to `schema`. A failed call comes back
+    in-band as "API_ERROR: ...", as run_ai_analysis reported it.
+    """
+    try:
+        return _cached_model_text(model, content, key_parts, json_config(schema))
+    except Exception as e:
+        return f"API_ERROR: {source_label}: {type(e).__name__}: {e}"
+
 
 #inference : reviews  text andgenrates o/p
 def run_text_review(text: str) -> dict:
@@ -44,75 +112,126 @@ def run_text_review(text: str) -> dict:
         input_doc_text=cleaned_text,
         compliance_doc_name=compliance_doc_name
     )
-    full_prompt = base_review_prompt_template + "\n\n" + formatted_instruction
+    full_prompt = base_review_prompt() + "\n\n" + formatted_instruction
     content = [Part.from_text(full_prompt)]
 
     #logger.info(f"Text Review - Request to Gemini: {full_prompt}...")
-    response = review_model.generate_content(content)
-
-    parts = response.candidates[0].content.parts
-    response_text = "".join(p.text for p in parts).strip()
+    response_text = _cached_model_text(review_model, content, [full_prompt], json_config(REVIEW_SCHEMA))
     #logger.info(f"Text Review - Response from Gemini: {response_text}...")
 
-    return parse_response_to_json(response_text, "Text Review")
+    return parse_review(response_text, "Text Review")
 
 #inference : take pdf files and generate review based on that 
-def run_multimodal_review(pdf_bytes: bytes) -> dict:
-    prompt_part = Part.from_text(base_review_prompt_template + "\n\n" + multimodal_input_instruction)
-    pdf_part = Part.from_data(mime_type="application/pdf", data=pdf_bytes)
-    content = [pdf_part, prompt_part]
+def run_multimodal_review(pdf) -> dict:
+    """`pdf`: PDF bytes or a DocumentHandle (sent by GCS URI when it has one)."""
+    document = open_document(pdf)
+    prompt_text = base_review_prompt() + "\n\n" + multimodal_input_instruction
+    prompt_part = Part.from_text(prompt_text)
+    content = [document.vertex_part(), prompt_part]
 
     #logger.info(f"Multimodal Review - Request to Gemini (text part): {getattr(prompt_part, 'text', 'N/A')}...")
     #logger.info(f"Multimodal Review - Request to Gemini (PDF bytes length): {len(getattr(pdf_part, 'data', b''))}")
-    response = review_model.generate_content(content)
+    response_text = _cached_model_text(review_model, content, [document.data, prompt_text], json_config(REVIEW_SCHEMA))
     #logger.info("Received response from review_model for multimodal review.")
-    parts = response.candidates[0].content.parts
-    response_text = "".join(p.text for p in parts).strip()
     #logger.info(f"Multimodal Review - Response from Gemini: {response_text}...")
 
-    result = parse_response_to_json(response_text, "Multimodal Review")
+    result = parse_review(response_text, "Multimodal Review")
     result["document_name"] = result.get("document_name", "").replace(
         "<placeholder>", "Multimodal Review"
     )
     return result
 
+def run_multimodal_review_batched(pdf) -> dict:
+    """
+    run_multimodal_review for long PDFs: overlapping page ranges are reviewed
+    in parallel and merged into one report with absolute page numbers. PDFs
+    up to MULTIMODAL_BATCH_MIN_PAGES pages are reviewed whole.
+    """
+    result = review_batched(run_multimodal_review, open_document(pdf))
+    failed = (result.get("batches") or {}).get("failed")
+    if failed:
+        logger.error(f"Multimodal review batches failed for pages {failed}: {result['batches']['errors']}")
+    return result
+
 # takes the review of both 
-def run_synthesis_review(text_res: dict, multi_res: dict, pdf_bytes: bytes) -> dict:
-    report1 = json.dumps(text_res, indent=2)
-    report2 = json.dumps(multi_res, indent=2)
+def run_synthesis_review(text_res: dict, multi_res: dict, pdf) -> dict:
+    doc_name = text_res.get("document_name", "Document")
+    # Duplicates are resolved locally (report_merge.py); only ambiguous clusters reach the model
+    merged = merge_reports(text_res, multi_res)
+    logger.info(f"Synthesis merge: {merged['stats']}")
+    if not needs_model(merged):
+        return synthesized_report(merged, doc_name)
 
     prompt_text = str(synthesis_prompt_template).format(
-        doc_name=text_res.get("document_name", "Document"),
-        report1_json_string=report1,
-        report2_json_string=report2,
+        doc_name=doc_name,
+        report1_json_string=json.dumps({"sections": merged["ambiguous"]["text"]}, ensure_ascii=False),
+        report2_json_string=json.dumps({"sections": merged["ambiguous"]["multimodal"]}, ensure_ascii=False),
         false_positives_guardrails=false_positives_guardrails
     )
+    document = open_document(pdf)
     prompt_part = Part.from_text(prompt_text)
-    pdf_part = Part.from_data(mime_type="application/pdf", data=pdf_bytes)
-    content = [pdf_part, prompt_part]
+    content = [document.vertex_part(), prompt_part]
 
     #logger.info(f"Synthesis Review - Request to Gemini (text part): {getattr(prompt_part, 'text', 'N/A')}...")
     #logger.info(f"Synthesis Review - Request to Gemini (PDF bytes length): {len(getattr(pdf_part, 'data', b''))}")
-    response = synthesis_model.generate_content(content)
+    response_text = _cached_model_text(
+        synthesis_model, content, [document.data, prompt_text], json_config(SYNTHESIS_SCHEMA)
+    )
     #logger.info("Received response from synthesis_model for synthesis review.")
-
-    parts = response.candidates[0].content.parts
-    response_text = "".join(p.text for p in parts).strip()
     #logger.info(f"Synthesis Review - Response from Gemini: {response_text}...")
 
-    return parse_response_to_json(response_text, "Synthesis Review")
+    result = parse_review(response_text, "Synthesis Review", SYNTHESIS_SCHEMA)
+    return synthesized_report(merged, doc_name, None if "raw_response" in result else result.get("sections", []))
+
+def _typo_from_pages(pages: List[Dict[str, Any]]) -> dict:
+    """Missing-% detection on the docling text; only the ambiguous snippets go to the model, as text."""
+    detection = detect_missing_percent(pages, data_text("new_examples_text"))
+    logger.info(f"Local missing-% detection: {detection['stats']}")
+    typo_res = {"missing_percent_details": detection["details"], "local_detection": detection["stats"]}
+    if not detection["ambiguous"]:
+        return typo_res
+
+    typo_date_prompt_sys = typo_prompt_sys()
+    snippets = snippets_text(detection["ambiguous"])
+    parts = [Part.from_text(typo_date_prompt_sys), Part.from_text(typo_date_prompt_user), Part.from_text(snippets)]
+    raw_response = _model_json(
+        typo_model,
+        parts,
+        [typo_date_prompt_sys, typo_date_prompt_user, snippets],
+        TYPO_SCHEMA,
+        "Typo/Date Analysis",
+    )
+    if raw_response.startswith(_AI_ERROR_PREFIXES):
+        # The local findings stand on their own; report the model failure alongside them
+        logger.error(f"Typo analysis of ambiguous snippets failed or blocked: {raw_response}")
+        typo_res["error"] = f"Typo analysis failed: {raw_response}"
+        return typo_res
+    model_res = parse_typo(raw_response)
+    typo_res["missing_percent_details"] += model_res.get("missing_percent_details", [])
+    if "error" in model_res:
+        typo_res["error"] = model_res["error"]
+    return typo_res
 
 #inference : checks for typo in the pdf
-def run_typo_analysis(pdf_bytes: bytes) -> dict:
+def run_typo_analysis(pdf, pages: List[Dict[str, Any]] = None) -> dict:
     """
     Performs typo and date format analysis on the document using Vertex AI.
 
+    With the docling page map (`pages`) the missing '%' signs are found locally
+    and only ambiguous snippets reach the model; page numbers are those of
+    `pages`. Without it the whole PDF is sent.
+
     Returns a dict with details of missing '%' signs and incorrect date formats.
     """
+    if pages is not None:
+        return _typo_from_pages(pages)
+
     #logger.info("Preparing prompt for typo analysis...")
 
     # Prepare multimodal input
-    pdf_part = Part.from_data(mime_type="application/pdf", data=pdf_bytes)
+    document = open_document(pdf)
+    pdf_part = document.vertex_part()
+    typo_date_prompt_sys = typo_prompt_sys()
     sys_part = Part.from_text(typo_date_prompt_sys)
     user_part = Part.from_text(typo_date_prompt_user)
 
@@ -122,32 +241,27 @@ def run_typo_analysis(pdf_bytes: bytes) -> dict:
     #logger.info(f"Typo Analysis - Request to Gemini (system prompt): {getattr(sys_part, 'text', 'N/A')}...")
     #logger.info(f"Typo Analysis - Request to Gemini (user prompt): {getattr(user_part, 'text', 'N/A')}...")
     #logger.info(f"Typo Analysis - Request to Gemini (PDF bytes length): {len(getattr(pdf_part, 'data', b''))}")
-    raw_response = run_ai_analysis(typo_model, prompt_parts, source_label="Typo/Date Analysis")
+    raw_response = _model_json(
+        typo_model,
+        prompt_parts,
+        [document.data, typo_date_prompt_sys, typo_date_prompt_user],
+        TYPO_SCHEMA,
+        "Typo/Date Analysis",
+    )
 
-    if raw_response.startswith(("BLOCKED:", "NO_CONTENT_OR_SAFETY_INFO", "API_ERROR:")):
+    if raw_response.startswith(_AI_ERROR_PREFIXES):
         logger.error(f"Typo analysis failed or blocked: {raw_response}")
         return {
             "missing_percent_details": [],
             "error": f"Typo analysis failed: {raw_response}"
         }
 
-    typo_res = parse_response_to_json(raw_response, source_label="Typo/Date Analysis")
+    typo_res = parse_typo(raw_response)
     #logger.info(f"Typo Analysis - Parsed response (typo_res): {json.dumps(typo_res, indent=2)}")
     return typo_res
 
-#inference : runs the disclosure analysis when the excel is given and pdf is given 
-def run_disclosure_analysis(excel_path: str, pdf_bytes: bytes) -> list:
-    """
-    Extract disclosures from PDF using AI and compare with standard disclosures from Excel.
-    Returns a list of matched results.
-    """
-    #logger.info("Running disclosure analysis...")
-
-    # 1. Load standard disclosures
-    df = pd.read_excel(excel_path, engine="openpyxl")
-    std_disclosures = df["Unnamed: 4"].dropna().astype(str).tolist()
-
-    # 2. AI Extraction
+def _extract_disclosures(pdf) -> list:
+    """Ask the disclosure model for every disclosure text in the PDF with its pages; None on an API error."""
     system_prompt = (
         "You are an expert compliance checker. Extract all disclosure texts from the provided PDF document "
         "and return in JSON format, mapping each disclosure to the pages they appear on."
@@ -156,36 +270,59 @@ def run_disclosure_analysis(excel_path: str, pdf_bytes: bytes) -> list:
         "Return JSON like: {\"disclosures\": [{\"text\": \"disclosure A\", \"pages\": \"1,2\"}, ...]}"
     )
     
-    pdf_part = Part.from_data(mime_type="application/pdf", data=pdf_bytes)
-    parts = [pdf_part, Part.from_text(system_prompt), Part.from_text(user_prompt)]
+    document = open_document(pdf)
+    parts = [document.vertex_part(), Part.from_text(system_prompt), Part.from_text(user_prompt)]
 
     #logger.info(f"Disclosure Analysis - Request to Gemini (system prompt): {system_prompt}...")
     #logger.info(f"Disclosure Analysis - Request to Gemini (user prompt): {user_prompt}...")
     #logger.info(f"Disclosure Analysis - Request to Gemini (PDF bytes length): {len(getattr(pdf_part, 'data', b''))}")
-    raw_response = run_ai_analysis(disclosure_model, parts, source_label="Disclosure Analysis")
+    raw_response = _model_json(
+        disclosure_model,
+        parts,
+        [document.data, system_prompt, user_prompt],
+        DISCLOSURE_SCHEMA,
+        "Disclosure Analysis",
+    )
+    #logger.info(f"Disclosure Analysis - Raw response from Gemini: {raw_response}...")
+    if raw_response.startswith(_AI_ERROR_PREFIXES):
+        logger.error(f"Disclosure extraction failed or blocked: {raw_response}")
+        return None
 
-    try:
-        cleaned = re.sub(r"^```json\s*|\s*```$", "", raw_response, flags=re.DOTALL)
-        ai_disclosures = json.loads(cleaned).get("disclosures", [])
-    except Exception as e:
-        #logger.error(f"Disclosure response parsing failed: {e}")
-        ai_disclosures = []
+    return parse_disclosures(raw_response)
 
-    #logger.info(f"Disclosure Analysis - Raw response from Gemini: {raw_response}...")
-    # 3. Match against standard disclosures
+#inference : runs the disclosure analysis when the excel is given and pdf is given 
+def run_disclosure_analysis(excel_path: str, pdf, pages: List[Dict[str, Any]] = None) -> list:
+    """
+    Extract disclosures from PDF using AI and compare with standard disclosures from Excel.
+    When the docling page map is given, disclosures found in the text are settled
+    locally and the model is only called for the rest.
+    Returns a list of matched results, or None when the AI extraction failed
+    (nothing can then be reported as missing).
+    """
+    #logger.info("Running disclosure analysis...")
+
+    # 1. Load standard disclosures (precompiled artifact, rebuilt only when the Excel changes)
+    std_disclosures = load_library(excel_path).texts("excel")
+
+    # 2. Local detection over the docling text
+    settled, unsettled = {}, std_disclosures
+    if pages:
+        settled, unsettled = detect_disclosures(std_disclosures, pages)
+
+    # 3. AI Extraction, only for what could not be settled locally
+    ai_disclosures = []
+    if unsettled:
+        ai_disclosures = _extract_disclosures(pdf)
+        if ai_disclosures is None:
+            return None
+    matches = dict(settled)
+    matches.update(zip(unsettled, match_disclosures(unsettled, ai_disclosures)))
+
+    # 4. Match against standard disclosures
     results = []
     for std in std_disclosures:
-        best = {"score": 0, "text": "", "pages": "N/A"}
-        for ai in ai_disclosures:
-            score = SequenceMatcher(None, std, ai.get("text", "")).ratio() * 100
-            if score > best["score"]:
-                best = {"score": score, "text": ai.get("text", ""), "pages": ai.get("pages", "N/A")}
-        
-        status = (
-            "Present" if best["score"] == 100 else
-            "Partially Present" if best["score"] >= 80 else
-            "Not Present"
-        )
+        best = matches[std]
+        status = disclosure_status(best["score"])
         results.append({
             "id": str(uuid.uuid4()), # Add a unique ID
             "expected_disclosure": std,
@@ -243,8 +380,7 @@ def run_pdf_schema_extraction(pdf_bytes: bytes, extraction_schema: dict) -> List
     logger.info(f"PDF Schema Extraction - Request to Gemini (PDF bytes length): {len(pdf_bytes)}")
 
     try:
-        response = review_model.generate_content(content)
-        response_text = "".join(p.text for p in response.candidates[0].content.parts).strip()
+        response_text = _cached_model_text(review_model, content, [pdf_bytes, prompt_text])
         logger.info(f"PDF Schema Extraction - Raw Gemini API response: '{response_text}'")
 
         # Attempt to parse the response as a JSON array of SelectionRegion objects
@@ -272,13 +408,168 @@ def run_pdf_schema_extraction(pdf_bytes: bytes, extraction_schema: dict) -> List
         logger.error(f"Error during PDF schema extraction with Gemini API: {e}", exc_info=True)
         return []
 
+# Most changes sent to the model for summarizing; the full local diff is always returned.
+COMPARISON_MAX_CHANGES = 200
+
+# Bump when the comparison output changes in a way the prompts do not show
+# (diff rules, result shape); stored comparisons from other versions are ignored.
+COMPARISON_PROMPT_VERSION = "1"
+
+
+def _comparison_prompt_version() -> str:
+    """COMPARISON_PROMPT_VERSION plus a digest of the prompts and model, so editing either invalidates."""
+    identity = repr(_model_identity(review_model)) + document_comparison_prompt + document_change_summary_prompt
+    return f"{COMPARISON_PROMPT_VERSION}:{hashlib.sha256(identity.encode('utf-8')).hexdigest()[:12]}"
+
+
+def _version_fingerprint(doc: dict) -> str:
+    """Content hash of a version; versions without page maps fall back to their stored PDF."""
+    if doc.get("pages") is not None:
+        return "pages:" + content_hash(doc["pages"])
+    return "pdf:" + doc["gcp_path"]
+
+
+def _comparison_pair_key(fingerprint_1: str, fingerprint_2: str) -> str:
+    """Same key whichever version is passed first."""
+    return hashlib.sha256("\n".join(sorted((fingerprint_1, fingerprint_2))).encode("utf-8")).hexdigest()
+
+
+def _reverse_comparison(result: dict) -> dict:
+    """A stored comparison of (B, A) read as (A, B): swap sides and added/removed."""
+    flipped = {"added": "removed", "removed": "added"}
+    differences = []
+    for difference in result.get("differences", []):
+        difference = dict(difference, document_a=difference.get("document_b", ""), document_b=difference.get("document_a", ""))
+        if difference.get("change") in flipped:
+            difference["change"] = flipped[difference["change"]]
+            if difference.get("type", "").lower() in flipped:
+                difference["type"] = flipped[difference["type"].lower()].capitalize()
+        if "words" in difference:
+            difference["words"] = [
+                {"op": {"insert": "delete", "delete": "insert"}.get(w["op"], w["op"]), "a": w["b"], "b": w["a"]}
+                for w in difference["words"]
+            ]
+        differences.append(difference)
+    stats = dict(result.get("diff_stats") or {})
+    if stats:
+        stats["pages_a"], stats["pages_b"] = stats.get("pages_b"), stats.get("pages_a")
+        added, removed = stats.pop("added", 0), stats.pop("removed", 0)
+        stats.update({k: v for k, v in (("added", removed), ("removed", added)) if v})
+    return dict(result, differences=differences, **({"diff_stats": stats} if stats else {}))
+
+
+def _stats_summary(stats: dict) -> str:
+    kinds = ", ".join(f"{stats[k]} {k}" for k in ("modified", "added", "removed", "moved") if stats.get(k))
+    return f"{stats['changes']} change(s) between the two versions: {kinds}."
+
+
+def _local_comparison_result(diff: dict, summary: str, classifications: list) -> dict:
+    """The local diff in the comparison result shape, labelled with the model's classifications."""
+    labels = {c["index"]: c for c in classifications}
+    differences = []
+    for index, change in enumerate(diff["changes"]):
+        label = labels.get(index, {})
+        difference = {
+            "type": label.get("type") or change["type"].capitalize(),
+            "change": change["type"],
+            "level": change["level"],
+            "location": change["location"],
+            "description": label.get("description") or change["description"],
+            "document_a": change["document_a"],
+            "document_b": change["document_b"],
+        }
+        if "words" in change:
+            difference["words"] = change["words"]
+        differences.append(difference)
+    return {
+        "comparison_summary": summary,
+        "differences": differences,
+        "identical": diff["identical"],
+        "diff_stats": diff["stats"],
+    }
+
+
+async def _summarize_changes(diff: dict) -> tuple:
+    """Ask the model to summarize and classify the changed regions only (no PDFs are sent)."""
+    payload = [
+        {
+            "index": index,
+            "type": change["type"],
+            "location": change["location"],
+            "document_a": change["document_a"],
+            "document_b": change["document_b"],
+        }
+        for index, change in enumerate(diff["changes"][:COMPARISON_MAX_CHANGES])
+    ]
+    prompt_text = document_change_summary_prompt.format(changes_json=json.dumps(payload, indent=1))
+    content = [Part.from_text(prompt_text)]
+    try:
+        model_name = _model_identity(review_model)[0]
+        response = await track_call_async(model_name, content, lambda: governed_call_async(
+            model_name,
+            lambda: review_model.generate_content_async(content, generation_config=json_config(CHANGE_SUMMARY_SCHEMA)),
+        ))
+        response_text = "".join(p.text for p in response.candidates[0].content.parts).strip()
+        summary = parse_change_summary(response_text)
+    except Exception as e:
+        # The diff itself is exact; without the model we still return it, unlabelled.
+        logger.warning(f"Change summary failed, returning the unlabelled local diff: {e}")
+        return _stats_summary(diff["stats"]), [], False
+    return summary["comparison_summary"] or _stats_summary(diff["stats"]), summary["classifications"], True
+
+
+async def _model_comparison(gcp_path_1: str, gcp_path_2: str) -> dict:
+    """Full comparison by the model over both PDFs (versions without stored page maps)."""
+    prompt_part = Part.from_text(document_comparison_prompt)
+    doc1_part = Part.from_uri(mime_type="application/pdf", uri=gcp_path_1)
+    doc2_part = Part.from_uri(mime_type="application/pdf", uri=gcp_path_2)
+
+    content = [prompt_part, doc1_part, doc2_part]
+
+    try:
+        model_name = _model_identity(review_model)[0]
+        response = await track_call_async(model_name, content, lambda: governed_call_async(
+            model_name,
+            lambda: review_model.generate_content_async(content, generation_config=json_config(COMPARISON_SCHEMA)),
+        ))
+        response_text = "".join(p.text for p in response.candidates[0].content.parts).strip()
+        
+        logger.info(f"Raw Gemini API response before JSON parsing: '{response_text}'") # Added log
+        try:
+            comparison_json = parse_comparison(response_text)
+        except ValueError as e:
+            logger.error(f"Failed to parse Gemini API response as JSON for schema extraction: {e}", exc_info=True)
+            raise RuntimeError(f"Failed to parse AI comparison result: {e}")
+    except Exception as e:
+        logger.error(f"Error during document comparison with Gemini API: {e}", exc_info=True)
+        raise RuntimeError(f"Failed to compare documents with AI: {e}")
+
+    # Extract the 'example' field if it exists, otherwise return the whole JSON
+    if "example" in comparison_json:
+        return comparison_json["example"]
+    return comparison_json
+
+
 # inference : this we need to skip 
 async def run_document_comparison(version_id_1: str, version_id_2: str, db: Database) -> dict:
+    """
+    Compare two versions. When both have stored page maps the differences come
+    from the local diff (document_diff.py) and the model only summarizes and
+    classifies the changed regions; identical versions need no model call.
+    Older versions without page maps fall back to a full model comparison.
+
+    Results are memoized in document_comparisons by an order-independent hash
+    of the two versions' content and the comparison prompt version; a hit is
+    returned as stored, without a model call or a new record.
+    """
     logger.info(f"Starting document comparison for versions: {version_id_1} and {version_id_2}")
-    document_versions_collection = db.get_collection("document_versions")
+    store = AsyncMongoStore(db)
+    await store.ensure_indexes()
 
-    doc1 = await run_in_threadpool(document_versions_collection.find_one, {"_id": ObjectId(version_id_1)})
-    doc2 = await run_in_threadpool(document_versions_collection.find_one, {"_id": ObjectId(version_id_2)})
+    # Both versions in one round trip.
+    versions = await store.fetch_versions([version_id_1, version_id_2])
+    doc1 = versions.get(str(ObjectId(version_id_1)))
+    doc2 = versions.get(str(ObjectId(version_id_2)))
 
     if not doc1:
         logger.error(f"Document version 1 with ID {version_id_1} not found for comparison.")
@@ -294,56 +585,56 @@ async def run_document_comparison(version_id_1: str, version_id_2: str, db: Data
         logger.error("GCP path not found for one or both documents during comparison.")
         raise ValueError("GCP path not found for one or both documents.")
 
-    # Prepare parts for Gemini API
-    prompt_part = Part.from_text(document_comparison_prompt)
-    doc1_part = Part.from_uri(mime_type="application/pdf", uri=gcp_path_1)
-    doc2_part = Part.from_uri(mime_type="application/pdf", uri=gcp_path_2)
-
-    content = [prompt_part, doc1_part, doc2_part]
-
-    logger.info(f"Sending document comparison request to Gemini API for {version_id_1} and {version_id_2}.")
-    try:
-        response = await review_model.generate_content_async(content)
-        response_text = "".join(p.text for p in response.candidates[0].content.parts).strip()
-        # Remove markdown code block fences if present
-        if response_text.startswith("```json") and response_text.endswith("```"):
-            response_text = response_text[len("```json\n"):-len("\n```")].strip()
-        
-        logger.info(f"Raw Gemini API response before JSON parsing: '{response_text}'") # Added log
-        try:
-            comparison_json = json.loads(response_text)
-            # Extract the 'example' field if it exists, otherwise return the whole JSON
-            if "example" in comparison_json:
-                result_data = comparison_json["example"]
-            else:
-                result_data = comparison_json
-            
-            logger.info(f"Received Gemini API response for comparison (extracted result): {result_data}")
-
-            # Store the comparison result in the database
-            comparison_entry = ComparisonResultsModel(
-                version1_id=ObjectId(version_id_1),
-                version2_id=ObjectId(version_id_2),
-                gcs_link_version1=gcp_path_1, # Pass GCS links
-                gcs_link_version2=gcp_path_2, # Pass GCS links
-                compared_at=datetime.utcnow(),
-                gemini_comparison_result=result_data
-            )
-            
-            comparison_collection = db.get_collection("document_comparisons")
-            insert_result = await run_in_threadpool(comparison_collection.insert_one, comparison_entry.model_dump(by_alias=True, exclude_none=True))
-            inserted_id = str(insert_result.inserted_id)
-            logger.info(f"Stored comparison result in 'document_comparisons' collection for {version_id_1} and {version_id_2}. Inserted ID: {inserted_id}")
+    fingerprint_1, fingerprint_2 = _version_fingerprint(doc1), _version_fingerprint(doc2)
+    pair_key = _comparison_pair_key(fingerprint_1, fingerprint_2)
+    prompt_version = _comparison_prompt_version()
+    cached = await store.find_comparison(pair_key, prompt_version)
+    if cached and cached.get("gemini_comparison_result") is not None:
+        result_data = cached["gemini_comparison_result"]
+        if cached.get("fingerprint_1") != fingerprint_1:
+            result_data = _reverse_comparison(result_data)
+        logger.info(f"Reusing comparison {cached['_id']} for {version_id_1} and {version_id_2}")
+        return {"comparison_id": str(cached["_id"]), "result": result_data, "cached": True}
+
+    complete = True
+    pages_1, pages_2 = doc1.get("pages"), doc2.get("pages")
+    if pages_1 is not None and pages_2 is not None:
+        diff = diff_versions(pages_1, pages_2)
+        logger.info(f"Local diff for {version_id_1} vs {version_id_2}: {diff['stats']}")
+        if diff["identical"]:
+            result_data = _local_comparison_result(diff, "The two versions are identical.", [])
+        else:
+            summary, classifications, complete = await _summarize_changes(diff)
+            result_data = _local_comparison_result(diff, summary, classifications)
+    else:
+        logger.info(f"Sending document comparison request to Gemini API for {version_id_1} and {version_id_2}.")
+        result_data = await _model_comparison(gcp_path_1, gcp_path_2)
+
+    logger.info(f"Comparison result for {version_id_1} and {version_id_2}: {result_data}")
+
+    # Store the comparison result in the database
+    comparison_entry = ComparisonResultsModel(
+        version1_id=ObjectId(version_id_1),
+        version2_id=ObjectId(version_id_2),
+        gcs_link_version1=gcp_path_1, # Pass GCS links
+        gcs_link_version2=gcp_path_2, # Pass GCS links
+        compared_at=datetime.utcnow(),
+        gemini_comparison_result=result_data
+    )
+    
+    entry = comparison_entry.model_dump(by_alias=True, exclude_none=True)
+    if complete:
+        # An unlabelled fallback diff is stored but never reused
+        entry.update(pair_key=pair_key, prompt_version=prompt_version, fingerprint_1=fingerprint_1)
+    inserted_id = await store.save_comparison(
+        entry,
+        result_data.get("differences"),
+        version_id_2,
+    )
+    logger.info(f"Stored comparison result in 'document_comparisons' collection for {version_id_1} and {version_id_2}. Inserted ID: {inserted_id}")
 
-            # Return the inserted ID along with the result data
-            
-            return {"comparison_id": inserted_id, "result": result_data}
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse Gemini API response as JSON for schema extraction: {e}", exc_info=True)
-            raise RuntimeError(f"Failed to parse AI comparison result: {e}")
-    except Exception as e:
-        logger.error(f"Error during document comparison with Gemini API: {e}", exc_info=True)
-        raise RuntimeError(f"Failed to compare documents with AI: {e}")
+    # Return the inserted ID along with the result data
+    return {"comparison_id": inserted_id, "result": result_data, "cached": False}
 
 #inference : ?? 
 async def run_tell_me_why_summary(compliance_section: Dict[str, Any], gcp_path: str) -> str:
@@ -361,8 +652,11 @@ async def run_tell_me_why_summary(compliance_section: Dict[str, Any], gcp_path:
     prompt_part = Part.from_text(prompt_text)
     content = [pdf_part, prompt_part]
 
-     try:
-        response = await review_model.generate_content_async(content)
+    try:
+        model_name = _model_identity(review_model)[0]
+        response = await track_call_async(model_name, content, lambda: governed_call_async(
+            model_name, lambda: review_model.generate_content_async(content)
+        ))
         response_text = "".join(p.text for p in response.candidates[0].content.parts).strip()
         return response_text
     except Exception as e:
@@ -0,0 +1,144 @@
+"""
+Content-addressed cache for docling conversions.
+
+Entries are keyed by the SHA-256 of the PDF bytes plus the converter options
+(and docling version), and hold the full markdown and a per-page markdown map.
+The cache directory is bounded in size; the least recently used entries are
+evicted first (a hit refreshes the entry's mtime). The entry just stored is
+never evicted, and a conversion larger than the whole bound is not cached.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from importlib import metadata
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv("DOCLING_CACHE_DIR", os.path.join(".cache", "docling"))
+CACHE_MAX_BYTES = int(os.getenv("DOCLING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Everything that changes the converted output must be part of the key.
+CONVERTER_OPTIONS = {"export": "markdown", "strict_text": True}
+
+_converter = None
+
+
+def _get_converter():
+    global _converter
+    if _converter is None:
+        from docling.document_converter import DocumentConverter
+        _converter = DocumentConverter()
+    return _converter
+
+
+def _docling_version() -> str:
+    try:
+        return metadata.version("docling")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def cache_key(pdf_bytes: bytes, options: dict = None) -> str:
+    options = CONVERTER_OPTIONS if options is None else options
+    digest = hashlib.sha256(pdf_bytes).hexdigest()
+    opts = json.dumps({"options": options, "docling": _docling_version()}, sort_keys=True)
+    return digest + "-" + hashlib.sha256(opts.encode("utf-8")).hexdigest()[:16]
+
+
+def _entry_path(key: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, key + ".json")
+
+
+def _load(key: str, cache_dir: str):
+    path = _entry_path(key, cache_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    os.utime(path, None)  # LRU: a hit makes the entry the most recent
+    return entry
+
+
+def _store(key: str, entry: dict, cache_dir: str, max_bytes: int):
+    data = json.dumps(entry).encode("utf-8")
+    if len(data) > max_bytes:
+        logger.warning(
+            "Not caching docling conversion %s: %d bytes exceeds the %d byte cache bound", key, len(data), max_bytes
+        )
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _entry_path(key, cache_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    _evict(cache_dir, max_bytes, keep=os.path.basename(path))
+
+
+def _evict(cache_dir: str, max_bytes: int, keep: str = None):
+    """Remove the least recently used entries until the directory fits max_bytes, never `keep`."""
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json") or name == keep:
+            continue
+        try:
+            st = os.stat(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    if keep is not None:
+        try:
+            total += os.stat(os.path.join(cache_dir, keep)).st_size
+        except FileNotFoundError:
+            pass
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _convert(local_pdf: str, converter) -> dict:
+    result = converter.convert(local_pdf)
+    document = result.document
+    markdown = document.export_to_markdown(strict_text=True)
+    pages = [
+        {"page_no": page_no, "text": document.export_to_markdown(strict_text=True, page_no=page_no)}
+        for page_no in sorted(document.pages)
+    ]
+    return {"markdown": markdown, "pages": pages}
+
+
+def convert_pdf(local_pdf: str, converter=None, cache_dir: str = None,
+                max_bytes: int = None, options: dict = None) -> dict:
+    """
+    Convert a PDF with docling, reusing a cached conversion when the same
+    bytes were converted before with the same options.
+
+    Returns {"sha256", "markdown", "pages": [{"page_no", "text"}], "cached", "seconds"}.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    start = time.perf_counter()
+
+    with open(local_pdf, "rb") as f:
+        pdf_bytes = f.read()
+    key = cache_key(pdf_bytes, options)
+
+    entry = _load(key, cache_dir)
+    cached = entry is not None
+    if not cached:
+        entry = _convert(local_pdf, converter or _get_converter())
+        entry["sha256"] = key.split("-", 1)[0]
+        _store(key, entry, cache_dir, max_bytes)
+
+    entry["cached"] = cached
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+    return entry
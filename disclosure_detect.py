@@ -0,0 +1,165 @@
+"""
+Local-first disclosure detection.
+
+For text-native factsheets the library disclosures can be found directly in
+the docling text, page by page, without asking Gemini to extract them:
+
+1. exact pass: one Aho-Corasick automaton over all normalized library texts
+   finds every verbatim occurrence (modulo case, punctuation and whitespace);
+2. fuzzy pass: for the rest, a sliding window of the disclosure's length is
+   moved over each page's words; windows are pre-filtered by bag-of-words
+   overlap and the best ones are scored with SequenceMatcher on word lists.
+
+A disclosure is settled locally when it is found exactly (Present) or with a
+fuzzy score at or above the Partially Present threshold. Everything else is
+returned as unsettled so only those need the model.
+"""
+import re
+from collections import Counter, deque
+from difflib import SequenceMatcher
+
+if __package__:
+    from .disclosure_match import PARTIAL_SCORE, PRESENT_SCORE
+else:  # imported as a top-level module by the stage scripts
+    from disclosure_match import PARTIAL_SCORE, PRESENT_SCORE
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_words(text: str) -> list:
+    return _WORD_RE.findall(text.lower())
+
+
+class AhoCorasick:
+    """Multi-pattern exact matcher over word sequences."""
+
+    def __init__(self, patterns: list):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for index, words in enumerate(patterns):
+            if not words:
+                continue
+            state = 0
+            for word in words:
+                nxt = self.goto[state].get(word)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][word] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nxt
+            self.output[state].append(index)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and word not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(word, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def find(self, words: list) -> set:
+        """Indexes of all patterns occurring in `words`."""
+        found, state = set(), 0
+        for word in words:
+            while state and word not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(word, 0)
+            found.update(self.output[state])
+        return found
+
+
+def _best_window(pattern: list, words: list) -> tuple:
+    """Best (score, start, end) of a pattern-length window over `words`."""
+    n = len(pattern)
+    if n == 0 or not words:
+        return 0.0, 0, 0
+    target = Counter(pattern)
+    step = max(1, n // 5)
+
+    # Bag-of-words overlap bounds the word-level ratio of a same-length
+    # window; it is maintained incrementally as the window slides by one word.
+    window = Counter(words[:n])
+    overlap = sum((window & target).values())
+    scored = []
+    for start in range(0, max(1, len(words) - n + 1)):
+        if start:
+            out_word, in_word = words[start - 1], words[start + n - 1]
+            if window[out_word] <= target[out_word]:
+                overlap -= 1
+            window[out_word] -= 1
+            window[in_word] += 1
+            if window[in_word] <= target[in_word]:
+                overlap += 1
+        bound = 200.0 * overlap / (n + min(n, len(words)))
+        if bound >= PARTIAL_SCORE:
+            scored.append((bound, start))
+    if not scored:
+        return 0.0, 0, 0
+
+    best = (0.0, 0, 0)
+    matcher = SequenceMatcher(None, autojunk=False)
+    matcher.set_seq2(pattern)
+    for _, coarse in sorted(scored, reverse=True)[:3]:
+        for start in range(max(0, coarse - step), min(len(words), coarse + step) + 1):
+            for length in {n, max(1, n - step), n + step}:
+                matcher.set_seq1(words[start:start + length])
+                score = matcher.ratio() * 100
+                if score > best[0]:
+                    best = (score, start, start + length)
+    return best
+
+
+def detect_disclosures(std_disclosures: list, pages: list) -> tuple:
+    """
+    Look for each library disclosure in the docling page map.
+
+    Returns (settled, unsettled): `settled` maps a library text to
+    {"score", "text", "pages"} in the same shape as disclosure_match results;
+    `unsettled` lists the library texts that still need the model.
+    """
+    page_words = []
+    for page in pages:
+        matches = list(_WORD_RE.finditer(page["text"].lower()))
+        page_words.append((page["page_no"], [m.group() for m in matches], matches, page["text"]))
+    patterns = [normalize_words(std) for std in std_disclosures]
+    automaton = AhoCorasick(patterns)
+
+    exact_pages = {}
+    for page_no, words, _, _ in page_words:
+        for index in automaton.find(words):
+            exact_pages.setdefault(index, []).append(page_no)
+
+    settled, unsettled = {}, []
+    for index, std in enumerate(std_disclosures):
+        if not patterns[index]:
+            unsettled.append(std)
+            continue
+        if index in exact_pages:
+            settled[std] = {
+                "score": float(PRESENT_SCORE),
+                "text": std,
+                "pages": ",".join(str(p) for p in exact_pages[index]),
+            }
+            continue
+
+        best, best_pages = None, []
+        for page_no, words, matches, text in page_words:
+            score, start, end = _best_window(patterns[index], words)
+            if score < PARTIAL_SCORE:
+                continue
+            best_pages.append(page_no)
+            if best is None or score > best["score"]:
+                end = min(end, len(matches))
+                best = {"score": score, "text": text[matches[start].start():matches[end - 1].end()]}
+        if best is None:
+            unsettled.append(std)
+        else:
+            best["pages"] = ",".join(str(p) for p in best_pages)
+            settled[std] = best
+    return settled, unsettled
@@ -0,0 +1,170 @@
+"""
+Precompiled disclosure library.
+
+The standard disclosures live in two sources: column "Unnamed: 4" of
+data/Disclosure Library_TEMPLATE_DRAFT.xlsx (used for disclosure matching) and
+the "Disclosure text" column of data/Disclosure_Library_3.csv. `build_library`
+compiles the requested sources into one manifest.json under
+.cache/disclosure_library holding the source fingerprints (path, mtime_ns,
+size, sha256) and the disclosure texts, so workers never parse the workbook
+with pandas again.
+
+`load_library` rebuilds only when a source's mtime/size changed and its sha256
+no longer matches the manifest; a source that was touched but not changed has
+its new mtime written back, so the next process does not re-hash it. A source
+path that does not exist raises FileNotFoundError.
+"""
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_EXCEL_PATH = os.path.join(BASE_DIR, "data", "Disclosure Library_TEMPLATE_DRAFT.xlsx")
+DEFAULT_CSV_PATH = os.path.join(BASE_DIR, "data", "Disclosure_Library_3.csv")
+ARTIFACT_DIR = os.getenv("DISCLOSURE_LIBRARY_DIR", os.path.join(".cache", "disclosure_library"))
+
+EXCEL_COLUMN = "Unnamed: 4"
+CSV_COLUMN = "Disclosure text"
+ARTIFACT_VERSION = 2
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _fingerprint(path: str) -> dict:
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def _read_excel(path: str) -> list:
+    import pandas as pd
+
+    df = pd.read_excel(path, engine="openpyxl")
+    return df[EXCEL_COLUMN].dropna().astype(str).tolist()
+
+
+def _read_csv(path: str) -> list:
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row[CSV_COLUMN] for row in csv.DictReader(f) if (row.get(CSV_COLUMN) or "").strip()]
+
+
+_READERS = {"excel": _read_excel, "csv": _read_csv}
+
+
+class DisclosureLibrary:
+    def __init__(self, manifest: dict):
+        self.manifest = manifest
+        self.entries = manifest["entries"]
+
+    def texts(self, source: str = None) -> list:
+        """Original disclosure texts, optionally only those from one source ("excel" / "csv")."""
+        return [e["text"] for e in self.entries if source is None or e["source"] == source]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _artifact_dir(sources: dict, artifact_dir: str) -> str:
+    key = "|".join(f"{name}={os.path.abspath(path)}" for name, path in sorted(sources.items()))
+    return os.path.join(artifact_dir, hashlib.sha1(key.encode("utf-8")).hexdigest()[:12])
+
+
+def build_library(sources: dict, out_dir: str) -> dict:
+    """Compile `sources` ({"excel": path, "csv": path}) into `out_dir`; return the manifest."""
+    entries, fingerprints = [], {}
+    for name, path in sources.items():
+        fingerprints[name] = dict(_fingerprint(path), sha256=_sha256_file(path))
+        entries.extend({"source": name, "text": text} for text in _READERS[name](path))
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "built_at": time.time(),
+        "sources": fingerprints,
+        "entries": entries,
+    }
+    _write_manifest(manifest, out_dir)
+    return manifest
+
+
+def _write_manifest(manifest: dict, out_dir: str):
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    tmp_path = f"{manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def _check_current(manifest: dict, sources: dict) -> tuple:
+    """
+    (current, refreshed): a cheap mtime/size check first, sha256 when the stat
+    changed. `refreshed` is True when a touched but unchanged source had its
+    fingerprint updated in `manifest`, which then needs writing back.
+    """
+    if manifest.get("version") != ARTIFACT_VERSION or set(manifest["sources"]) != set(sources):
+        return False, False
+    refreshed = False
+    for name, path in sources.items():
+        recorded = manifest["sources"][name]
+        current = _fingerprint(path)
+        if recorded["path"] != current["path"]:
+            return False, False
+        if (recorded["mtime_ns"], recorded["size"]) == (current["mtime_ns"], current["size"]):
+            continue
+        if recorded["sha256"] != _sha256_file(path):
+            return False, False
+        recorded.update(current)  # touched but unchanged
+        refreshed = True
+    return True, refreshed
+
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def load_library(excel_path: str = DEFAULT_EXCEL_PATH, csv_path: str = None,
+                 artifact_dir: str = None) -> DisclosureLibrary:
+    """The library of the given sources (only the Excel one by default: it is all the matching uses)."""
+    sources = {name: path for name, path in (("excel", excel_path), ("csv", csv_path)) if path}
+    for path in sources.values():
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Disclosure library source not found: {os.path.abspath(path)}")
+    out_dir = _artifact_dir(sources, artifact_dir or ARTIFACT_DIR)
+    manifest_path = os.path.join(out_dir, "manifest.json")
+
+    with _lock:
+        library = _loaded.get(out_dir)
+        if library is not None:
+            current, refreshed = _check_current(library.manifest, sources)
+            if current:
+                if refreshed:
+                    _write_manifest(library.manifest, out_dir)
+                return library
+
+        manifest = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        current, refreshed = _check_current(manifest, sources) if manifest else (False, False)
+        if not current:
+            manifest = build_library(sources, out_dir)
+        elif refreshed:
+            _write_manifest(manifest, out_dir)
+
+        library = DisclosureLibrary(manifest)
+        _loaded[out_dir] = library
+        return library
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    lib = load_library(csv_path=DEFAULT_CSV_PATH)
+    print(f"Loaded {len(lib)} disclosures in {(time.perf_counter() - start) * 1000:.1f} ms")
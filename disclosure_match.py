@@ -0,0 +1,217 @@
+"""
+Indexed disclosure matching.
+
+run_disclosure_analysis used to score every library disclosure against every
+AI-extracted disclosure with difflib.SequenceMatcher. This module reaches the
+same Present / Partially Present / Not Present decisions while only running
+SequenceMatcher on a handful of pairs:
+
+1. exact text hits are resolved with a hash lookup (ratio == 1.0 only for
+   identical strings);
+2. a vectorized kernel over character-count vectors computes, for all pairs
+   at once, SequenceMatcher.quick_ratio(), which is an upper bound of ratio();
+   pairs whose bound is below the Partially Present threshold are pruned;
+3. MinHash signatures over word 3-gram shingles estimate similarity, and the
+   surviving pairs are scored exactly in that order with branch-and-bound on
+   the upper bound, so most survivors are never scored.
+
+Statuses are identical to the brute-force loop. For a "Not Present" row the
+reported match_score / matched_text is the best exactly scored survivor (or the
+closest candidate by the bound), which can be lower than the brute-force best.
+"""
+import time
+import zlib
+from difflib import SequenceMatcher
+
+import numpy as np
+
+PRESENT_SCORE = 100
+PARTIAL_SCORE = 80
+
+MINHASH_PERMUTATIONS = 64
+SHINGLE_WORDS = 3
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def disclosure_status(score: float) -> str:
+    if score == PRESENT_SCORE:
+        return "Present"
+    if score >= PARTIAL_SCORE:
+        return "Partially Present"
+    return "Not Present"
+
+
+def _ratio(a: str, b: str) -> float:
+    return SequenceMatcher(None, a, b).ratio() * 100
+
+
+def _shingles(text: str) -> np.ndarray:
+    words = text.lower().split()
+    if len(words) < SHINGLE_WORDS:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+    return np.array([zlib.crc32(g.encode("utf-8")) for g in grams], dtype=np.uint64)
+
+
+class _MinHasher:
+    def __init__(self, permutations: int = MINHASH_PERMUTATIONS, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, 1 << 31, size=permutations).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=permutations).astype(np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = _shingles(text)
+        hashed = (shingles[:, None] * self.a[None, :] + self.b[None, :]) % np.uint64(_MERSENNE_PRIME)
+        return hashed.min(axis=0)
+
+
+class DisclosureMatcher:
+    """Index over the AI-extracted disclosures of one document."""
+
+    def __init__(self, ai_disclosures: list):
+        self.ai_disclosures = ai_disclosures
+        self.texts = [ai.get("text", "") for ai in ai_disclosures]
+        self.exact = {}
+        for j, text in enumerate(self.texts):
+            self.exact.setdefault(text, j)
+
+        self._hasher = _MinHasher()
+        self.signatures = (
+            np.stack([self._hasher.signature(t) for t in self.texts])
+            if self.texts else np.zeros((0, MINHASH_PERMUTATIONS), dtype=np.uint64)
+        )
+        self.lengths = np.array([len(t) for t in self.texts], dtype=np.float64)
+        self._vocab = {}
+        self._counts = self._count_matrix(self.texts)
+        self.stats = {"pairs": 0, "pruned": 0, "scored": 0, "exact_hits": 0}
+
+    def _count_matrix(self, texts: list) -> np.ndarray:
+        for text in texts:
+            for ch in text:
+                self._vocab.setdefault(ch, len(self._vocab))
+        counts = np.zeros((len(texts), max(len(self._vocab), 1)), dtype=np.int32)
+        for i, text in enumerate(texts):
+            for ch in text:
+                counts[i, self._vocab[ch]] += 1
+        return counts
+
+    def _count_vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self._counts.shape[1], dtype=np.int32)
+        for ch in text:
+            idx = self._vocab.get(ch)
+            if idx is not None:  # characters absent from every candidate cannot match
+                vector[idx] += 1
+        return vector
+
+    def _entry(self, j: int, score: float) -> dict:
+        ai = self.ai_disclosures[j]
+        return {"score": score, "text": ai.get("text", ""), "pages": ai.get("pages", "N/A")}
+
+    def best_match(self, std: str) -> dict:
+        """Best AI disclosure for one library disclosure: {"score", "text", "pages"}."""
+        best = {"score": 0, "text": "", "pages": "N/A"}
+        if not self.texts:
+            return best
+        self.stats["pairs"] += len(self.texts)
+
+        j = self.exact.get(std)
+        if j is not None:
+            self.stats["exact_hits"] += 1
+            return self._entry(j, float(PRESENT_SCORE))
+
+        # quick_ratio for every candidate in one vectorized pass
+        totals = self.lengths + len(std)
+        overlap = np.minimum(self._counts, self._count_vector(std)).sum(axis=1)
+        upper = np.where(totals > 0, 200.0 * overlap / np.maximum(totals, 1), 0.0)
+
+        survivors = np.nonzero(upper >= PARTIAL_SCORE)[0]
+        self.stats["pruned"] += len(self.texts) - len(survivors)
+        if len(survivors) == 0:
+            j = int(np.argmax(upper))
+            self.stats["scored"] += 1
+            return self._entry(j, _ratio(std, self.texts[j]))
+
+        similarity = (self.signatures[survivors] == self._hasher.signature(std)[None, :]).mean(axis=1)
+        for j in survivors[np.lexsort((-upper[survivors], -similarity))]:
+            if upper[j] <= best["score"]:
+                continue
+            self.stats["scored"] += 1
+            score = _ratio(std, self.texts[j])
+            if score > best["score"]:
+                best = self._entry(int(j), score)
+        return best
+
+
+def match_disclosures(std_disclosures: list, ai_disclosures: list) -> list:
+    """Best match per library disclosure, in library order."""
+    matcher = DisclosureMatcher(ai_disclosures)
+    return [matcher.best_match(std) for std in std_disclosures]
+
+
+# ------------------------------------------------------------------------------
+# Benchmark against the previous O(N x M) loop
+# ------------------------------------------------------------------------------
+
+def legacy_match(std_disclosures: list, ai_disclosures: list) -> list:
+    matches = []
+    for std in std_disclosures:
+        best = {"score": 0, "text": "", "pages": "N/A"}
+        for ai in ai_disclosures:
+            score = _ratio(std, ai.get("text", ""))
+            if score > best["score"]:
+                best = {"score": score, "text": ai.get("text", ""), "pages": ai.get("pages", "N/A")}
+        matches.append(best)
+    return matches
+
+
+def benchmark(std_disclosures: list, ai_disclosures: list) -> dict:
+    start = time.perf_counter()
+    legacy = legacy_match(std_disclosures, ai_disclosures)
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = DisclosureMatcher(ai_disclosures)
+    indexed = [matcher.best_match(std) for std in std_disclosures]
+    indexed_seconds = time.perf_counter() - start
+
+    disagreements = sum(
+        disclosure_status(a["score"]) != disclosure_status(b["score"]) for a, b in zip(legacy, indexed)
+    )
+    return {
+        "library_size": len(std_disclosures),
+        "extracted_size": len(ai_disclosures),
+        "legacy_seconds": round(legacy_seconds, 4),
+        "indexed_seconds": round(indexed_seconds, 4),
+        "speedup": round(legacy_seconds / max(indexed_seconds, 1e-9), 1),
+        "status_disagreements": disagreements,
+        **matcher.stats,
+    }
+
+
+if __name__ == "__main__":
+    import csv
+    import json
+    import os
+    import random
+
+    library_csv = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "Disclosure_Library_3.csv")
+    with open(library_csv, newline="", encoding="utf-8") as f:
+        library = [row["Disclosure text"] for row in csv.DictReader(f) if row.get("Disclosure text")]
+
+    # Synthetic "extracted" disclosures: exact copies, light edits and unrelated text.
+    rng = random.Random(7)
+    extracted = []
+    for text in library * 4:
+        words = text.split()
+        roll = rng.random()
+        if roll < 0.3:
+            extracted.append({"text": text, "pages": "1"})
+        elif roll < 0.7:
+            for _ in range(max(1, len(words) // 15)):
+                words[rng.randrange(len(words))] = rng.choice(words)
+            extracted.append({"text": " ".join(words), "pages": "2"})
+        else:
+            rng.shuffle(words)
+            extracted.append({"text": " ".join(words), "pages": "3"})
+    print(json.dumps(benchmark(library * 3, extracted), indent=2))
@@ -0,0 +1,185 @@
+"""
+Local structural diff between two document versions.
+
+Works on the docling page maps stored on document_versions ("pages": [{page_no,
+sha256, text}]) and compares at three levels:
+
+- pages are aligned by content hash, so inserted, removed and moved pages are
+  found without looking inside them;
+- paired pages that differ are compared paragraph by paragraph (markdown table
+  rows count as paragraphs, so table edits show up row by row);
+- paired paragraphs that differ get a word-level diff.
+
+Every change is exact and produced locally; the model is only asked to
+summarize and classify them (see complience.run_document_comparison).
+"""
+import hashlib
+import re
+from difflib import SequenceMatcher
+
+# Quote at most this much of a paragraph in a change record.
+MAX_QUOTE_CHARS = 500
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"<!-- image -->", "", text or "")).strip()
+
+
+def _page_hash(page: dict) -> str:
+    return page.get("sha256") or hashlib.sha256(_normalize(page.get("text")).encode("utf-8")).hexdigest()
+
+
+def content_hash(pages: list) -> str:
+    """Hash of a whole version's text, from its page hashes."""
+    return hashlib.sha256("\n".join(_page_hash(p) for p in pages).encode("utf-8")).hexdigest()
+
+
+def split_paragraphs(text: str) -> list:
+    """Paragraphs separated by blank lines; each markdown table row is its own unit."""
+    units, current = [], []
+    for line in re.sub(r"<!-- image -->", "", text or "").splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("|"):
+            if current:
+                units.append(" ".join(current))
+                current = []
+            if stripped and not re.fullmatch(r"\|[\s\-:|]*\|?", stripped):  # skip |---| separators
+                units.append(stripped)
+            continue
+        current.append(stripped)
+    if current:
+        units.append(" ".join(current))
+    return [_normalize(u) for u in units if _normalize(u)]
+
+
+def _quote(text: str) -> str:
+    return text if len(text) <= MAX_QUOTE_CHARS else text[:MAX_QUOTE_CHARS] + "..."
+
+
+def word_diff(a: str, b: str) -> list:
+    """Word-level edits turning `a` into `b`: [{"op", "a", "b"}] (equal runs omitted)."""
+    words_a, words_b = a.split(), b.split()
+    edits = []
+    for op, i1, i2, j1, j2 in SequenceMatcher(None, words_a, words_b, autojunk=False).get_opcodes():
+        if op != "equal":
+            edits.append({"op": op, "a": " ".join(words_a[i1:i2]), "b": " ".join(words_b[j1:j2])})
+    return edits
+
+
+def _describe_words(edits: list) -> str:
+    parts = []
+    for e in edits[:5]:
+        if e["op"] == "insert":
+            parts.append(f'added "{e["b"]}"')
+        elif e["op"] == "delete":
+            parts.append(f'removed "{e["a"]}"')
+        else:
+            parts.append(f'"{e["a"]}" -> "{e["b"]}"')
+    more = f" (+{len(edits) - 5} more)" if len(edits) > 5 else ""
+    return "; ".join(parts) + more
+
+
+def _diff_page(page_a: dict, page_b: dict) -> list:
+    paras_a, paras_b = split_paragraphs(page_a["text"]), split_paragraphs(page_b["text"])
+    location = f"page {page_a['page_no']} -> page {page_b['page_no']}"
+    changes = []
+
+    def _change(kind, i, j, a="", b="", words=None, description=""):
+        changes.append({
+            "type": kind,
+            "level": "word" if words is not None else "paragraph",
+            "location": f"{location}, paragraph {i + 1} -> {j + 1}",
+            "page_a": page_a["page_no"],
+            "page_b": page_b["page_no"],
+            "description": description,
+            "document_a": _quote(a),
+            "document_b": _quote(b),
+            **({"words": words} if words is not None else {}),
+        })
+
+    matcher = SequenceMatcher(None, paras_a, paras_b, autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == "equal":
+            continue
+        if op == "replace":
+            paired = min(i2 - i1, j2 - j1)
+            for k in range(paired):
+                a, b = paras_a[i1 + k], paras_b[j1 + k]
+                words = word_diff(a, b)
+                _change("modified", i1 + k, j1 + k, a, b, words, "Text modified: " + _describe_words(words))
+            for k in range(i1 + paired, i2):
+                _change("removed", k, j1, a=paras_a[k], description="Paragraph removed")
+            for k in range(j1 + paired, j2):
+                _change("added", i1, k, b=paras_b[k], description="Paragraph added")
+        elif op == "delete":
+            for k in range(i1, i2):
+                _change("removed", k, j1, a=paras_a[k], description="Paragraph removed")
+        else:
+            for k in range(j1, j2):
+                _change("added", i1, k, b=paras_b[k], description="Paragraph added")
+    return changes
+
+
+def _page_change(kind: str, page: dict) -> dict:
+    text = _normalize(page["text"])
+    return {
+        "type": kind,
+        "level": "page",
+        "location": f"page {page['page_no']} ({'version 1' if kind == 'removed' else 'version 2'})",
+        "page_a": page["page_no"] if kind == "removed" else None,
+        "page_b": page["page_no"] if kind == "added" else None,
+        "description": f"Page {kind}",
+        "document_a": _quote(text) if kind == "removed" else "",
+        "document_b": _quote(text) if kind == "added" else "",
+    }
+
+
+def diff_versions(pages_a: list, pages_b: list) -> dict:
+    """
+    Compare two page maps. Returns {"identical", "changes": [...], "stats"}.
+    Each change has type (added / removed / modified / moved), level (page /
+    paragraph / word), location, description, document_a / document_b quotes
+    and, for word-level changes, the word edits.
+    """
+    hashes_a = [_page_hash(p) for p in pages_a]
+    hashes_b = [_page_hash(p) for p in pages_b]
+    changes = []
+    matcher = SequenceMatcher(None, hashes_a, hashes_b, autojunk=False)
+    unmatched_a, unmatched_b = [], []
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == "equal":
+            continue
+        paired = min(i2 - i1, j2 - j1) if op == "replace" else 0
+        for k in range(paired):
+            changes.extend(_diff_page(pages_a[i1 + k], pages_b[j1 + k]))
+        unmatched_a.extend(range(i1 + paired, i2))
+        unmatched_b.extend(range(j1 + paired, j2))
+
+    # A page removed in one place and added in another with the same content moved.
+    added_by_hash = {}
+    for j in unmatched_b:
+        added_by_hash.setdefault(hashes_b[j], []).append(j)
+    for i in unmatched_a:
+        moved_to = added_by_hash.get(hashes_a[i])
+        if moved_to:
+            j = moved_to.pop(0)
+            unmatched_b.remove(j)
+            changes.append({
+                "type": "moved",
+                "level": "page",
+                "location": f"page {pages_a[i]['page_no']} -> page {pages_b[j]['page_no']}",
+                "page_a": pages_a[i]["page_no"],
+                "page_b": pages_b[j]["page_no"],
+                "description": "Page moved without changes",
+                "document_a": "",
+                "document_b": "",
+            })
+        else:
+            changes.append(_page_change("removed", pages_a[i]))
+    for j in unmatched_b:
+        changes.append(_page_change("added", pages_b[j]))
+
+    stats = {"pages_a": len(pages_a), "pages_b": len(pages_b), "changes": len(changes)}
+    for change in changes:
+        stats[change["type"]] = stats.get(change["type"], 0) + 1
+    return {"identical": not changes, "changes": changes, "stats": stats}
@@ -0,0 +1,217 @@
+"""
+Upload-once document handles shared by every review stage.
+
+A review run used to read the same PDF from disk in each stage and attach it
+inline to each request, so its bytes went over the wire once per stage. A
+DocumentHandle reads and hashes the file once. The first stage that needs it
+as a model input uploads it once to a file store, and every later stage sends
+only the returned URI.
+
+GeminiFileStore uses the google-genai Files API; uploads are remembered by
+content hash in .cache/uploads until shortly before the provider deletes them
+(48 h), so rerunning the same PDF does not upload it again. LocalFileStore is
+an in-process stand-in that hands out local:// URIs without any network
+traffic (offline runs and tests). With DOCUMENT_STORE_BACKEND=inline, or if
+an upload fails, the bytes are sent inline as before.
+
+Vertex AI (complience.py) reads documents from GCS: a handle created with the
+version's gcp_path uses it as its URI and never uploads.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_STORE_BACKEND = os.getenv("DOCUMENT_STORE_BACKEND", "gemini")
+UPLOAD_CACHE_DIR = os.getenv("DOCUMENT_UPLOAD_CACHE_DIR", os.path.join(".cache", "uploads"))
+# The Files API deletes uploads after 48 h; stop reusing them a little earlier.
+UPLOAD_TTL_SECONDS = int(os.getenv("DOCUMENT_UPLOAD_TTL_SECONDS", str(46 * 3600)))
+UPLOAD_POLL_SECONDS = 1.0
+UPLOAD_MAX_WAIT_SECONDS = 60.0
+HANDLES_MAX = int(os.getenv("DOCUMENT_HANDLES_MAX", "32"))
+
+_stats = {"uploads": 0, "upload_bytes": 0, "reuses": 0, "inline_parts": 0, "inline_bytes": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(**increments):
+    with _stats_lock:
+        for name, value in increments.items():
+            _stats[name] += value
+
+
+def upload_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
+
+
+# ---------------------------------------------------------------------------
+# File stores
+# ---------------------------------------------------------------------------
+
+class GeminiFileStore:
+    def __init__(self, client, cache_dir: str = UPLOAD_CACHE_DIR, ttl_seconds: int = UPLOAD_TTL_SECONDS):
+        self.client = client
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+
+    def _entry_path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, sha256 + ".json")
+
+    def _remembered(self, sha256: str):
+        try:
+            with open(self._entry_path(sha256), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return entry["uri"] if time.time() < entry.get("expires_at", 0) else None
+
+    def _remember(self, sha256: str, uri: str, name: str):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._entry_path(sha256)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"uri": uri, "name": name, "expires_at": time.time() + self.ttl_seconds}, f)
+        os.replace(tmp_path, path)
+
+    def upload(self, handle) -> str:
+        uri = self._remembered(handle.sha256)
+        if uri:
+            _count(reuses=1)
+            return uri
+        uploaded = self.client.files.upload(
+            file=io.BytesIO(handle.data),
+            config={"mime_type": handle.mime_type, "display_name": handle.sha256[:40]},
+        )
+        # PDFs are usually ACTIVE at once; wait briefly if the provider is still processing.
+        deadline = time.monotonic() + UPLOAD_MAX_WAIT_SECONDS
+        while "PROCESSING" in str(getattr(uploaded, "state", "")) and time.monotonic() < deadline:
+            time.sleep(UPLOAD_POLL_SECONDS)
+            uploaded = self.client.files.get(name=uploaded.name)
+        _count(uploads=1, upload_bytes=handle.size)
+        logger.info("Uploaded %s (%d bytes) as %s", handle.name, handle.size, uploaded.uri)
+        self._remember(handle.sha256, uploaded.uri, uploaded.name)
+        return uploaded.uri
+
+
+class LocalFileStore:
+    files = {}
+
+    def upload(self, handle) -> str:
+        uri = f"local://{handle.sha256}"
+        if uri in LocalFileStore.files:
+            _count(reuses=1)
+        else:
+            LocalFileStore.files[uri] = handle.data
+            _count(uploads=1, upload_bytes=handle.size)
+        return uri
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_file_store():
+    """The process-wide file store for DOCUMENT_STORE_BACKEND (None when inline)."""
+    global _store
+    if DOCUMENT_STORE_BACKEND == "inline":
+        return None
+    with _store_lock:
+        if _store is None:
+            if DOCUMENT_STORE_BACKEND == "gemini":
+                if __package__:
+                    from .clients import get_genai_client
+                else:
+                    from clients import get_genai_client
+
+                _store = GeminiFileStore(get_genai_client())
+            else:
+                _store = LocalFileStore()
+    return _store
+
+
+# ---------------------------------------------------------------------------
+# Handles
+# ---------------------------------------------------------------------------
+
+class DocumentHandle:
+    def __init__(self, data: bytes, path: str = None, uri: str = None, mime_type: str = "application/pdf"):
+        self.data = data
+        self.path = path
+        self.mime_type = mime_type
+        self.sha256 = hashlib.sha256(data).hexdigest()
+        self.uri = uri
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path) if self.path else self.sha256[:12]
+
+    def upload(self, store=None) -> str:
+        """URI of the document in the file store, uploading it on first use."""
+        with self._lock:
+            if self.uri is None:
+                self.uri = (store or get_file_store()).upload(self)
+            return self.uri
+
+    def genai_part(self, store=None):
+        """google-genai Part referencing the uploaded file (inline bytes as a fallback)."""
+        from google.genai import types
+
+        store = store or get_file_store()
+        if store is not None:
+            try:
+                return types.Part.from_uri(file_uri=self.upload(store), mime_type=self.mime_type)
+            except Exception as e:
+                # Uploading is an optimisation; never fail the review over it.
+                logger.warning("Upload of %s failed, sending it inline: %s", self.name, e)
+        _count(inline_parts=1, inline_bytes=self.size)
+        return types.Part.from_bytes(data=self.data, mime_type=self.mime_type)
+
+    def vertex_part(self):
+        """Vertex AI Part: the GCS URI when the handle has one, inline bytes otherwise."""
+        from vertexai.preview.generative_models import Part
+
+        if self.uri and self.uri.startswith("gs://"):
+            return Part.from_uri(mime_type=self.mime_type, uri=self.uri)
+        _count(inline_parts=1, inline_bytes=self.size)
+        return Part.from_data(mime_type=self.mime_type, data=self.data)
+
+
+_handles = {}
+_handles_lock = threading.Lock()
+
+
+def open_document(source, uri: str = None) -> DocumentHandle:
+    """
+    A handle for `source`: an existing DocumentHandle (returned as is), PDF
+    bytes, or a path. Handles for a path are shared while the file is
+    unchanged, so stages that are given the same path read it only once.
+    """
+    if isinstance(source, DocumentHandle):
+        return source
+    if isinstance(source, (bytes, bytearray)):
+        return DocumentHandle(bytes(source), uri=uri)
+
+    path = os.path.abspath(source)
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size, uri)
+    with _handles_lock:
+        handle = _handles.get(key)
+    if handle is None:
+        with open(path, "rb") as f:
+            handle = DocumentHandle(f.read(), path=path, uri=uri)
+        with _handles_lock:
+            handle = _handles.setdefault(key, handle)
+            while len(_handles) > HANDLES_MAX:
+                _handles.pop(next(iter(_handles)))
+    return handle
@@ -0,0 +1,215 @@
+"""
+Local stand-in for the Gemini API.
+
+FakeModelBackend returns canned text after an artificial latency and can be
+told to fail a fraction of calls with 429 RESOURCE_EXHAUSTED errors (or 500
+INTERNAL errors) shaped like google-genai's APIError (an int `code`
+attribute), so the retry and rate-limiting layers can be exercised without
+spending API quota.
+
+- latency: a constant number of seconds or a distribution,
+  {"dist": "uniform", "low", "high"}, {"dist": "normal", "mean", "stddev"} or
+  {"dist": "lognormal", "median", "sigma"};
+- responses: [(regex, text), ...] matched against the prompt text, first match
+  wins, response_text otherwise (so each stage can get its own canned JSON).
+
+FakeGenaiClient, FakeVertexModel and FakeChatModel put the backend behind the
+google-genai client, Vertex GenerativeModel and LangChain chat model
+interfaces the stages call (see benchmark.py).
+"""
+import asyncio
+import math
+import random
+import re
+import threading
+import time
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+def latency_sampler(spec):
+    """A function rng -> seconds for a latency spec (see module docstring)."""
+    if spec is None or isinstance(spec, (int, float)):
+        return lambda rng: float(spec or 0.0)
+    dist = spec.get("dist", "constant")
+    if dist == "constant":
+        return lambda rng: float(spec.get("seconds", 0.0))
+    if dist == "uniform":
+        return lambda rng: rng.uniform(spec["low"], spec["high"])
+    if dist == "normal":
+        return lambda rng: max(0.0, rng.gauss(spec["mean"], spec["stddev"]))
+    if dist == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(spec["median"]), spec["sigma"])
+    raise ValueError(f"unknown latency distribution {dist!r}")
+
+
+def prompt_text(contents) -> str:
+    """Concatenated text of request contents (str, Parts, messages, lists)."""
+    if contents is None:
+        return ""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (bytes, bytearray)):
+        return ""
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(prompt_text(item) for item in contents)
+    if isinstance(contents, dict):
+        return prompt_text(contents.get("text") or contents.get("content") or contents.get("parts"))
+    for attr in ("text", "content", "parts"):
+        try:
+            value = getattr(contents, attr, None)
+        except (AttributeError, ValueError):
+            value = None
+        if value is not None:
+            return prompt_text(value)
+    return ""
+
+
+class FakeModelBackend:
+    def __init__(self, latency_seconds=0.0, throttle_rate: float = 0.0,
+                 response_text: str = '{"sections": []}', seed: int = None,
+                 error_rate: float = 0.0, responses: list = None):
+        self.latency_seconds = latency_seconds
+        self._latency = latency_sampler(latency_seconds)
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.response_text = response_text
+        self.responses = [(re.compile(pattern), text) for pattern, text in responses or []]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "throttled": 0, "errors": 0, "max_in_flight": 0, "latency_seconds": 0.0}
+        self._in_flight = 0
+
+    def respond(self, prompt) -> str:
+        """The canned response for `prompt` (no latency, no failures)."""
+        text = prompt_text(prompt)
+        for pattern, response in self.responses:
+            if pattern.search(text):
+                return response
+        return self.response_text
+
+    def generate(self, prompt) -> str:
+        with self._lock:
+            self.stats["calls"] += 1
+            self._in_flight += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self._in_flight)
+            roll = self._rng.random()
+            latency = self._latency(self._rng)
+            self.stats["latency_seconds"] += latency
+        try:
+            time.sleep(latency)
+            if roll < self.throttle_rate:
+                with self._lock:
+                    self.stats["throttled"] += 1
+                raise FakeAPIError(429, "RESOURCE_EXHAUSTED: quota exceeded (fake backend)")
+            if roll < self.throttle_rate + self.error_rate:
+                with self._lock:
+                    self.stats["errors"] += 1
+                raise FakeAPIError(500, "INTERNAL: server error (fake backend)")
+            return self.respond(prompt)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+# ---------------------------------------------------------------------------
+# Client adapters
+# ---------------------------------------------------------------------------
+
+class _Obj:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def _response(text: str, prompt) -> _Obj:
+    """A response shaped like google-genai / Vertex GenerateContentResponse."""
+    usage = _Obj(
+        prompt_token_count=len(prompt_text(prompt)) // 4,
+        candidates_token_count=len(text) // 4,
+        cached_content_token_count=0,
+    )
+    part = _Obj(text=text)
+    return _Obj(text=text, candidates=[_Obj(content=_Obj(parts=[part]))], usage_metadata=usage)
+
+
+class _FakeModels:
+    def __init__(self, backend: FakeModelBackend, stream_chunks: int):
+        self.backend = backend
+        self.stream_chunks = stream_chunks
+
+    def generate_content(self, model, contents, config=None):
+        return _response(self.backend.generate(contents), contents)
+
+    def generate_content_stream(self, model, contents, config=None):
+        text = self.backend.generate(contents)  # latency is paid before the first chunk
+        size = max(1, math.ceil(len(text) / self.stream_chunks))
+        for start in range(0, len(text), size):
+            yield _response(text[start:start + size], contents if start == 0 else "")
+
+
+class _FakeFiles:
+    def __init__(self):
+        self.files = {}
+
+    def upload(self, file=None, config=None):
+        data = file.read() if hasattr(file, "read") else open(file, "rb").read()
+        name = f"files/fake-{len(self.files)}"
+        self.files[name] = _Obj(name=name, uri=f"fake://{name}", state="ACTIVE", size_bytes=len(data))
+        return self.files[name]
+
+    def get(self, name):
+        return self.files[name]
+
+
+class _FakeCaches:
+    def __init__(self):
+        self.count = 0
+
+    def create(self, model=None, config=None):
+        self.count += 1
+        return _Obj(name=f"cachedContents/fake-{self.count}")
+
+    def update(self, name=None, config=None):
+        return _Obj(name=name)
+
+
+class FakeGenaiClient:
+    """google-genai Client with models, files and caches served locally."""
+
+    def __init__(self, backend: FakeModelBackend, stream_chunks: int = 8):
+        self.models = _FakeModels(backend, stream_chunks)
+        self.files = _FakeFiles()
+        self.caches = _FakeCaches()
+
+
+class FakeVertexModel:
+    """Vertex AI GenerativeModel (sync and async generate_content)."""
+
+    def __init__(self, backend: FakeModelBackend, model_name: str = "fake-vertex-model", generation_config=None):
+        self.backend = backend
+        self._model_name = model_name
+        self._generation_config = generation_config
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        return _response(self.backend.generate(contents), contents)
+
+    async def generate_content_async(self, contents, generation_config=None, **kwargs):
+        return await asyncio.to_thread(self.generate_content, contents, generation_config)
+
+
+class FakeChatModel:
+    """LangChain chat model: invoke(messages) -> message with .content and usage_metadata."""
+
+    def __init__(self, backend: FakeModelBackend):
+        self.backend = backend
+
+    def invoke(self, messages, **kwargs):
+        text = self.backend.generate(messages)
+        return _Obj(
+            content=text,
+            usage_metadata={"input_tokens": len(prompt_text(messages)) // 4, "output_tokens": len(text) // 4},
+        )
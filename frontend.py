@@ -6,6 +6,8 @@ st.title("SEC Compliance Checker")
 
 # Input box for the text chunk
 text_chunk_input = st.text_area("Enter the Text Chunk to Review", height=200)
+use_retrieval = st.checkbox("Send only the most relevant SEC rule passages", value=True)
+top_k = st.number_input("Passages to send", min_value=1, max_value=50, value=8) if use_retrieval else None
 
 SEC_RULES = """
     (Insert your SEC rules here or load from a file)
@@ -21,8 +23,8 @@ if text_chunk_input:
     else:
         # Check compliance when the button is pressed
         if st.button("Check Compliance"):
-            # Perform compliance check
-            result = check_compliance(text_chunk_input, sec_rules)
+            # Perform compliance check; retrieval searches the whole bundled SEC corpus
+            result = check_compliance(text_chunk_input, None if top_k else sec_rules, top_k=top_k)
 
             # Try parsing the result as JSON to display it properly
             try:
@@ -30,4 +32,57 @@ if text_chunk_input:
                 st.json(result_json)
             except json.JSONDecodeError:
                 st.error("Failed to decode the response as JSON. Please try again.")
-                st.text(result)
\ No newline at end of file
+                st.text(result)
+
+st.header("Review a PDF")
+uploaded_pdf = st.file_uploader("Upload a factsheet", type=["pdf"])
+
+
+def render_finding(section):
+    title = section.get("section_title", "Finding")
+    page = section.get("page_number", "N/A")
+    with st.expander(f"{title} (page {page})", expanded=True):
+        st.markdown(f"**Observations:** {section.get('observations', '')}")
+        st.markdown(f"**Rule citation:** {section.get('rule_citation', '')}")
+        st.markdown(f"**Recommendations:** {section.get('recommendations', '')}")
+
+
+def render_stream(label, events):
+    """Render findings as they arrive; return the final report."""
+    st.subheader(label)
+    status = st.empty()
+    status.info("Waiting for the first finding...")
+    count, result = 0, {}
+    for event in events:
+        if event["type"] == "section":
+            count += 1
+            status.info(f"{count} finding(s) so far...")
+            render_finding(event["section"])
+        else:
+            result = event["result"]
+    status.success(f"{count} finding(s). {result.get('overall_conclusion', '')}")
+    return result
+
+
+if uploaded_pdf is not None and st.button("Review PDF"):
+    import os
+    import re
+    import tempfile
+
+    from conversion_cache import convert_pdf
+    from test_compliance import run_text_review_stream
+    from test_multimodal import run_multimodal_review_stream
+    from test_syn import run_synthesis_review_stream
+
+    pdf_bytes = uploaded_pdf.getvalue()
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(pdf_bytes)
+    try:
+        with st.spinner("Extracting text..."):
+            clean_text = re.sub(r"<!-- image -->", "", convert_pdf(tmp.name)["markdown"])
+    finally:
+        os.remove(tmp.name)
+
+    text_res = render_stream("Text review", run_text_review_stream(clean_text))
+    multi_res = render_stream("Multimodal review", run_multimodal_review_stream(pdf_bytes))
+    render_stream("Final report", run_synthesis_review_stream(text_res, multi_res, pdf_bytes))
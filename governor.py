@@ -0,0 +1,280 @@
+"""
+Request governor for model calls.
+
+Each model gets one governor that every call site goes through:
+
+- a token bucket caps the request rate (MODEL_RPM requests per minute);
+- an AIMD limiter caps in-flight calls: the limit grows by ~1 per window of
+  successful calls and is halved whenever the API throttles (429 / 503);
+- throttled and transient failures are retried with full-jitter exponential
+  backoff, up to MAX_ATTEMPTS.
+
+Anything that is not a throttling/transient error is raised immediately.
+Coroutine calls go through the same governor with governed_call_async.
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RPM = float(os.getenv("MODEL_RPM", "300"))
+MODEL_RPM = {}
+
+DEFAULT_MODEL_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY", "8"))
+MODEL_CONCURRENCY = {
+    "gemini-2.5-flash": DEFAULT_MODEL_CONCURRENCY,
+    "gemini-2.0-flash-exp": max(1, DEFAULT_MODEL_CONCURRENCY // 2),
+}
+
+MAX_ATTEMPTS = int(os.getenv("MODEL_MAX_ATTEMPTS", "6"))
+BACKOFF_BASE_SECONDS = float(os.getenv("MODEL_BACKOFF_BASE_SECONDS", "1.0"))
+BACKOFF_CAP_SECONDS = float(os.getenv("MODEL_BACKOFF_CAP_SECONDS", "60.0"))
+ASYNC_POLL_SECONDS = 0.05
+
+THROTTLE_CODES = {429, 503}
+TRANSIENT_CODES = {500, 502, 504}
+# Throttling reported as text: a status name, or a 429/503 status code leading the
+# message ("429 Quota exceeded", "API_ERROR: 503 ...") or labelled as one ("HTTP 429").
+_THROTTLE_MESSAGE = re.compile(
+    r"\b(?:RESOURCE_EXHAUSTED|UNAVAILABLE|Too Many Requests|Service Unavailable)\b"
+    r"|\bmodel is overloaded\b"
+    r"|(?:^|API_ERROR:\s*|\b(?:code|status|status_code|error|HTTP)\s*[:=]?\s*)(?:429|503)\b",
+    re.IGNORECASE,
+)
+
+
+class ThrottledError(Exception):
+    """Raised for throttling reported in-band (e.g. an "API_ERROR: 429 ..." string)."""
+
+    code = 429
+
+
+def status_code(exc: Exception):
+    for attr in ("code", "status_code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_throttle(exc: Exception) -> bool:
+    code = status_code(exc)
+    if code is not None:
+        return code in THROTTLE_CODES
+    return is_throttle_message(str(exc))
+
+
+def is_throttle_message(message: str) -> bool:
+    return bool(_THROTTLE_MESSAGE.search(message or ""))
+
+
+def is_transient(exc: Exception) -> bool:
+    return status_code(exc) in TRANSIENT_CODES or isinstance(exc, (TimeoutError, ConnectionError))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, burst: float):
+        self.rate = rate_per_second
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Take a token and return 0, or return the seconds until one is available."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class AIMDLimiter:
+    def __init__(self, max_limit: int, min_limit: int = 1, decrease_factor: float = 0.5):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min_limit)
+        self.decrease_factor = decrease_factor
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    async def acquire_async(self):
+        # Polled rather than waited on a worker thread: blocked waiters would
+        # fill the default executor that the running calls themselves need.
+        while not self.try_acquire():
+            await asyncio.sleep(ASYNC_POLL_SECONDS)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            # +1 per "window" of successes at the current limit
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self):
+        with self._cond:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+
+
+class Governor:
+    def __init__(self, model: str, rpm: float = None, max_concurrency: int = None,
+                 max_attempts: int = MAX_ATTEMPTS, sleep=time.sleep):
+        rpm = rpm or MODEL_RPM.get(model, DEFAULT_RPM)
+        self.model = model
+        self.bucket = TokenBucket(rpm / 60.0, burst=max(1.0, rpm / 60.0 * 5))
+        self.limiter = AIMDLimiter(max_concurrency or MODEL_CONCURRENCY.get(model, DEFAULT_MODEL_CONCURRENCY))
+        self.max_attempts = max_attempts
+        self.sleep = sleep
+        self.stats = {"calls": 0, "attempts": 0, "throttled": 0, "transient": 0, "retries": 0, "failures": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+    def _retry_delay(self, e: Exception, attempt: int):
+        """Seconds to wait before retrying after `e`; None when it must be raised."""
+        throttled = is_throttle(e)
+        if not throttled and not is_transient(e):
+            return None
+        self._count("throttled" if throttled else "transient")
+        if throttled:
+            self.limiter.on_throttle()
+        if attempt == self.max_attempts - 1:
+            self._count("failures")
+            return None
+        delay = self.backoff(attempt)
+        logger.warning("%s: %s on attempt %d, retrying in %.1fs (limit %.1f)",
+                       self.model, e, attempt + 1, delay, self.limiter.limit)
+        self._count("retries")
+        return delay
+
+    def call(self, fn):
+        self._count("calls")
+        for attempt in range(self.max_attempts):
+            self.bucket.acquire()
+            self.limiter.acquire()
+            self._count("attempts")
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.limiter.on_success()
+                return result
+            finally:
+                self.limiter.release()
+            self.sleep(delay)
+
+    async def call_async(self, fn):
+        """call() for a coroutine function, waiting for tokens and slots without blocking the loop."""
+        self._count("calls")
+        for attempt in range(self.max_attempts):
+            await self.bucket.acquire_async()
+            await self.limiter.acquire_async()
+            self._count("attempts")
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self.limiter.on_success()
+                return result
+            finally:
+                self.limiter.release()
+            await asyncio.sleep(delay)
+
+
+_governors = {}
+_lock = threading.Lock()
+
+
+def get_governor(model: str) -> Governor:
+    with _lock:
+        governor = _governors.get(model)
+        if governor is None:
+            governor = Governor(model)
+            _governors[model] = governor
+    return governor
+
+
+def governed_call(model: str, fn):
+    """Run `fn()` under the model's rate limit, adaptive concurrency and retries."""
+    return get_governor(model).call(fn)
+
+
+async def governed_call_async(model: str, fn):
+    """Await `fn()` (a coroutine function) under the model's governor."""
+    return await get_governor(model).call_async(fn)
+
+
+def governor_stats() -> dict:
+    with _lock:
+        return {
+            model: dict(g.stats, concurrency_limit=round(g.limiter.limit, 2))
+            for model, g in _governors.items()
+        }
+
+
+if __name__ == "__main__":
+    # Drive the governor against the local fake backend that injects 429s.
+    import json
+    from concurrent.futures import ThreadPoolExecutor
+
+    from fake_backend import FakeModelBackend
+
+    backend = FakeModelBackend(latency_seconds=0.01, throttle_rate=0.3, seed=3)
+    governor = Governor("fake-model", rpm=6000, max_concurrency=8, sleep=lambda s: time.sleep(s / 100))
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda i: governor.call(lambda: backend.generate(f"prompt {i}")), range(200)))
+    print(json.dumps(dict(governor.stats, completed=len(results),
+                          concurrency_limit=round(governor.limiter.limit, 2),
+                          backend=backend.stats), indent=2))
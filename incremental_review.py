@@ -0,0 +1,154 @@
+"""
+Page-level incremental re-review of new document versions.
+
+Each version stores a hash per page of its docling text
+(document_versions.pages = [{"page_no", "sha256", "text"}]). When a new
+version of an already reviewed document arrives, its pages are matched to
+the previous reviewed version by hash: only changed pages go to the model, and
+the previous findings on unchanged pages are carried forward, renumbered to
+their new page and marked with "reused": True.
+
+Pages are compared on their extracted text, so a purely visual change (a
+swapped chart with identical text) does not mark a page as changed.
+
+The text, multimodal and synthesis reviews of a new version only see the
+changed pages, so they lack the context of the rest of the document: a
+requirement met on an unchanged page (a disclosure, a defined term) can be
+reported as missing on a changed one. The disclosure stage is not affected,
+it always runs on the full document.
+"""
+import hashlib
+import re
+
+from bson import ObjectId
+
+if __package__:
+    from .pdf_pages import format_page_refs, parse_page_refs
+    from .report_merge import is_duplicate
+else:  # imported as a top-level module
+    from pdf_pages import format_page_refs, parse_page_refs
+    from report_merge import is_duplicate
+
+
+def _normalize(text: str) -> str:
+    text = re.sub(r"<!-- image -->", "", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def page_hashes(pages: list) -> list:
+    """Docling page map -> [{"page_no", "sha256", "text"}] for document_versions."""
+    return [
+        {
+            "page_no": page["page_no"],
+            "sha256": hashlib.sha256(_normalize(page["text"]).encode("utf-8")).hexdigest(),
+            "text": page["text"],
+        }
+        for page in pages
+    ]
+
+
+def diff_pages(previous_pages: list, current_pages: list) -> dict:
+    """
+    Match current pages to previous ones by hash (a page that only moved is
+    unchanged). Returns {"unchanged": {new_page_no: old_page_no}, "changed": [page_no, ...]}.
+    """
+    by_hash = {}
+    for page in previous_pages:
+        by_hash.setdefault(page["sha256"], []).append(page["page_no"])
+    unchanged, changed = {}, []
+    for page in current_pages:
+        candidates = by_hash.get(page["sha256"])
+        if candidates:
+            unchanged[page["page_no"]] = candidates.pop(0)
+        else:
+            changed.append(page["page_no"])
+    return {"unchanged": unchanged, "changed": changed}
+
+
+def carry_forward(findings: list, unchanged: dict, previous_version_id: str, key: str = "page_number",
+                  fresh: list = None) -> list:
+    """
+    Previous findings whose pages are all unchanged, renumbered to the new
+    version's pages and marked as reused. Findings without a page reference
+    (document-level) are carried forward only when the new version has
+    unchanged pages at all, and when `fresh` (the sections of the review of
+    the changed pages) is given, a carried finding that duplicates one of
+    them is dropped in favour of the fresh one.
+    """
+    old_to_new = {old: new for new, old in unchanged.items()}
+    reused = []
+    for finding in findings or []:
+        refs = parse_page_refs(finding.get(key))
+        if refs and not all(r in old_to_new for r in refs):
+            continue
+        if not refs and not old_to_new:
+            continue
+        if fresh and any(is_duplicate(finding, section) for section in fresh):
+            continue
+        finding = dict(finding)
+        if refs:
+            finding[key] = format_page_refs([old_to_new[r] for r in refs])
+        finding["reused"] = True
+        finding["reused_from_version"] = previous_version_id
+        reused.append(finding)
+    return reused
+
+
+def findings_by_page(findings: list, key: str = "page_number") -> dict:
+    """{"<page>": [finding, ...]} ("N/A" for document-level findings); Mongo keys are strings."""
+    grouped = {}
+    for finding in findings or []:
+        for page in parse_page_refs(finding.get(key)) or ["N/A"]:
+            grouped.setdefault(str(page), []).append(finding)
+    return grouped
+
+
+def pages_text(pages: list, page_numbers: list) -> str:
+    """Text of the selected pages with "--- Page N ---" markers, for the text review."""
+    wanted = set(page_numbers)
+    return "\n".join(
+        f"--- Page {page['page_no']} ---\n{re.sub(r'<!-- image -->', '', page['text']).strip()}"
+        for page in pages
+        if page["page_no"] in wanted
+    )
+
+
+def plan_incremental_review(db, version_id: str, pages: list) -> dict:
+    """
+    Find the latest earlier version of the same document that has page hashes
+    and a finished review, and diff against it. Without one every page is
+    "changed" and "previous_review" is None (full review).
+    """
+    plan = {
+        "previous_version_id": None,
+        "previous_review": None,
+        "changed": [page["page_no"] for page in pages],
+        "unchanged": {},
+    }
+    versions = db["document_versions"]
+    current = versions.find_one({"_id": ObjectId(version_id)}, {"document_id": 1})
+    if not current or current.get("document_id") is None:
+        return plan
+
+    candidates = list(versions.find(
+        {"document_id": current["document_id"], "_id": {"$lt": ObjectId(version_id)}, "pages": {"$exists": True}},
+        {"pages.page_no": 1, "pages.sha256": 1},
+    ).sort("_id", -1))
+    if not candidates:
+        return plan
+    # the finished reviews of all candidates in one query, newest candidate wins
+    done = {
+        review["version_id"]: review
+        for review in db["ai-compliance-pre-check"].find(
+            {"version_id": {"$in": [str(previous["_id"]) for previous in candidates]}, "status": "done"}
+        )
+    }
+    for previous in candidates:
+        review = done.get(str(previous["_id"]))
+        if review is None:
+            continue
+        plan.update(diff_pages(previous["pages"], pages))
+        plan["previous_version_id"] = str(previous["_id"])
+        plan["previous_review"] = review
+        break
+    return plan
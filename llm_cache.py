@@ -0,0 +1,214 @@
+"""
+Response cache shared by every review stage.
+
+All stages run at temperature 0.0, so a response is fully determined by the
+model, its generation config, the prompt text and the attached document bytes.
+The key is a SHA-256 over exactly those inputs. Lookups go through an
+in-memory LRU first and then an on-disk tier (one JSON file per entry) with a
+TTL and a total-size bound. The size of the disk tier is tracked in memory;
+the directory is only scanned for eviction when that total exceeds the bound
+(and then trimmed to CACHE_EVICT_TO of it, so the next scan is not due on the
+next store), or every CACHE_EVICT_EVERY stores to catch up with expired entries and with
+other processes writing to the same directory.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(".cache", "llm"))
+CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "256"))
+CACHE_EVICT_EVERY = int(os.getenv("LLM_CACHE_EVICT_EVERY", "200"))
+CACHE_EVICT_TO = float(os.getenv("LLM_CACHE_EVICT_TO", "0.9"))
+CACHE_ENABLED = os.getenv("LLM_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+
+
+def make_key(model: str, config, parts) -> str:
+    """Hash model name, generation config and every prompt part (str or bytes)."""
+    h = hashlib.sha256()
+    h.update(str(model).encode("utf-8"))
+    h.update(b"\x00")
+    h.update(json.dumps(config, sort_keys=True, default=str).encode("utf-8"))
+    for part in parts:
+        h.update(b"\x00")
+        if isinstance(part, (bytes, bytearray)):
+            h.update(b"b:")
+            h.update(hashlib.sha256(part).digest())
+        else:
+            h.update(b"s:")
+            h.update(str(part).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, cache_dir: str = CACHE_DIR, ttl_seconds: int = CACHE_TTL_SECONDS,
+                 max_bytes: int = CACHE_MAX_BYTES, memory_items: int = CACHE_MEMORY_ITEMS):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None  # unknown until the first scan
+        self._stores_since_scan = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _remember(self, key: str, created: float, text: str):
+        self._memory[key] = (created, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None and now - item[0] <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return item[1]
+            self._memory.pop(key, None)
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            entry = None
+        if entry is not None and now - entry.get("created", 0) > self.ttl_seconds:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self._remember(key, entry["created"], entry["text"])
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            pass  # evicted by another process since it was read
+        return entry["text"]
+
+    def set(self, key: str, text: str):
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, text)
+            self.stats["stores"] += 1
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        data = json.dumps({"created": created, "text": text}).encode("utf-8")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._stores_since_scan += 1
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(data) - replaced
+            scan = (
+                self._disk_bytes is None
+                or self._disk_bytes > self.max_bytes
+                or self._stores_since_scan >= CACHE_EVICT_EVERY
+            )
+        if scan:
+            self._evict()
+
+    def _evict(self):
+        """Scan the disk tier, drop expired entries and the oldest ones over max_bytes."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        limit = self.max_bytes * CACHE_EVICT_TO if total > self.max_bytes else self.max_bytes
+        expired_before = time.time() - self.ttl_seconds
+        for mtime, size, path in sorted(entries):
+            if total <= limit and mtime >= expired_before:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self.stats["evictions"] += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._stores_since_scan = 0
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+
+response_cache = ResponseCache()
+
+
+def cached_generate(model: str, config, parts, call, should_store=None) -> str:
+    """
+    Return the cached response text for (model, config, parts), or run `call()`
+    and cache what it returns. Empty responses, and responses rejected by
+    `should_store`, are never cached.
+    """
+    if not CACHE_ENABLED:
+        return call()
+    key = make_key(model, config, parts)
+    text = response_cache.get(key)
+    if text is not None:
+        return text
+    text = call()
+    if text and (should_store is None or should_store(text)):
+        response_cache.set(key, text)
+    return text
+
+
+def cached_stream(model: str, config, parts, open_stream, should_store=None):
+    """
+    Streaming counterpart of cached_generate: yield text chunks from
+    `open_stream()`, caching the joined text once the stream completes. A cache
+    hit is replayed as a single chunk.
+    """
+    if not CACHE_ENABLED:
+        yield from open_stream()
+        return
+    key = make_key(model, config, parts)
+    text = response_cache.get(key)
+    if text is not None:
+        yield text
+        return
+    chunks = []
+    for chunk in open_stream():
+        chunks.append(chunk)
+        yield chunk
+    text = "".join(chunks)
+    if text and (should_store is None or should_store(text)):
+        response_cache.set(key, text)
+
+
+def cache_stats() -> dict:
+    return dict(response_cache.stats)
@@ -2,8 +2,11 @@ from datetime import datetime
 import os
 import base64
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
+from llm_cache import cached_generate
+from sec_index import retrieve_rules
+from clients import get_chat_model
+from governor import governed_call
+from telemetry import track_call
 load_dotenv()
 
 # ------------------------------------------------------------------------------
@@ -71,7 +74,28 @@ schema ={
 }
 
 
-def check_compliance(text_chunk,SEC_RULESET):    
+def _invoke(llm, message):
+    # Rate-limited, with jittered retries on 429/503; recorded by telemetry
+    response = track_call(
+        "gemini-2.5-flash", message, lambda: governed_call("gemini-2.5-flash", lambda: llm.invoke([message]))
+    )
+    return response.content
+
+
+def check_compliance(text_chunk,SEC_RULESET=None,top_k=None):
+    # Retrieval mode: send only the top_k SEC rule passages relevant to the chunk,
+    # taken from SEC_RULESET when given, else from the bundled SEC corpus index
+    if top_k:
+        SEC_RULESET, retrieval_report = retrieve_rules(text_chunk, top_k, SEC_RULESET)
+        full_ruleset_chars = retrieval_report["corpus_chars"]
+        retrieval_report["full_ruleset_chars"] = full_ruleset_chars
+        retrieval_report["ruleset_reduction"] = round(
+            full_ruleset_chars / max(retrieval_report["ruleset_chars"], 1), 1
+        )
+        print("SEC rule retrieval:", retrieval_report)
+    elif SEC_RULESET is None:
+        SEC_RULESET = load_sec_rules()
+
     base_review_prompt_template = f"""
     You are an AI compliance assistant specialized in reviewing financial marketing materials against SEC regulations.
 
@@ -137,11 +161,14 @@ def check_compliance(text_chunk,SEC_RULESET):
        
 
     
-    llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            api_key=api_key,
+    # Shared per process: one client and connection pool for every chunk.
+    # Retries are left to the governor (_invoke), not stacked on LangChain's own.
+    llm = get_chat_model(
+            "gemini-2.5-flash",
             temperature=0,
-            response_schema=schema 
+            api_key=api_key,
+            response_schema=schema,
+            max_retries=0,
         )
 
     # ------------------------------------------------------------------------------
@@ -152,21 +179,28 @@ def check_compliance(text_chunk,SEC_RULESET):
     print("="*80)
 
     # Create the message
+    from langchain_core.messages import HumanMessage
+
     message = HumanMessage(content=base_review_prompt_template)
 
-    # Get response from LLM
-    response = llm.invoke([message])
+    # Get response from LLM (served from the response cache on reruns)
+    response_text = cached_generate(
+        "gemini-2.5-flash",
+        {"temperature": 0, "response_schema": schema},
+        [base_review_prompt_template],
+        lambda: _invoke(llm, message),
+    )
 
     # Display the result
     print("\n" + "="*80)
     print("COMPLIANCE REVIEW RESULT:")
     print("="*80)
-    print(response.content)
+    print(response_text)
     print("="*80)
 
     # Optionally save the result
     #result_file = "compliance_result.txt"
     #with open(result_file, 'w', encoding='utf-8') as f:
      #   f.write(response.content)
-    return response.content
+    return response_text
 
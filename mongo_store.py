@@ -0,0 +1,210 @@
+"""
+Mongo persistence for document versions, reviews, comparisons and findings.
+
+The sync helpers take a pymongo Database. AsyncMongoStore takes either an
+async database (PyMongo's AsyncMongoClient or motor), which it awaits
+directly, or a sync one, in which case each batched operation runs in one
+worker thread instead of one thread hop per call.
+
+- fetch_versions() loads any number of versions with a single $in query;
+- ensure_indexes() declares the indexes for every lookup we make (once per
+  database per process);
+- write_findings() upserts a version's finding records in one unordered
+  bulk_write and drops records that are no longer reported.
+
+    python mongo_store.py     # self-check against mongomock
+"""
+import asyncio
+import threading
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, DeleteMany, ReplaceOne
+
+VERSIONS = "document_versions"
+REVIEWS = "ai-compliance-pre-check"
+COMPARISONS = "document_comparisons"
+FINDINGS = "compliance_findings"
+
+INDEXES = {
+    # previous versions of a document, newest first (incremental review)
+    VERSIONS: [[("document_id", ASCENDING), ("_id", DESCENDING)]],
+    REVIEWS: [[("version_id", ASCENDING), ("status", ASCENDING)]],
+    COMPARISONS: [
+        [("version1_id", ASCENDING), ("version2_id", ASCENDING)],
+        # memoized comparisons, newest first
+        [("pair_key", ASCENDING), ("prompt_version", ASCENDING), ("compared_at", DESCENDING)],
+    ],
+    FINDINGS: [[("version_id", ASCENDING), ("kind", ASCENDING), ("page", ASCENDING)]],
+}
+
+_ensured = set()
+_ensured_lock = threading.Lock()
+
+
+def _db_key(db) -> tuple:
+    return id(getattr(db, "client", None)), db.name
+
+
+def _claim_indexes(db) -> bool:
+    """True the first time this process sees `db`."""
+    with _ensured_lock:
+        key = _db_key(db)
+        if key in _ensured:
+            return False
+        _ensured.add(key)
+        return True
+
+
+def _object_ids(version_ids) -> list:
+    return [ObjectId(v) if not isinstance(v, ObjectId) else v for v in version_ids]
+
+
+def _finding_ops(version_id: str, findings: list, kind: str, page_key: str) -> list:
+    ops, ids = [], []
+    for index, finding in enumerate(findings or []):
+        finding_id = str(finding.get("id") or index)
+        page = finding.get(page_key, "N/A")
+        record_id = f"{version_id}:{kind}:{finding_id}"
+        ids.append(record_id)
+        ops.append(ReplaceOne({"_id": record_id}, {
+            "_id": record_id,
+            "version_id": version_id,
+            "kind": kind,
+            "finding_id": finding_id,
+            "page": ", ".join(map(str, page)) if isinstance(page, list) else str(page),
+            "reused": bool(finding.get("reused")),
+            "finding": finding,
+        }, upsert=True))
+    ops.append(DeleteMany({"version_id": version_id, "kind": kind, "_id": {"$nin": ids}}))
+    return ops
+
+
+# ---------------------------------------------------------------------------
+# Sync helpers (pymongo Database)
+# ---------------------------------------------------------------------------
+
+def ensure_indexes(db):
+    if not _claim_indexes(db):
+        return
+    for collection, specs in INDEXES.items():
+        for keys in specs:
+            db[collection].create_index(keys)
+
+
+def fetch_versions(db, version_ids, projection: dict = None) -> dict:
+    """{str(_id): version} for every id that exists, in one query."""
+    cursor = db[VERSIONS].find({"_id": {"$in": _object_ids(version_ids)}}, projection)
+    return {str(doc["_id"]): doc for doc in cursor}
+
+
+def write_findings(db, version_id: str, findings: list, kind: str, page_key: str = "page_number") -> int:
+    """Replace the `kind` finding records of a version in one bulk write."""
+    result = db[FINDINGS].bulk_write(_finding_ops(version_id, findings, kind, page_key), ordered=False)
+    return result.upserted_count + result.modified_count
+
+
+def find_comparison(db, pair_key: str, prompt_version: str):
+    """Latest stored comparison of a version pair under `prompt_version`, or None."""
+    return db[COMPARISONS].find_one(
+        {"pair_key": pair_key, "prompt_version": prompt_version}, sort=[("compared_at", DESCENDING)]
+    )
+
+
+def save_comparison(db, entry: dict) -> str:
+    return str(db[COMPARISONS].insert_one(entry).inserted_id)
+
+
+# ---------------------------------------------------------------------------
+# Async store
+# ---------------------------------------------------------------------------
+
+def _is_async_db(db) -> bool:
+    module = type(db).__module__
+    return module.startswith("motor") or module.startswith("pymongo.asynchronous")
+
+
+class AsyncMongoStore:
+    def __init__(self, db):
+        self.db = db
+        self.is_async = _is_async_db(db)
+
+    async def ensure_indexes(self):
+        if not self.is_async:
+            return await asyncio.to_thread(ensure_indexes, self.db)
+        if not _claim_indexes(self.db):
+            return
+        await asyncio.gather(*(
+            self.db[collection].create_index(keys)
+            for collection, specs in INDEXES.items()
+            for keys in specs
+        ))
+
+    async def fetch_versions(self, version_ids, projection: dict = None) -> dict:
+        if not self.is_async:
+            return await asyncio.to_thread(fetch_versions, self.db, version_ids, projection)
+        cursor = self.db[VERSIONS].find({"_id": {"$in": _object_ids(version_ids)}}, projection)
+        return {str(doc["_id"]): doc for doc in await cursor.to_list(None)}
+
+    async def write_findings(self, version_id: str, findings: list, kind: str, page_key: str = "page_number") -> int:
+        if not self.is_async:
+            return await asyncio.to_thread(write_findings, self.db, version_id, findings, kind, page_key)
+        result = await self.db[FINDINGS].bulk_write(
+            _finding_ops(version_id, findings, kind, page_key), ordered=False
+        )
+        return result.upserted_count + result.modified_count
+
+    async def find_comparison(self, pair_key: str, prompt_version: str):
+        if not self.is_async:
+            return await asyncio.to_thread(find_comparison, self.db, pair_key, prompt_version)
+        return await self.db[COMPARISONS].find_one(
+            {"pair_key": pair_key, "prompt_version": prompt_version}, sort=[("compared_at", DESCENDING)]
+        )
+
+    async def save_comparison(self, entry: dict, differences: list = None, version_id: str = None) -> str:
+        """
+        Insert a comparison and, when given, bulk-write its differences as
+        finding records of `version_id` (kind "comparison:<comparison id>").
+        """
+        if not self.is_async:
+            inserted_id = await asyncio.to_thread(save_comparison, self.db, entry)
+        else:
+            inserted_id = str((await self.db[COMPARISONS].insert_one(entry)).inserted_id)
+        if differences:
+            await self.write_findings(version_id or inserted_id, differences, "comparison:" + inserted_id, "location")
+        return inserted_id
+
+
+if __name__ == "__main__":
+    import mongomock
+
+    db = mongomock.MongoClient()["po2"]
+    v1 = db[VERSIONS].insert_one({"document_id": "doc", "pages": []}).inserted_id
+    v2 = db[VERSIONS].insert_one({"document_id": "doc", "pages": []}).inserted_id
+
+    ensure_indexes(db)
+    versions = fetch_versions(db, [str(v1), str(v2), str(ObjectId())])
+    assert set(versions) == {str(v1), str(v2)}
+
+    findings = [{"id": "a", "page_number": "1"}, {"id": "b", "page_number": "2", "reused": True}]
+    write_findings(db, str(v2), findings, "synthesis")
+    write_findings(db, str(v2), findings[:1], "synthesis")  # rerun drops "b"
+    assert [r["finding_id"] for r in db[FINDINGS].find({"version_id": str(v2)})] == ["a"]
+
+    async def _async_check():
+        store = AsyncMongoStore(db)  # sync database -> batched thread fallback
+        await store.ensure_indexes()
+        both = await store.fetch_versions([v1, v2])
+        comparison_id = await store.save_comparison(
+            {"version1_id": v1, "version2_id": v2, "pair_key": "k", "prompt_version": "1"},
+            [{"location": "page 1"}],
+            str(v2),
+        )
+        assert await store.find_comparison("k", "2") is None
+        assert str((await store.find_comparison("k", "1"))["_id"]) == comparison_id
+        return both, comparison_id
+
+    both, comparison_id = asyncio.run(_async_check())
+    assert len(both) == 2 and db[COMPARISONS].count_documents({}) == 1
+    assert db[FINDINGS].count_documents({"kind": "comparison:" + comparison_id}) == 1
+    print("indexes:", {name: sorted(db[name].index_information()) for name in INDEXES})
+    print("mongo_store self-check passed")
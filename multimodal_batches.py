@@ -0,0 +1,63 @@
+"""
+Page-batched multimodal review of long PDFs.
+
+Shared by the stage script (test_multimodal.py) and the service
+(complience.py), which each pass their own single-document review. A PDF
+longer than MULTIMODAL_BATCH_MIN_PAGES is split into overlapping page ranges
+reviewed in parallel; the model numbers the pages of each batch 1..k, so every
+partial report is renumbered to absolute pages before
+report_merge.merge_batch_reports collapses the findings repeated on the
+overlapping pages.
+
+A batch whose review raised is reported in batches.failed, like one whose
+response could not be parsed, and the other batches are kept.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+if __package__:
+    from .pdf_pages import extract_pages, page_batches, page_count, renumber_pages
+    from .report_merge import merge_batch_reports
+    from .telemetry import propagate
+else:  # imported as a top-level module by the stage scripts
+    from pdf_pages import extract_pages, page_batches, page_count, renumber_pages
+    from report_merge import merge_batch_reports
+    from telemetry import propagate
+
+MULTIMODAL_BATCH_PAGES = int(os.getenv("MULTIMODAL_BATCH_PAGES", "10"))
+MULTIMODAL_BATCH_OVERLAP = int(os.getenv("MULTIMODAL_BATCH_OVERLAP", "1"))
+MULTIMODAL_BATCH_WORKERS = int(os.getenv("MULTIMODAL_BATCH_WORKERS", "4"))
+# Batch only PDFs longer than this; 0 never batches.
+MULTIMODAL_BATCH_MIN_PAGES = int(os.getenv("MULTIMODAL_BATCH_MIN_PAGES", "16"))
+
+
+def _review_batch(review, document, pages: list) -> dict:
+    try:
+        result = review(extract_pages(document.data, pages))
+    except Exception as e:
+        # shaped like an unparseable response, so merge_batch_reports marks it failed
+        return {"document_name": "", "sections": [], "raw_response": None, "error": f"{type(e).__name__}: {e}"}
+    renumber_pages(result.get("sections", []), pages)
+    return result
+
+
+def review_batched(review, document, batch_pages: int = MULTIMODAL_BATCH_PAGES,
+                   overlap: int = MULTIMODAL_BATCH_OVERLAP,
+                   min_pages: int = MULTIMODAL_BATCH_MIN_PAGES) -> dict:
+    """
+    `review(pdf) -> report` over overlapping page batches of `document` (a
+    DocumentHandle), merged into one report. Documents of at most `min_pages`
+    pages (any length when it is 0), or that fit in one batch, are reviewed
+    whole.
+    """
+    total = page_count(document.data)
+    if not min_pages or total <= min_pages:
+        return review(document)
+    batches = page_batches(total, batch_pages, overlap)
+    if len(batches) <= 1:
+        return review(document)
+
+    run = propagate(lambda pages: _review_batch(review, document, pages))
+    with ThreadPoolExecutor(max_workers=min(MULTIMODAL_BATCH_WORKERS, len(batches))) as pool:
+        reports = list(pool.map(run, batches))
+    return merge_batch_reports(reports, batches)
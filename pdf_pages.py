@@ -0,0 +1,81 @@
+"""
+Page-level helpers for sending part of a PDF to the model.
+
+extract_pages() copies selected pages into a new PDF (pypdfium2, which docling
+already depends on). The model numbers the pages of that subset 1..k, so
+renumber_pages() maps page references in its findings back to the original
+page numbers.
+"""
+import io
+import re
+
+
+def page_count(pdf_bytes: bytes) -> int:
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def extract_pages(pdf_bytes: bytes, page_numbers: list) -> bytes:
+    """A PDF holding only `page_numbers` (1-based, in the given order)."""
+    import pypdfium2 as pdfium
+
+    src = pdfium.PdfDocument(pdf_bytes)
+    dst = pdfium.PdfDocument.new()
+    try:
+        dst.import_pages(src, [n - 1 for n in page_numbers])
+        buffer = io.BytesIO()
+        dst.save(buffer)
+        return buffer.getvalue()
+    finally:
+        dst.close()
+        src.close()
+
+
+def page_batches(total_pages: int, batch_pages: int, overlap: int = 0) -> list:
+    """
+    1-based page ranges of at most `batch_pages` covering 1..total_pages, each
+    starting `overlap` pages before the previous one ends (footers, tables
+    continued across a page break).
+    """
+    overlap = max(0, min(overlap, batch_pages - 1))
+    batches, start = [], 1
+    while start <= total_pages:
+        end = min(start + batch_pages - 1, total_pages)
+        batches.append(list(range(start, end + 1)))
+        if end == total_pages:
+            break
+        start = end + 1 - overlap
+    return batches
+
+
+def parse_page_refs(value) -> list:
+    """Page numbers referenced by a finding: "3", "2-4", "1, 5", "Page 2"; [] for "N/A"."""
+    if isinstance(value, int):
+        return [value]
+    pages = []
+    for start, end in re.findall(r"(\d+)(?:\s*[-–]\s*(\d+))?", str(value or "")):
+        first = int(start)
+        last = int(end) if end else first
+        pages.extend(range(first, last + 1) if last >= first else [first])
+    return pages
+
+
+def format_page_refs(pages: list) -> str:
+    return ", ".join(str(p) for p in pages)
+
+
+def renumber_pages(findings: list, page_numbers: list, key: str = "page_number") -> list:
+    """
+    Rewrite `key` of each finding from subset page numbers (1..k) to the
+    original `page_numbers`. References outside the subset are left as-is.
+    """
+    for finding in findings:
+        refs = parse_page_refs(finding.get(key))
+        if refs and all(1 <= r <= len(page_numbers) for r in refs):
+            finding[key] = format_page_refs([page_numbers[r - 1] for r in refs])
+    return findings
@@ -0,0 +1,194 @@
+"""
+Local-first detection of numbers that should carry a "%".
+
+The typo stage used to send the whole PDF to the model to find them. Most
+cases follow a few rules that can be checked on the docling page map:
+
+- a table whose label (the heading above it) names a percentage measure -
+  allocation, breakdown, distribution, return, yield, expense ratio, weight -
+  or matches a negative example of data/examples_4.txt, while neither that
+  label, its column labels nor its numbers show a "%";
+- a column or row labelled with such a measure whose numbers have no "%";
+- a text line that is one of the negative examples ("Sector Allocation",
+  "Net Returns", "Duration / Curve / Currency 10") without its "%".
+
+As the prompt asks, a table is flagged at its label, not per value. These
+findings are returned directly. Lines and tables that look like a percentage
+but are not clear-cut (a return figure in prose, a column where only some
+numbers have a "%") are returned as ambiguous snippets; only those need the
+model.
+"""
+import re
+
+PERCENT_TERMS = re.compile(
+    r"\b(returns?|returned|yields?|expense ratios?|allocations?|weights?|weightings?|distributions?|breakdowns?|"
+    r"exposures?|composition|contributions?|growth|turnover|annuali[sz]ed|cumulative|ytd)\b",
+    re.IGNORECASE,
+)
+_NUMBER = re.compile(
+    r"(?<![\w$./-])[-+(]?\d{1,3}(?:,\d{3})*(?:\.\d+)?\)?"
+    r"(?![\d/-]|\s*(?:%|percent|bps|basis point|years?|yrs?|months?|days?|million|billion|[mbk]\b))",
+    re.IGNORECASE,
+)
+_CELL_NUMBER = re.compile(r"[-+(]?\d{1,3}(?:,\d{3})*(?:\.\d+)?\)?\s*(%?)")
+_SEPARATOR = re.compile(r"\|[\s\-:|]*\|?")
+_HEADING_MAX_WORDS = 10
+# Most ambiguous snippets sent to the model.
+MAX_SNIPPETS = 80
+MAX_SNIPPET_CHARS = 400
+
+
+def _stem(label: str) -> str:
+    """Lowercase words of a label, without footnote markers and trailing numbers."""
+    return " ".join(re.findall(r"[a-z]+", re.sub(r"\d[\d,.]*", " ", label.lower())))
+
+
+def negative_labels(examples_text: str) -> set:
+    """Label stems of the "Negative Example" lines of examples_4.txt."""
+    return {
+        _stem(m.group(1))
+        for m in re.finditer(r"Negative Example\s*:\s*(.+)", examples_text or "", re.IGNORECASE)
+        if _stem(m.group(1))
+    }
+
+
+def _label(line: str) -> str:
+    return line.strip().lstrip("#").strip()
+
+
+def _cells(line: str) -> list:
+    return [c.strip() for c in line.strip().strip("|").split("|")]
+
+
+def _cell_value(cell: str):
+    """None for a non-numeric cell, else True/False for whether it carries a "%"."""
+    match = _CELL_NUMBER.fullmatch(cell.replace("\u00a0", " ").strip())
+    if not match or re.fullmatch(r"(19|20)\d\d", cell.strip()):  # years are not measures
+        return None
+    return bool(match.group(1))
+
+
+def _is_percent_label(label: str, negatives: set) -> bool:
+    return "%" not in label and bool(PERCENT_TERMS.search(label) or _stem(label) in negatives)
+
+
+def _blocks(text: str):
+    """(kind, lines, label) blocks of a docling page: "table" with the heading above it, or "line"."""
+    lines = text.splitlines()
+    previous = ""
+    i = 0
+    while i < len(lines):
+        stripped = lines[i].strip()
+        if stripped.startswith("|"):
+            table = []
+            while i < len(lines) and lines[i].strip().startswith("|"):
+                if not _SEPARATOR.fullmatch(lines[i].strip()):
+                    table.append(lines[i])
+                i += 1
+            yield "table", table, previous
+            previous = ""
+            continue
+        if stripped and stripped != "<!-- image -->":
+            yield "line", [stripped], None
+            previous = _label(stripped)
+        i += 1
+
+
+def _finding(page, context: str, recommendation: str) -> dict:
+    return {"page": str(page), "context": context[:MAX_SNIPPET_CHARS], "recommendation": recommendation, "source": "local"}
+
+
+def _check_table(page, rows: list, heading: str, negatives: set, found: list, ambiguous: list):
+    header, body = rows[0], rows[1:]
+    values = [[_cell_value(c) for c in row] for row in body]
+    numbers = [v for row in values for v in row if v is not None]
+    if len(numbers) < 2 or "%" in heading or any("%" in h for h in header):
+        return
+    context = " / ".join(" | ".join(r) for r in rows[:3])
+
+    if heading and len(heading.split()) <= _HEADING_MAX_WORDS and _is_percent_label(heading, negatives):
+        if not any(numbers):
+            found.append(_finding(page, f"{heading}: {context}", f"Insert '%' in the label: '{heading} (%)'."))
+        elif not all(numbers):
+            ambiguous.append({"page": page, "context": f"{heading}\n" + "\n".join(" | ".join(r) for r in rows)})
+        return
+
+    flagged = False
+    for col, label in enumerate(header):
+        column = [row[col] for row in values if col < len(row) and row[col] is not None]
+        if len(column) < 2 or not _is_percent_label(label, negatives):
+            continue
+        if not any(column):
+            found.append(_finding(page, f"{label}: {context}", f"Insert '%' in the column label: '{label} (%)'."))
+            flagged = True
+        elif not all(column):
+            ambiguous.append({"page": page, "context": "\n".join(" | ".join(r) for r in rows)})
+            return
+    if flagged:
+        return
+    for row, row_values in zip(body, values):
+        cells = [v for v in row_values[1:] if v is not None]
+        if row and cells and _is_percent_label(row[0], negatives) and not any(cells):
+            found.append(_finding(
+                page, " | ".join(row), f"Insert '%' after the values of '{row[0]}' or in its label: '{row[0]} (%)'."
+            ))
+
+
+def _check_line(page, line: str, negatives: set, found: list, ambiguous: list):
+    if "%" in line or "percent" in line.lower():
+        return
+    label = _label(line)
+    if _stem(line) in negatives:
+        # "Currency 10" ends in a value; "Distribution3,4" and "BREAKDOWN 2" end in footnote markers
+        value = re.search(r"\s(\d{2,}|\d+\.\d+)$", label)
+        if value:
+            found.append(_finding(page, label, f"Insert '%' after the value: '{label}%'."))
+        else:
+            found.append(_finding(page, label, f"Insert '%' in the label: '{label} (%)'."))
+    elif PERCENT_TERMS.search(line) and _NUMBER.search(line):
+        ambiguous.append({"page": page, "context": label})
+
+
+def detect_missing_percent(pages: list, examples_text: str = "") -> dict:
+    """
+    Scan docling pages ([{"page_no", "text"}]). Returns {"details": [...] (the
+    missing_percent_details shape, source "local"), "ambiguous": [{"page",
+    "context"}] for the model, "stats"}.
+    """
+    negatives = negative_labels(examples_text)
+    found, ambiguous = [], []
+    for page in pages:
+        blocks = list(_blocks(page.get("text") or ""))
+        for index, (kind, lines, heading) in enumerate(blocks):
+            if kind == "table":
+                rows = [_cells(line) for line in lines]
+                if rows:
+                    _check_table(page["page_no"], rows, heading or "", negatives, found, ambiguous)
+            elif index + 1 < len(blocks) and blocks[index + 1][0] == "table":
+                continue  # the label of the next table: its "%" may be in the table, so the table decides
+            else:
+                _check_line(page["page_no"], lines[0], negatives, found, ambiguous)
+
+    details, seen = [], set()
+    for finding in found:
+        key = (finding["page"], finding["recommendation"])
+        if key not in seen:
+            seen.add(key)
+            details.append(finding)
+
+    seen, snippets = set(), []
+    for snippet in ambiguous:
+        key = (snippet["page"], snippet["context"])
+        if key not in seen:
+            seen.add(key)
+            snippets.append(dict(snippet, context=snippet["context"][:MAX_SNIPPET_CHARS]))
+    return {
+        "details": details,
+        "ambiguous": snippets[:MAX_SNIPPETS],
+        "stats": {"pages": len(pages), "local_findings": len(details), "ambiguous_snippets": len(snippets)},
+    }
+
+
+def snippets_text(snippets: list) -> str:
+    """Ambiguous snippets with the "Page N:" markers the typo prompt expects."""
+    return "\n\n".join(f"Page {s['page']}: {s['context']}" for s in snippets)
@@ -7,11 +7,23 @@ import uuid
 from typing import Dict, List  # New import
 
 from bson import ObjectId  # Import ObjectId
-from docling.document_converter import DocumentConverter
 from pymongo.database import Database  # Import Database for type hinting
 from starlette.concurrency import run_in_threadpool
 
 from config.logger import get_logger
+from services.conversion_cache import convert_pdf
+from services.incremental_review import (
+    carry_forward,
+    findings_by_page,
+    page_hashes,
+    pages_text,
+    plan_incremental_review,
+)
+from services.document_handle import open_document
+from services.mongo_store import ensure_indexes, write_findings
+from services.pdf_pages import extract_pages, renumber_pages
+from services.report_merge import page_sort_key
+from services import telemetry
 from infrastructure.db.connection import get_db_connection
 from infrastructure.email.sendgrid_service import (
     send_sendgrid_email,
@@ -29,7 +41,7 @@ from services import (  # Import services to fetch user, project, and document d
 from services.compliance import run_pdf_schema_extraction  # New import
 from services.compliance import (
     run_disclosure_analysis,
-    run_multimodal_review,
+    run_multimodal_review_batched,
     run_synthesis_review,
     run_text_review,
     run_typo_analysis,
@@ -37,49 +49,107 @@ from services.compliance import (
 
 logger = get_logger(__name__)
 
-converter = DocumentConverter()
-
 
 async def run_full_pipeline(version_id: str, local_pdf: str, user_email: str):
     await run_in_threadpool(_sync_full_pipeline, version_id, local_pdf, user_email)
 
 
 def _sync_full_pipeline(version_id: str, local_pdf: str, user_email: str):
+    # Every model call made for this version is attributed to it in telemetry
+    with telemetry.scope(document=version_id):
+        _run_pipeline_stages(version_id, local_pdf, user_email)
+
+
+def _run_pipeline_stages(version_id: str, local_pdf: str, user_email: str):
     db = get_db_connection()
     reviews = db["ai-compliance-pre-check"]
     document_versions_collection = db["document_versions"]
 
     logger.info(f"Starting pipeline for document: {version_id}")
     try:
+        ensure_indexes(db)
+
         # 1. Upload raw PDF
         # gcs_pdf = upload_file(bucket, local_pdf, f"raw/{version_id}.pdf")
         # reviews.update_one({"version_id": version_id}, {"$set": {"gcs_pdf": gcs_pdf, "timestamp": datetime.now()}})
         # logger.info(f"Uploaded raw PDF to GCS: {gcs_pdf}")
 
         # 2. Text extraction (this was blocking before!)
-        result = converter.convert(local_pdf)
-        markdown = result.document.export_to_markdown(strict_text=True)
-        clean_text = re.sub(r"<!-- image -->", "", markdown)
+        conversion = convert_pdf(local_pdf)
+        logger.info(
+            f"Docling conversion for {version_id}: cached={conversion['cached']} in {conversion['seconds']}s"
+        )
+        clean_text = re.sub(r"<!-- image -->", "", conversion["markdown"])
+        # Read once and shared by every stage; the stored GCS copy is sent by URI
+        version = document_versions_collection.find_one({"_id": ObjectId(version_id)}, {"gcp_path": 1}) or {}
+        document = open_document(local_pdf, uri=version.get("gcp_path"))
+
+        # Per-page hashes; against the previous reviewed version of this document
+        # only the changed pages are reviewed and the rest is carried forward
+        pages = page_hashes(conversion["pages"])
+        document_versions_collection.update_one(
+            {"_id": ObjectId(version_id)}, {"$set": {"pages": pages}}
+        )
+        plan = plan_incremental_review(db, version_id, pages)
+        previous_review = plan["previous_review"]
+        changed = plan["changed"]
+        if previous_review is None:
+            review_text, review_pdf = clean_text, document
+        else:
+            logger.info(
+                f"Incremental review of {version_id} against {plan['previous_version_id']}: "
+                f"changed pages {changed}, unchanged {sorted(plan['unchanged'])}"
+            )
+            review_text = pages_text(pages, changed)
+            review_pdf = open_document(extract_pages(document.data, changed)) if changed else None
 
         # 3. Text review
-        text_res = run_text_review(clean_text)
+        with telemetry.scope(stage="text_review"):
+            text_res = run_text_review(review_text)
         reviews.update_one(
             {"version_id": version_id}, {"$set": {"text_review": text_res}}
         )
 
         # 4. Multimodal review
-        pdf_bytes = open(local_pdf, "rb").read()
-        multi_res = run_multimodal_review(pdf_bytes)
+        if review_pdf is None:
+            multi_res = {
+                "document_name": "Multimodal Review Skipped (No Changed Pages)",
+                "sections": [],
+                "overall_conclusion": "No page changed since the previous version.",
+            }
+        else:
+            with telemetry.scope(stage="multimodal"):
+                multi_res = run_multimodal_review_batched(review_pdf)
+            if previous_review is not None:
+                # the model numbered the pages of the subset PDF 1..k
+                renumber_pages(multi_res.get("sections", []), changed)
         reviews.update_one(
             {"version_id": version_id}, {"$set": {"multimodal_review": multi_res}}
         )
 
         # 5. Synthesis
-        synth_res = run_synthesis_review(text_res, multi_res, pdf_bytes)
+        if review_pdf is None:
+            synth_res = {"document_name": "Document - Synthesized Compliance Report", "sections": []}
+        else:
+            with telemetry.scope(stage="synthesis"):
+                synth_res = run_synthesis_review(text_res, multi_res, review_pdf)
+
+        reused_count = 0
+        if previous_review is not None:
+            reused = carry_forward(
+                (previous_review.get("synthesis_review") or {}).get("sections"),
+                plan["unchanged"],
+                plan["previous_version_id"],
+                fresh=synth_res.get("sections"),
+            )
+            reused_count += len(reused)
+            synth_res["sections"] = sorted(synth_res.get("sections", []) + reused, key=page_sort_key)
 
         # Add new fields to each section
         if "sections" in synth_res and isinstance(synth_res["sections"], list):
             for section in synth_res["sections"]:
+                if section.get("reused"):
+                    continue  # keeps its id and reviewer decision from the previous version
                 section["id"] = str(uuid.uuid4())
                 section["isAccepted"] = False
                 section["isRejected"] = False
@@ -89,17 +159,41 @@ def _sync_full_pipeline(version_id: str, local_pdf: str, user_email: str):
                     section["page_number"] = str(section["page_number"])
 
         reviews.update_one(
-            {"version_id": version_id}, {"$set": {"synthesis_review": synth_res}}
+            {"version_id": version_id},
+            {"$set": {
+                "synthesis_review": synth_res,
+                "findings_by_page": findings_by_page(synth_res.get("sections")),
+            }},
         )
 
-        # 6. Typo & date
-        typo_res = run_typo_analysis(pdf_bytes)
+        # 6. Typo & date: detected locally on the docling text of the reviewed pages,
+        # so page numbers are already absolute
+        if review_pdf is None:
+            typo_res = {"missing_percent_details": []}
+        else:
+            reviewed = set(changed)
+            with telemetry.scope(stage="typo"):
+                typo_res = run_typo_analysis(
+                    review_pdf, [page for page in conversion["pages"] if page["page_no"] in reviewed]
+                )
+        if previous_review is not None:
+            details = typo_res.setdefault("missing_percent_details", [])
+            reused = carry_forward(
+                (previous_review.get("typo_analysis") or {}).get("missing_percent_details"),
+                plan["unchanged"],
+                plan["previous_version_id"],
+                key="page",
+            )
+            reused_count += len(reused)
+            details.extend(reused)
 
         # Add new fields to each missing percent detail
         if "missing_percent_details" in typo_res and isinstance(
             typo_res["missing_percent_details"], list
         ):
             for detail in typo_res["missing_percent_details"]:
+                if detail.get("reused"):
+                    continue
                 detail["id"] = str(uuid.uuid4())
                 detail["isAccepted"] = False
                 detail["isRejected"] = False
@@ -109,12 +203,25 @@ def _sync_full_pipeline(version_id: str, local_pdf: str, user_email: str):
                     detail["page"] = str(detail["page"])
 
         reviews.update_one(
-            {"version_id": version_id}, {"$set": {"typo_analysis": typo_res}}
+            {"version_id": version_id},
+            {"$set": {
+                "typo_analysis": typo_res,
+                "incremental_review": {
+                    "previous_version_id": plan["previous_version_id"],
+                    "changed_pages": changed,
+                    "unchanged_pages": {str(new): old for new, old in plan["unchanged"].items()},
+                    "reused_findings": reused_count,
+                },
+            }},
         )
         # 7. Disclosure
-        disclosure_res = run_disclosure_analysis(
-            "data/Disclosure Library_TEMPLATE_DRAFT.xlsx", pdf_bytes
-        )
+        with telemetry.scope(stage="disclosure"):
+            disclosure_res = run_disclosure_analysis(
+                "data/Disclosure Library_TEMPLATE_DRAFT.xlsx", document, conversion["pages"]
+            )
+        if disclosure_res is None:
+            # an API error would otherwise report every unsettled disclosure as missing
+            raise RuntimeError("Disclosure analysis failed: the disclosure extraction model call failed")
         # Filter and add new fields to each disclosure detail
         processed_disclosure_analysis = []
         for d in disclosure_res:
@@ -137,9 +244,18 @@ def _sync_full_pipeline(version_id: str, local_pdf: str, user_email: str):
             {"$set": {"disclosure_analysis": processed_disclosure_analysis}},
         )
 
-  
-        # 8. Mark done
-        reviews.update_one({"version_id": version_id}, {"$set": {"status": "done"}})
+        # One finding record per finding, so they can be queried by version and page
+        for kind, findings, page_key in (
+            ("synthesis", synth_res.get("sections"), "page_number"),
+            ("typo", typo_res.get("missing_percent_details"), "page"),
+            ("disclosure", processed_disclosure_analysis, "pages"),
+        ):
+            write_findings(db, version_id, findings, kind, page_key)
+
+        # 8. Mark done, with where the prompt tokens and seconds went
+        usage = telemetry.report(document=version_id)["documents"].get(version_id, {})
+        logger.info(f"Model usage for {version_id}: {json.dumps(usage)}")
+        reviews.update_one({"version_id": version_id}, {"$set": {"status": "done", "model_usage": usage}})
         logger.info(f"Pipeline complete for {version_id}; status set to 'done'.")
 
         document_versions_collection.update_one(
@@ -0,0 +1,165 @@
+"""
+Provider-side caching of static prompt prefixes.
+
+The review prompts are a large static prefix (rules, FAQ, examples,
+disclosure library) followed by a small per-document suffix. A prefix cache
+handle creates a cached context for the prefix once, reuses it until shortly
+before it expires and then refreshes it, so each call only sends the suffix.
+
+GeminiPrefixCache uses the google-genai caches API. LocalPrefixCache is an
+in-process stand-in with the same lifecycle that sends the prefix inline; it
+is used when no provider cache is available and in tests. Its contexts expire
+after the same TTL, and at most PREFIX_CACHE_MAX_HANDLES handles (one per
+distinct prefix) are kept, least recently used first out.
+"""
+import abc
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+PREFIX_CACHE_TTL_SECONDS = int(os.getenv("PREFIX_CACHE_TTL_SECONDS", "3600"))
+PREFIX_CACHE_BACKEND = os.getenv("PREFIX_CACHE_BACKEND", "gemini")
+PREFIX_CACHE_MAX_HANDLES = int(os.getenv("PREFIX_CACHE_MAX_HANDLES", "64"))
+
+# Refresh this long before the provider drops the context so an in-flight
+# request never references an expired cache.
+REFRESH_MARGIN_SECONDS = 60
+
+
+class PrefixCacheHandle(abc.ABC):
+    def __init__(self, model: str, prefix: str, ttl_seconds: int = PREFIX_CACHE_TTL_SECONDS):
+        self.model = model
+        self.prefix = prefix
+        self.prefix_sha256 = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        self.ttl_seconds = ttl_seconds
+        self.name = None
+        self.expires_at = 0.0
+        self.stats = {"creates": 0, "refreshes": 0, "reuses": 0}
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _create(self) -> str:
+        """Create the cached context for the prefix and return its name."""
+
+    def _refresh(self) -> bool:
+        """Extend the existing context; return False to fall back to _create."""
+        return False
+
+    def get(self) -> str:
+        """Return the cached-context name, creating or refreshing it if needed."""
+        with self._lock:
+            now = time.time()
+            if self.name and now < self.expires_at - REFRESH_MARGIN_SECONDS:
+                self.stats["reuses"] += 1
+                return self.name
+            if self.name and now < self.expires_at and self._refresh():
+                self.stats["refreshes"] += 1
+            else:
+                self.name = self._create()
+                self.stats["creates"] += 1
+            self.expires_at = time.time() + self.ttl_seconds
+            return self.name
+
+    @abc.abstractmethod
+    def build_request(self, suffix_parts: list, config: dict = None) -> tuple:
+        """Return (contents, config) for a generate call on top of the prefix."""
+
+
+class GeminiPrefixCache(PrefixCacheHandle):
+    def __init__(self, client, model: str, prefix: str, ttl_seconds: int = PREFIX_CACHE_TTL_SECONDS):
+        super().__init__(model, prefix, ttl_seconds)
+        self.client = client
+
+    def _create(self) -> str:
+        from google.genai import types
+
+        cache = self.client.caches.create(
+            model=self.model,
+            config=types.CreateCachedContentConfig(
+                contents=[self.prefix],
+                display_name=f"review-prefix-{self.prefix_sha256[:12]}",
+                ttl=f"{self.ttl_seconds}s",
+            ),
+        )
+        logger.info("Created prompt prefix cache %s for %s", cache.name, self.model)
+        return cache.name
+
+    def _refresh(self) -> bool:
+        from google.genai import types
+
+        try:
+            self.client.caches.update(
+                name=self.name,
+                config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"),
+            )
+            return True
+        except Exception as e:
+            logger.warning("Refreshing prompt prefix cache %s failed: %s", self.name, e)
+            return False
+
+    def build_request(self, suffix_parts: list, config: dict = None) -> tuple:
+        try:
+            name = self.get()
+        except Exception as e:
+            # Provider caching is an optimisation; never fail the review over it.
+            logger.warning("Prompt prefix cache unavailable, sending prefix inline: %s", e)
+            return [self.prefix] + list(suffix_parts), config
+        return list(suffix_parts), dict(config or {}, cached_content=name)
+
+
+class LocalPrefixCache(PrefixCacheHandle):
+    def __init__(self, model: str, prefix: str, ttl_seconds: int = PREFIX_CACHE_TTL_SECONDS):
+        super().__init__(model, prefix, ttl_seconds)
+        self.contexts = {}  # name -> (prefix, expires_at), dropped once expired
+
+    def _expire(self, now: float):
+        for name in [n for n, (_, expires_at) in self.contexts.items() if expires_at <= now]:
+            del self.contexts[name]
+
+    def _create(self) -> str:
+        now = time.time()
+        self._expire(now)
+        name = f"local/{self.prefix_sha256[:16]}/{self.stats['creates']}"
+        self.contexts[name] = (self.prefix, now + self.ttl_seconds)
+        return name
+
+    def _refresh(self) -> bool:
+        now = time.time()
+        self._expire(now)
+        if self.name not in self.contexts:
+            return False
+        self.contexts[self.name] = (self.prefix, now + self.ttl_seconds)
+        return True
+
+    def build_request(self, suffix_parts: list, config: dict = None) -> tuple:
+        name = self.get()
+        return [self.contexts[name][0]] + list(suffix_parts), config
+
+
+_handles = OrderedDict()
+_handles_lock = threading.Lock()
+
+
+def get_prefix_cache(client, model: str, prefix: str) -> PrefixCacheHandle:
+    """One handle per (backend, model, prefix); a changed prefix gets a new context."""
+    backend = PREFIX_CACHE_BACKEND if client is not None else "local"
+    key = (backend, model, hashlib.sha256(prefix.encode("utf-8")).hexdigest())
+    with _handles_lock:
+        handle = _handles.get(key)
+        if handle is None:
+            if backend == "gemini":
+                handle = GeminiPrefixCache(client, model, prefix)
+            else:
+                handle = LocalPrefixCache(model, prefix)
+            _handles[key] = handle
+            while len(_handles) > PREFIX_CACHE_MAX_HANDLES:
+                # a dropped Gemini context simply expires on the provider side
+                _handles.popitem(last=False)
+        else:
+            _handles.move_to_end(key)
+    return handle
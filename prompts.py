@@ -1,8 +1,21 @@
 import os
 from datetime import datetime
+from functools import lru_cache
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(BASE_DIR, "../data")
+
+
+def _find_data_dir() -> str:
+    # data/ sits next to this file in the flat layout and one level up in the
+    # service layout (app/services/prompts.py -> app/data)
+    candidates = [os.getenv("PROMPTS_DATA_DIR"), os.path.join(BASE_DIR, "data"), os.path.join(BASE_DIR, "../data")]
+    for candidate in candidates:
+        if candidate and os.path.isdir(candidate):
+            return candidate
+    return os.path.join(BASE_DIR, "data")
+
+
+DATA_DIR = _find_data_dir()
 
 def load_text_file(filename: str, default=""):
     path = os.path.join(DATA_DIR, filename)
@@ -11,14 +24,24 @@ def load_text_file(filename: str, default=""):
             return f.read().strip()
     return default
 
-disclosure_texts_direct = load_text_file("Disclosure_Library_3.csv", "[Direct Disclosures Text Missing]")
-guidelines_text = load_text_file("guidelines.txt", "[Guidelines Text Missing]")
-morningstar_text = load_text_file("morningstar_text.txt", "[Morningstar Text Missing]")
-kandl_text = load_text_file("gates_structured.txt", "[SEC Checklist Text Missing]")
-sec_faq = load_text_file("faq.txt", "[SEC FAQ Text Missing]")
-sec_rules_text = load_text_file("sec_structured.txt", "[SEC Rules Text Missing]")
-examples_text = load_text_file("examples_3.txt", "[Examples Text Missing]")
-new_examples_text = load_text_file("examples_4.txt", "") 
+# Reference texts embedded in the prompts. Nothing is read at import time: each
+# file is loaded on first use (data_text / module attribute) and memoized.
+DATA_FILES = {
+    "disclosure_texts_direct": ("Disclosure_Library_3.csv", "[Direct Disclosures Text Missing]"),
+    "guidelines_text": ("guidelines.txt", "[Guidelines Text Missing]"),
+    "morningstar_text": ("morningstar_text.txt", "[Morningstar Text Missing]"),
+    "kandl_text": ("gates_structured.txt", "[SEC Checklist Text Missing]"),
+    "sec_faq": ("faq.txt", "[SEC FAQ Text Missing]"),
+    "sec_rules_text": ("sec_structured.txt", "[SEC Rules Text Missing]"),
+    "examples_text": ("examples_3.txt", "[Examples Text Missing]"),
+    "new_examples_text": ("examples_4.txt", ""),
+}
+
+
+@lru_cache(maxsize=None)
+def data_text(name: str) -> str:
+    filename, default = DATA_FILES[name]
+    return load_text_file(filename, default)
 
 # app/services/prompts.py
 
@@ -28,7 +51,9 @@ new_examples_text = load_text_file("examples_4.txt", "")
 # Shared Template Values
 # ------------------------------------------------------------------------------
 
-current_date = datetime.now().strftime("%d %B %Y")
+def today() -> str:
+    """The effective date the prompts are built for; evaluated per call, not at import."""
+    return datetime.now().strftime("%d %B %Y")
 
 # ------------------------------------------------------------------------------
 # Prompt: Base Review Template (Used for both text and multimodal reviews)
@@ -282,7 +307,8 @@ GUARDRAILS: AVOID THE FOLLOWING OUTPUTS
 # ------------------------------------------------------------
 # Base Prompt Template 
 # ------------------------------------------------------------
-base_review_prompt_template = f"""
+# Filled in by base_review_prompt(); {{ }} are literal braces.
+_BASE_REVIEW_TEMPLATE = """
 You are an AI compliance assistant specialized in reviewing financial marketing materials against SEC regulations.
 
 You will be provided with a document (either as text embedded in the prompt or as an uploaded file) and supporting information including SEC rules, FAQs, and disclosure guidelines.
@@ -715,6 +741,39 @@ Analyze the uploaded PDF document provided as a file.
 Now, proceed with the compliance review instructions provided above based on the content of the uploaded document. Output the findings strictly in the specified JSON format. Set the "document_name" field to "{compliance_doc_name} (Multimodal Review)".
 """
 
+# ------------------------------------------------------------------------------
+# Review prompt split: cacheable static prefix + per-document suffix
+# ------------------------------------------------------------------------------
+
+@lru_cache(maxsize=4)
+def _base_review_prompt(current_date: str) -> str:
+    values = {name: data_text(name) for name in DATA_FILES}
+    return _BASE_REVIEW_TEMPLATE.format(
+        current_date=current_date,
+        false_positives_guardrails=false_positives_guardrails,
+        **values
+    )
+
+def base_review_prompt(current_date: str = None) -> str:
+    """
+    The base review prompt (SEC rules, FAQ, examples, disclosure library),
+    built on first use and memoized per effective date.
+
+    It is identical for every text and multimodal review on a given day, so it
+    is also the static prefix that lives in a provider-side cached context
+    (see prefix_cache.py).
+    """
+    return _base_review_prompt(current_date or today())
+
+def text_review_suffix(input_doc_text: str, compliance_doc_name: str = "Document") -> str:
+    return text_input_instruction.format(
+        input_doc_text=input_doc_text,
+        compliance_doc_name=compliance_doc_name
+    )
+
+def multimodal_review_suffix(compliance_doc_name: str = "Document") -> str:
+    return multimodal_input_instruction.format(compliance_doc_name=compliance_doc_name)
+
 # ------------------------------------------------------------------------------
 # Prompt: Synthesis Instruction Template (use .format())
 # ------------------------------------------------------------------------------
@@ -780,7 +839,7 @@ Begin with the PDF loaded, then the two JSON blocks:
 
 Begin your JSON output now. """
 
-typo_date_prompt_sys = f"""
+_TYPO_DATE_SYS_TEMPLATE = """
 You are an expert document analyst specializing in financial reporting. Your task is to analyze the extracted text from a PDF (which includes page markers such as "Page 3:") and detect every instance where a "%" symbol is expected but missing.
 Instructions:
 - Focus on detecting numeric values that, based on context, are intended to represent percentages. This may include figures related to performance metrics, allocation ratios, growth rates, or any other financial metrics typically expressed as a percentage.
@@ -804,6 +863,11 @@ Instructions:
 Do not output any extra text or commentary outside of the JSON object.
 """
 
+@lru_cache(maxsize=1)
+def typo_prompt_sys() -> str:
+    """System prompt for the missing-% analysis (embeds the examples_4 negatives)."""
+    return _TYPO_DATE_SYS_TEMPLATE.format(new_examples_text=data_text("new_examples_text"))
+
 typo_date_prompt_user = """
 Analyze the provided text content for potential missing '%' symbols.
 
@@ -870,6 +934,32 @@ Output Sample:
 
 """
 
+document_change_summary_prompt = """
+You are reviewing the differences between two versions of the same marketing collateral. The differences were computed exactly by a diff tool and are listed below as JSON; each has an "index", its "type" (added / removed / modified / moved), its "location" and the text from version 1 ("document_a") and version 2 ("document_b"). Do not look for other differences and do not restate the text.
+
+For every difference, classify it into one of these categories:
+- "Textual": wording added, removed or rephrased
+- "Structural": headings, section order, or whole paragraphs/pages added, removed or moved
+- "Key Information": product names, figures, performance data, dates, pricing, contact details or links
+- "Typographic": punctuation, spacing, or a missing/added % symbol
+- "Messaging": a shift in claims, tone or marketing message
+and describe in one sentence what changed and why it matters for compliance review.
+
+Then summarize the overall nature and extent of the changes in 1-3 sentences (e.g. "minor wording tweaks", "updated performance figures").
+
+Return only JSON:
+{{
+  "comparison_summary": "...",
+  "classifications": [
+    {{"index": 0, "type": "Key Information", "description": "..."}}
+  ]
+}}
+
+---DIFFERENCES START---
+{changes_json}
+---DIFFERENCES END---
+"""
+
 tell_me_why_prompt_template = """
 You are an expert AI compliance assistant. Your task is to provide a detailed explanation for a specific compliance finding ("section") from an AI-generated review report, using the original PDF document for context.
 
@@ -894,3 +984,22 @@ Compliance Finding (Section JSON):
 
 Now, provide the detailed explanation and it should be less than 150 words for this compliance finding, using the PDF for context.
 """
+
+
+# ------------------------------------------------------------------------------
+# Lazy module attributes (PEP 562)
+# ------------------------------------------------------------------------------
+
+def __getattr__(name: str):
+    # Keeps `prompts.base_review_prompt_template` etc. working without building
+    # anything at import time. Call sites should prefer the functions, since a
+    # `from prompts import ...` of these names builds them when the importer loads.
+    if name in ("base_review_prompt_template", "review_static_prefix"):
+        return base_review_prompt()
+    if name == "typo_date_prompt_sys":
+        return typo_prompt_sys()
+    if name == "current_date":
+        return today()
+    if name in DATA_FILES:
+        return data_text(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,207 @@
+"""
+Local merge of the text and multimodal review reports ahead of synthesis.
+
+The synthesis prompt asks the model to dedupe on section_title + observations,
+keep the duplicate with the most complete rule_citation / recommendations and
+sort by page_number. Most of that is done here:
+
+- sections of both reports are clustered by word overlap of their title and
+  observations (pages that clearly disagree keep two sections apart);
+- each cluster resolves to its member with the fullest rule_citation, then
+  recommendations, with nothing merged in from the others;
+- clusters that are only loosely similar to another cluster are ambiguous and
+  are the only sections sent to the model for synthesis.
+
+When nothing is ambiguous (including both reports empty, or both reporting the
+same findings) the synthesis model is not called at all.
+
+merge_batch_reports() applies the same dedupe to the partial reports of a
+page-batched multimodal review.
+"""
+import os
+import re
+import unicodedata
+
+if __package__:
+    from .pdf_pages import parse_page_refs
+else:  # imported as a top-level module by the stage scripts
+    from pdf_pages import parse_page_refs
+
+# Title/observation similarity at or above which two sections are duplicates.
+DUPLICATE_SIMILARITY = float(os.getenv("MERGE_DUPLICATE_SIMILARITY", "0.55"))
+# Between this and DUPLICATE_SIMILARITY the pair is left to the model.
+AMBIGUOUS_SIMILARITY = float(os.getenv("MERGE_AMBIGUOUS_SIMILARITY", "0.3"))
+TITLE_WEIGHT = 0.4
+
+_STOPWORDS = frozenset(
+    "the and for with that this are was were not but from its has have been which their into than "
+    "any all can may should would also such these those there where when what does other".split()
+)
+
+
+def _words(text: str) -> frozenset:
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    words = set()
+    for word in re.findall(r"[a-z]+|\d+", text):
+        if len(word) < 3 or word in _STOPWORDS:
+            continue
+        words.add(word[:-1] if len(word) > 4 and word.endswith("s") else word)
+    return frozenset(words)
+
+
+def _dice(a: frozenset, b: frozenset) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+
+def similarity(a: dict, b: dict) -> float:
+    """0..1 word overlap of two sections' section_title and observations."""
+    return (
+        TITLE_WEIGHT * _dice(_words(a.get("section_title")), _words(b.get("section_title")))
+        + (1 - TITLE_WEIGHT) * _dice(_words(a.get("observations")), _words(b.get("observations")))
+    )
+
+
+def _pages_disagree(a: dict, b: dict) -> bool:
+    pages_a, pages_b = parse_page_refs(a.get("page_number")), parse_page_refs(b.get("page_number"))
+    return bool(pages_a and pages_b and not set(pages_a) & set(pages_b))
+
+
+def is_duplicate(a: dict, b: dict) -> bool:
+    """Whether two sections report the same finding (similar enough, pages not disjoint)."""
+    return similarity(a, b) >= DUPLICATE_SIMILARITY and not _pages_disagree(a, b)
+
+
+def _completeness(section: dict) -> tuple:
+    return len((section.get("rule_citation") or "").strip()), len((section.get("recommendations") or "").strip())
+
+
+def page_sort_key(section: dict):
+    refs = parse_page_refs(section.get("page_number"))
+    return refs[0] if refs else float("inf")
+
+
+class _Groups:
+    """Union-find over indexes."""
+
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int):
+        self.parent[self.find(i)] = self.find(j)
+
+    def members(self) -> dict:
+        groups = {}
+        for i in range(len(self.parent)):
+            groups.setdefault(self.find(i), []).append(i)
+        return groups
+
+
+def merge_reports(text_res: dict, multi_res: dict) -> dict:
+    """
+    Cluster and resolve the sections of both reports. Returns
+    {"sections": resolved sections, "ambiguous": {"text": [...], "multimodal": [...]},
+     "stats": {...}}; the ambiguous sections still need the synthesis model.
+    """
+    sources = [("text", s) for s in (text_res or {}).get("sections") or []]
+    sources += [("multimodal", s) for s in (multi_res or {}).get("sections") or []]
+    sections = [s for _, s in sources]
+    n = len(sections)
+
+    scores = {(i, j): similarity(sections[i], sections[j]) for i in range(n) for j in range(i + 1, n)}
+    duplicates = _Groups(n)
+    for (i, j), score in scores.items():
+        if score >= DUPLICATE_SIMILARITY and not _pages_disagree(sections[i], sections[j]):
+            duplicates.union(i, j)
+
+    # Clusters tied together by a loose match are left to the model as a whole.
+    related = _Groups(n)
+    for i, members in duplicates.members().items():
+        for j in members:
+            related.union(j, i)
+    for (i, j), score in scores.items():
+        if score >= AMBIGUOUS_SIMILARITY and duplicates.find(i) != duplicates.find(j):
+            related.union(i, j)
+
+    resolved, ambiguous = [], {"text": [], "multimodal": []}
+    agreed = 0
+    for members in related.members().values():
+        clusters = {duplicates.find(i) for i in members}
+        if len(clusters) > 1:
+            for i in members:
+                ambiguous[sources[i][0]].append(sections[i])
+            continue
+        resolved.append(max((sections[i] for i in members), key=_completeness))
+        agreed += len({sources[i][0] for i in members}) == 2
+
+    ambiguous_count = len(ambiguous["text"]) + len(ambiguous["multimodal"])
+    return {
+        "sections": resolved,
+        "ambiguous": ambiguous,
+        "stats": {
+            "text_sections": sum(1 for src, _ in sources if src == "text"),
+            "multimodal_sections": sum(1 for src, _ in sources if src == "multimodal"),
+            "resolved": len(resolved),
+            "agreed": agreed,
+            "duplicates_removed": n - ambiguous_count - len(resolved),
+            "ambiguous_sections": ambiguous_count,
+        },
+    }
+
+
+def dedupe_sections(sections: list) -> list:
+    """Collapse duplicate sections (same rules as merge_reports, nothing left to the model)."""
+    duplicates = _Groups(len(sections))
+    for i in range(len(sections)):
+        for j in range(i + 1, len(sections)):
+            if is_duplicate(sections[i], sections[j]):
+                duplicates.union(i, j)
+    return [max((sections[i] for i in members), key=_completeness) for members in duplicates.members().values()]
+
+
+def merge_batch_reports(reports: list, batches: list) -> dict:
+    """
+    One review report from reports over overlapping page batches (page numbers
+    already absolute). Findings repeated on the overlapping pages are collapsed.
+    """
+    sections = [s for report in reports for s in report.get("sections") or []]
+    conclusions = [
+        f"Pages {pages[0]}-{pages[-1]}: {report['overall_conclusion']}"
+        for report, pages in zip(reports, batches)
+        if report.get("overall_conclusion") and "raw_response" not in report
+    ]
+    return {
+        "document_name": next((r["document_name"] for r in reports if r.get("document_name")), ""),
+        "sections": sorted(dedupe_sections(sections), key=page_sort_key),
+        "overall_conclusion": "\n".join(conclusions),
+        "batches": {
+            "pages": [[pages[0], pages[-1]] for pages in batches],
+            "failed": [[pages[0], pages[-1]] for report, pages in zip(reports, batches) if "raw_response" in report],
+            "errors": [report["error"] for report in reports if report.get("error")],
+            "sections_before_dedupe": len(sections),
+        },
+    }
+
+
+def needs_model(merged: dict) -> bool:
+    return bool(merged["ambiguous"]["text"] or merged["ambiguous"]["multimodal"])
+
+
+def synthesized_report(merged: dict, doc_name: str, model_sections: list = None) -> dict:
+    """
+    The synthesis report: resolved sections plus the model's synthesis of the
+    ambiguous ones, sorted by page. Without a model answer (not needed, or
+    unparseable) every ambiguous section is kept so no finding is lost.
+    """
+    if model_sections is None:
+        model_sections = merged["ambiguous"]["text"] + merged["ambiguous"]["multimodal"]
+    return {
+        "document_name": f"{doc_name} - Synthesized Compliance Report",
+        "sections": sorted(merged["sections"] + list(model_sections), key=page_sort_key),
+        "merge": dict(merged["stats"], model_call=needs_model(merged)),
+    }
@@ -0,0 +1,269 @@
+"""
+Response schemas and the shared response parser.
+
+Every stage that expects JSON declares its schema here and sends it as
+constrained output (response_mime_type="application/json" + response_schema),
+so the model returns bare JSON. The parser makes a single pass: it skips
+anything before the first "{" (code fences, prose), raw_decodes one value and
+ignores what follows, then checks the value against the stage schema,
+filling in missing required fields and dropping malformed list items. Parse
+time is recorded per stage (parse_stats()).
+"""
+import json
+import threading
+import time
+from typing import List, TypedDict
+
+# Keep at most this much of an unparseable response for debugging.
+RAW_RESPONSE_CHARS = 2000
+
+
+# ---------------------------------------------------------------------------
+# Schemas (OpenAPI subset accepted by both google-genai and Vertex AI)
+# ---------------------------------------------------------------------------
+
+def _string():
+    return {"type": "STRING"}
+
+
+def _object(properties: dict, required: list = None, ordering: list = None) -> dict:
+    schema = {"type": "OBJECT", "properties": properties}
+    schema["required"] = list(properties) if required is None else required
+    schema["property_ordering"] = ordering or list(properties)
+    return schema
+
+
+REVIEW_SECTION_SCHEMA = _object({
+    "section_title": _string(),
+    "page_number": _string(),
+    "observations": _string(),
+    "rule_citation": _string(),
+    "recommendations": _string(),
+    "category": _string(),
+})
+
+REVIEW_SCHEMA = _object(
+    {
+        "document_name": _string(),
+        "sections": {"type": "ARRAY", "items": REVIEW_SECTION_SCHEMA},
+        "overall_conclusion": _string(),
+    },
+    required=["document_name", "sections"],
+)
+
+# The synthesis report has the same shape as the reports it consolidates.
+SYNTHESIS_SCHEMA = REVIEW_SCHEMA
+
+TYPO_SCHEMA = _object({
+    "missing_percent_details": {
+        "type": "ARRAY",
+        "items": _object({"page": _string(), "context": _string(), "recommendation": _string()}),
+    },
+})
+
+DISCLOSURE_SCHEMA = _object({
+    "disclosures": {
+        "type": "ARRAY",
+        "items": _object({"text": _string(), "pages": _string()}),
+    },
+})
+
+COMPARISON_SCHEMA = _object({
+    "comparison_summary": _string(),
+    "differences": {
+        "type": "ARRAY",
+        "items": _object({
+            "type": _string(),
+            "location": _string(),
+            "description": _string(),
+            "document_a": _string(),
+            "document_b": _string(),
+        }),
+    },
+})
+
+
+CHANGE_SUMMARY_SCHEMA = _object({
+    "comparison_summary": _string(),
+    "classifications": {
+        "type": "ARRAY",
+        "items": _object({"index": {"type": "INTEGER"}, "type": _string(), "description": _string()}),
+    },
+})
+
+
+def json_config(schema: dict, config: dict = None) -> dict:
+    """Generation config asking for JSON constrained to `schema`."""
+    return dict(config or {}, response_mime_type="application/json", response_schema=schema)
+
+
+# ---------------------------------------------------------------------------
+# Typed results
+# ---------------------------------------------------------------------------
+
+class ReviewSection(TypedDict, total=False):
+    section_title: str
+    page_number: str
+    observations: str
+    rule_citation: str
+    recommendations: str
+    category: str
+
+
+class ReviewResult(TypedDict, total=False):
+    document_name: str
+    sections: List[ReviewSection]
+    overall_conclusion: str
+    raw_response: str
+
+
+class TypoDetail(TypedDict, total=False):
+    page: str
+    context: str
+    recommendation: str
+
+
+class TypoResult(TypedDict, total=False):
+    missing_percent_details: List[TypoDetail]
+    error: str
+
+
+class DisclosureItem(TypedDict, total=False):
+    text: str
+    pages: str
+
+
+class ComparisonDifference(TypedDict, total=False):
+    type: str
+    location: str
+    description: str
+    document_a: str
+    document_b: str
+
+
+class ComparisonResult(TypedDict, total=False):
+    comparison_summary: str
+    differences: List[ComparisonDifference]
+
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+_decoder = json.JSONDecoder()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def parse_json(text: str, opener: str = "{"):
+    """Decode the first JSON value starting at `opener`, ignoring text around it."""
+    start = text.find(opener)
+    if start < 0:
+        raise ValueError(f"no JSON {opener!r} in response")
+    value, _ = _decoder.raw_decode(text, start)
+    return value
+
+
+def _default(schema: dict):
+    return {"OBJECT": {}, "ARRAY": [], "STRING": ""}.get(schema["type"])
+
+
+def validate(value, schema: dict):
+    """Coerce `value` to `schema`; raise ValueError if its shape is wrong."""
+    kind = schema["type"]
+    if kind == "OBJECT":
+        if not isinstance(value, dict):
+            raise ValueError(f"expected an object, got {type(value).__name__}")
+        result = dict(value)
+        for name, sub in schema["properties"].items():
+            if name in value:
+                result[name] = validate(value[name], sub)
+            elif name in schema.get("required", ()):
+                result[name] = _default(sub)
+        return result
+    if kind == "ARRAY":
+        if not isinstance(value, list):
+            raise ValueError(f"expected an array, got {type(value).__name__}")
+        items = []
+        for item in value:
+            try:
+                items.append(validate(item, schema["items"]))
+            except ValueError:
+                continue  # one malformed entry should not sink the report
+        return items
+    if kind == "STRING":
+        return "" if value is None else value if isinstance(value, str) else str(value)
+    if kind == "INTEGER":
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"expected an integer, got {value!r}")
+    return value
+
+
+def _record(stage: str, seconds: float, failed: bool):
+    with _stats_lock:
+        entry = _stats.setdefault(stage, {"calls": 0, "failures": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        entry["calls"] += 1
+        entry["failures"] += int(failed)
+        entry["total_seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+
+def parse_response(response_text: str, stage: str, schema: dict, fallback):
+    """Parse and validate a response for `stage`; return `fallback(error)` on failure."""
+    start = time.perf_counter()
+    failed = True
+    try:
+        result = validate(parse_json(response_text or "", "{" if schema["type"] == "OBJECT" else "["), schema)
+        failed = False
+        return result
+    except ValueError as e:
+        return fallback(e)
+    finally:
+        _record(stage, time.perf_counter() - start, failed)
+
+
+def parse_review(response_text: str, source_name: str, schema: dict = REVIEW_SCHEMA) -> ReviewResult:
+    """Text, multimodal and synthesis reviews."""
+    return parse_response(response_text, source_name, schema, lambda e: {
+        "document_name": source_name,
+        "sections": [],
+        "overall_conclusion": "Failed to parse JSON from model response.",
+        "raw_response": (response_text or "")[:RAW_RESPONSE_CHARS],
+    })
+
+
+def parse_typo(response_text: str) -> TypoResult:
+    return parse_response(response_text, "Typo/Date Analysis", TYPO_SCHEMA, lambda e: {
+        "missing_percent_details": [],
+        "error": f"Failed to parse typo analysis response: {e}",
+    })
+
+
+def parse_disclosures(response_text: str) -> List[DisclosureItem]:
+    result = parse_response(response_text, "Disclosure Analysis", DISCLOSURE_SCHEMA, lambda e: {})
+    return result.get("disclosures", [])
+
+
+def parse_comparison(response_text: str) -> ComparisonResult:
+    """Raises ValueError when the comparison response is not valid JSON."""
+    def _fail(e):
+        raise ValueError(f"Failed to parse comparison response: {e}") from e
+
+    return parse_response(response_text, "Document Comparison", COMPARISON_SCHEMA, _fail)
+
+
+def parse_change_summary(response_text: str) -> dict:
+    return parse_response(response_text, "Change Summary", CHANGE_SUMMARY_SCHEMA, lambda e: {
+        "comparison_summary": "",
+        "classifications": [],
+    })
+
+
+def parse_stats() -> dict:
+    with _stats_lock:
+        return {
+            stage: dict(entry, mean_ms=round(entry["total_seconds"] / entry["calls"] * 1000, 3))
+            for stage, entry in _stats.items()
+        }
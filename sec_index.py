@@ -0,0 +1,219 @@
+"""
+BM25 retrieval index over the SEC rule corpus.
+
+The Federal Register text (extracted_text.txt), the structured marketing rule
+(data/sec_structured.txt) and the staff FAQ (data/faq.txt) are split into
+rule-sized passages so a text chunk can be judged against the few passages
+that are relevant to it instead of the whole 272 KB ruleset. A caller-supplied
+ruleset text gets its own index instead (index_for_ruleset).
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_FILES = [
+    os.path.join(BASE_DIR, "extracted_text.txt"),
+    os.path.join(BASE_DIR, "data", "sec_structured.txt"),
+    os.path.join(BASE_DIR, "data", "faq.txt"),
+]
+
+PASSAGE_WORDS = 180
+DEFAULT_TOP_K = 8
+# Indexes kept for caller-supplied rulesets (each distinct text builds one).
+MAX_RULESET_INDEXES = 4
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+_SENTENCE_RE = re.compile(r"(?<=[.;:?!])\s+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "their this to was were which will with may any not such other these those".split()
+)
+
+
+def tokenize(text: str) -> list:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+# ------------------------------------------------------------------------------
+# Passage splitting
+# ------------------------------------------------------------------------------
+
+def _window(sentences, source: str, title: str, max_words: int = PASSAGE_WORDS):
+    """Group sentences into passages of at most ~max_words words."""
+    passages, current, count = [], [], 0
+    for sentence in sentences:
+        words = len(sentence.split())
+        if current and count + words > max_words:
+            passages.append({"source": source, "title": title, "text": " ".join(current)})
+            current, count = [], 0
+        current.append(sentence)
+        count += words
+    if current:
+        passages.append({"source": source, "title": title, "text": " ".join(current)})
+    return passages
+
+
+def split_plain_text(text: str, source: str) -> list:
+    # The Federal Register dump is hard-wrapped and hyphenated at line ends.
+    text = re.sub(r"-\n(?=[a-z])", "", text)
+    text = re.sub(r"\s*\n\s*", " ", text)
+    return _window(_SENTENCE_RE.split(text), source, source)
+
+
+def split_structured(data, source: str, path: str = "") -> list:
+    """One passage per JSON object, built from its string fields."""
+    passages = []
+    if isinstance(data, list):
+        for item in data:
+            passages.extend(split_structured(item, source, path))
+        return passages
+    if not isinstance(data, dict):
+        return passages
+
+    lines, label = [], path
+    for key, value in data.items():
+        if isinstance(value, str):
+            lines.append(f"{key}: {value}")
+            if key in ("rule_number", "section_title", "title", "question") and not label.endswith(value):
+                label = f"{path} > {value}" if path else value
+        elif isinstance(value, list) and value and all(isinstance(v, str) for v in value):
+            lines.append(f"{key}: " + " ".join(value))
+    if lines:
+        sentences = [s for line in lines for s in _SENTENCE_RE.split(line)]
+        passages.extend(_window(sentences, source, label or source))
+
+    for key, value in data.items():
+        if isinstance(value, (dict, list)) and not (
+            isinstance(value, list) and all(isinstance(v, str) for v in value)
+        ):
+            passages.extend(split_structured(value, source, label))
+    return passages
+
+
+def split_text(raw: str, source: str) -> list:
+    """Passages of a JSON ruleset (structured) or of plain text."""
+    try:
+        return split_structured(json.loads(raw), source)
+    except json.JSONDecodeError:
+        return split_plain_text(raw, source)
+
+
+def load_passages(paths=None) -> list:
+    passages = []
+    for path in paths or CORPUS_FILES:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            raw = f.read()
+        passages.extend(split_text(raw, os.path.basename(path)))
+    return passages
+
+
+# ------------------------------------------------------------------------------
+# BM25 index
+# ------------------------------------------------------------------------------
+
+class SecRuleIndex:
+    def __init__(self, passages: list, k1: float = 1.5, b: float = 0.75):
+        start = time.perf_counter()
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+        for doc_id, passage in enumerate(passages):
+            counts = Counter(tokenize(passage["title"] + " " + passage["text"]))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((doc_id, tf))
+        n = len(passages) or 1
+        self.avg_length = (sum(self.doc_lengths) / n) or 1.0
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+        self.stats = {
+            "passages": len(passages),
+            "corpus_chars": sum(len(p["text"]) for p in passages),
+            "build_seconds": round(time.perf_counter() - start, 4),
+            "queries": 0,
+            "query_seconds_total": 0.0,
+        }
+
+    def search(self, query: str, top_k: int = DEFAULT_TOP_K) -> list:
+        start = time.perf_counter()
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        self.stats["queries"] += 1
+        self.stats["query_seconds_total"] += time.perf_counter() - start
+        return [dict(self.passages[doc_id], score=round(score, 4)) for doc_id, score in ranked]
+
+
+_index = None
+_ruleset_indexes = {}
+_index_lock = threading.Lock()
+
+
+def get_index() -> SecRuleIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SecRuleIndex(load_passages())
+    return _index
+
+
+def index_for_ruleset(ruleset: str) -> SecRuleIndex:
+    """Index over a caller-supplied ruleset text, built once per distinct text."""
+    key = hashlib.sha256(ruleset.encode("utf-8")).hexdigest()
+    with _index_lock:
+        index = _ruleset_indexes.pop(key, None)
+        if index is None:
+            index = SecRuleIndex(split_text(ruleset, "SEC_RULESET"))
+        _ruleset_indexes[key] = index  # most recently used last
+        while len(_ruleset_indexes) > MAX_RULESET_INDEXES:
+            del _ruleset_indexes[next(iter(_ruleset_indexes))]
+    return index
+
+
+def retrieve_rules(text_chunk: str, top_k: int = DEFAULT_TOP_K, ruleset: str = None) -> tuple:
+    """
+    Return (ruleset_text, report) where ruleset_text holds only the top-k
+    passages for the chunk and report carries build/query timings and sizes.
+    Passages come from `ruleset` when given, else from the bundled corpus.
+    """
+    index = index_for_ruleset(ruleset) if ruleset else get_index()
+    start = time.perf_counter()
+    hits = index.search(text_chunk, top_k)
+    query_ms = round((time.perf_counter() - start) * 1000, 2)
+    ruleset = "\n\n".join(f"[{h['source']} | {h['title']}]\n{h['text']}" for h in hits)
+    report = {
+        "index_build_seconds": index.stats["build_seconds"],
+        "passages": index.stats["passages"],
+        "query_ms": query_ms,
+        "top_k": top_k,
+        "ruleset_chars": len(ruleset),
+        "corpus_chars": index.stats["corpus_chars"],
+    }
+    return ruleset, report
+
+
+if __name__ == "__main__":
+    import sys
+
+    query = " ".join(sys.argv[1:]) or "Past performance does not guarantee future results"
+    ruleset, report = retrieve_rules(query)
+    print(ruleset[:2000])
+    print(json.dumps(report, indent=2))
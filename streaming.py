@@ -0,0 +1,81 @@
+"""
+Incremental parsing of streamed review responses.
+
+The review prompts ask for {"document_name": ..., "sections": [{...}, ...]}.
+SectionStreamParser is fed the response text chunk by chunk and returns each
+entry of the "sections" array as soon as its closing brace arrives, so a UI can
+show findings long before the full response (and its final parse) is done.
+Code fences or prose around the JSON are ignored.
+"""
+import json
+import re
+
+
+class SectionStreamParser:
+    def __init__(self, key: str = "sections"):
+        self._key_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self.text = ""
+        self.pos = 0
+        self.state = "seek"  # seek -> array -> done
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.item_start = None
+
+    def feed(self, chunk: str) -> list:
+        """Add a chunk of response text; return the sections completed by it."""
+        self.text += chunk
+        completed = []
+        text = self.text
+        while self.pos < len(text) and self.state != "done":
+            if self.state == "seek":
+                match = self._key_re.search(text, self.pos)
+                if match is None:
+                    # The key may be split across chunks; rescan only the tail.
+                    self.pos = max(self.pos, len(text) - 64)
+                    break
+                self.pos = match.end()
+                self.state = "array"
+                continue
+
+            ch = text[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                if self.depth == 0:
+                    self.item_start = self.pos
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0 and self.item_start is not None:
+                    try:
+                        completed.append(json.loads(text[self.item_start:self.pos + 1]))
+                    except json.JSONDecodeError:
+                        pass  # malformed entry; the final full parse still sees it
+                    self.item_start = None
+            elif ch == "]" and self.depth == 0:
+                self.state = "done"
+            self.pos += 1
+        return completed
+
+
+def stream_review_events(chunks, finalize):
+    """
+    Turn an iterator of response-text chunks into review events:
+    {"type": "section", "section": {...}} for each finished section, then
+    {"type": "result", "result": finalize(full_text)} once the stream ends.
+    """
+    parser = SectionStreamParser()
+    for chunk in chunks:
+        if not chunk:
+            continue
+        for section in parser.feed(chunk):
+            yield {"type": "section", "section": section}
+    yield {"type": "result", "result": finalize(parser.text)}
@@ -0,0 +1,267 @@
+"""
+Per-call telemetry for model requests.
+
+Every model call records the prompt characters it sent, the bytes of attached
+files, an estimated input token count (from the characters) next to the actual
+input/output/cached token counts from the response's usage metadata, and the
+time to first byte and total latency (for non-streaming calls the two are the
+same).
+
+Calls are attributed to the current stage and document, set with scope():
+
+    with telemetry.scope(stage="text_review", document=pdf_path):
+        run_text_review(text)
+
+report() aggregates the recorded calls per stage and per document.
+"""
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+MAX_RECORDS = int(os.getenv("TELEMETRY_MAX_RECORDS", "10000"))
+
+_stage = contextvars.ContextVar("telemetry_stage", default=None)
+_document = contextvars.ContextVar("telemetry_document", default=None)
+_records = deque(maxlen=MAX_RECORDS)
+_lock = threading.Lock()
+
+
+@contextmanager
+def scope(stage: str = None, document: str = None):
+    """Attribute model calls made inside the block to `stage` / `document`."""
+    tokens = []
+    if stage is not None:
+        tokens.append((_stage, _stage.set(stage)))
+    if document is not None:
+        tokens.append((_document, _document.set(document)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def propagate(fn):
+    """
+    Bind `fn` to the caller's stage/document so it keeps them when run on a
+    worker thread (thread pools do not carry context variables over).
+    """
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+
+    return wrapper
+
+
+def estimate_tokens(chars: int) -> int:
+    return chars // 4 + (1 if chars else 0)
+
+
+def measure_contents(contents) -> tuple:
+    """(prompt characters, attached bytes) of a request's contents."""
+    if contents is None:
+        return 0, 0
+    if isinstance(contents, str):
+        return len(contents), 0
+    if isinstance(contents, (bytes, bytearray)):
+        return 0, len(contents)
+    if isinstance(contents, (list, tuple)):
+        chars = size = 0
+        for item in contents:
+            c, b = measure_contents(item)
+            chars += c
+            size += b
+        return chars, size
+    if isinstance(contents, dict):
+        return measure_contents(contents.get("text") or contents.get("content") or contents.get("parts"))
+
+    # google-genai / Vertex AI Part, or a LangChain message
+    try:
+        text = getattr(contents, "text", None)
+    except (AttributeError, ValueError):
+        text = None
+    if isinstance(text, str):
+        return len(text), 0
+    inline = getattr(contents, "inline_data", None)
+    data = getattr(inline, "data", None)
+    if isinstance(data, (bytes, bytearray)):
+        return 0, len(data)
+    content = getattr(contents, "content", None)
+    if content is not None:
+        return measure_contents(content)
+    parts = getattr(contents, "parts", None)
+    if parts:
+        return measure_contents(list(parts))
+    return 0, 0
+
+
+def _usage(response) -> dict:
+    """Actual token counts from google-genai / Vertex usage_metadata or a LangChain message."""
+    meta = getattr(response, "usage_metadata", None)
+    if meta is None:
+        return {}
+    if isinstance(meta, dict):  # LangChain AIMessage
+        return {"input_tokens": meta.get("input_tokens"), "output_tokens": meta.get("output_tokens")}
+    return {
+        "input_tokens": getattr(meta, "prompt_token_count", None),
+        "output_tokens": getattr(meta, "candidates_token_count", None),
+        "cached_tokens": getattr(meta, "cached_content_token_count", None),
+    }
+
+
+def _response_chars(response) -> int:
+    if isinstance(response, str):
+        return len(response)
+    try:
+        text = getattr(response, "text", None)
+    except (AttributeError, ValueError):
+        text = None
+    if not isinstance(text, str):
+        text = getattr(response, "content", None)
+    return len(text) if isinstance(text, str) else 0
+
+
+def record(model: str, contents, seconds: float, ttfb: float = None, usage: dict = None,
+           response_chars: int = 0, error: str = None, streamed: bool = False) -> dict:
+    chars, attached = measure_contents(contents)
+    entry = {
+        "stage": _stage.get() or "unscoped",
+        "document": _document.get(),
+        "model": model,
+        "prompt_chars": chars,
+        "attached_bytes": attached,
+        "estimated_input_tokens": estimate_tokens(chars),
+        "input_tokens": None,
+        "output_tokens": None,
+        "cached_tokens": None,
+        "estimated_output_tokens": estimate_tokens(response_chars),
+        "ttfb_seconds": round(seconds if ttfb is None else ttfb, 4),
+        "total_seconds": round(seconds, 4),
+        "streamed": streamed,
+        "error": error,
+        "timestamp": time.time(),
+    }
+    entry.update({k: v for k, v in (usage or {}).items() if v is not None})
+    with _lock:
+        _records.append(entry)
+    return entry
+
+
+def track_call(model: str, contents, call):
+    """Run `call()` (one model request) and record it."""
+    start = time.perf_counter()
+    response, error = None, None
+    try:
+        response = call()
+        return response
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record(model, contents, time.perf_counter() - start, usage=_usage(response),
+               response_chars=_response_chars(response), error=error)
+
+
+async def track_call_async(model: str, contents, call):
+    """Await `call()` (a coroutine function making one model request) and record it."""
+    start = time.perf_counter()
+    response, error = None, None
+    try:
+        response = await call()
+        return response
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record(model, contents, time.perf_counter() - start, usage=_usage(response),
+               response_chars=_response_chars(response), error=error)
+
+
+def track_stream(model: str, contents, open_stream):
+    """Yield the chunks of `open_stream()`, recording TTFB, latency and usage once it ends."""
+    start = time.perf_counter()
+    ttfb, usage, chars, error = None, {}, 0, None
+    try:
+        for chunk in open_stream():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            usage = _usage(chunk) or usage  # the final chunk carries the totals
+            chars += _response_chars(chunk)
+            yield chunk
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record(model, contents, time.perf_counter() - start, ttfb=ttfb, usage=usage,
+               response_chars=chars, error=error, streamed=True)
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+_SUMMED = ("prompt_chars", "attached_bytes", "estimated_input_tokens", "input_tokens",
+           "output_tokens", "cached_tokens", "estimated_output_tokens")
+
+
+def _percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def _aggregate(entries: list) -> dict:
+    summary = {"calls": len(entries), "errors": sum(1 for e in entries if e["error"])}
+    for field in _SUMMED:
+        summary[field] = sum(e[field] or 0 for e in entries)
+    latencies = [e["total_seconds"] for e in entries]
+    ttfbs = [e["ttfb_seconds"] for e in entries]
+    summary.update(
+        total_seconds=round(sum(latencies), 3),
+        latency_p50=_percentile(latencies, 50),
+        latency_p95=_percentile(latencies, 95),
+        ttfb_p50=_percentile(ttfbs, 50),
+        ttfb_p95=_percentile(ttfbs, 95),
+    )
+    return summary
+
+
+def records(document: str = None) -> list:
+    with _lock:
+        entries = list(_records)
+    return [e for e in entries if document is None or e["document"] == document]
+
+
+def report(document: str = None) -> dict:
+    """
+    Totals, per-stage and per-document aggregates of the recorded calls
+    (only those of `document` when given).
+    """
+    entries = records(document)
+    by_stage, by_document = {}, {}
+    for entry in entries:
+        by_stage.setdefault(entry["stage"], []).append(entry)
+        by_document.setdefault(entry["document"] or "unscoped", []).append(entry)
+    return {
+        "totals": _aggregate(entries),
+        "stages": {stage: _aggregate(items) for stage, items in sorted(by_stage.items())},
+        "documents": {
+            doc: dict(_aggregate(items), stages={
+                stage: _aggregate([e for e in items if e["stage"] == stage])
+                for stage in sorted({e["stage"] for e in items})
+            })
+            for doc, items in by_document.items()
+        },
+    }
+
+
+def reset():
+    with _lock:
+        _records.clear()
@@ -1,46 +1,26 @@
-from google import genai
 import os 
-from dotenv import load_dotenv
 from prompts import (
-    base_review_prompt_template,
-    text_input_instruction,
-    multimodal_input_instruction,
-    synthesis_prompt_template,
-    typo_date_prompt_sys,
-    typo_date_prompt_user,
-    false_positives_guardrails
+    base_review_prompt,
+    text_review_suffix
 )
-import json ,re
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
-
-#### UTILS #####
-
-def parse_response_to_json(response_text, source_name):
-    import json, re
-    try:
-        return json.loads(response_text)
-    except:
-        pass
-    json_match = re.search(r"\{.*\}", response_text, re.DOTALL)
-    if json_match:
-        try:
-            return json.loads(json_match.group())
-        except:
-            pass
-    return {
-        "document_name": source_name,
-        "sections": [],
-        "overall_conclusion": "Failed to parse JSON from model response.",
-        "raw_response": response_text
-    }
-
-
+import re
+from concurrent.futures import ThreadPoolExecutor
+from llm_cache import cached_generate, cached_stream
+from prefix_cache import get_prefix_cache
+from clients import get_genai_client, generate_content, generate_content_stream
+from streaming import stream_review_events
+from responses import REVIEW_SCHEMA, json_config, parse_review
+from telemetry import estimate_tokens, propagate
+from report_merge import page_sort_key
 
 
+def _text_review_prompt(text: str, compliance_doc_name: str):
+    cleaned_text = text.strip()
+    cleaned_text = re.sub(r'\n\s*\n', '\n', cleaned_text)
+    formatted_instruction = text_review_suffix(cleaned_text, compliance_doc_name)
+    return formatted_instruction, base_review_prompt() + "\n\n" + formatted_instruction
 
 
-client = genai.Client(api_key=api_key)
 def run_text_review(text:str):
     if not text:
         return {
@@ -48,22 +28,21 @@ def run_text_review(text:str):
             "sections": [],
             "overall_conclusion": "Text-based review skipped: Input text was empty."
         }
-    cleaned_text = text.strip()
-    cleaned_text = re.sub(r'\n\s*\n', '\n', cleaned_text)
     compliance_doc_name = "Document"
-    formatted_instruction = text_input_instruction.format(
-        input_doc_text=cleaned_text,
-        compliance_doc_name=compliance_doc_name
-    )
-    full_prompt = base_review_prompt_template + "\n\n" + formatted_instruction
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=full_prompt
-        )
+    formatted_instruction, full_prompt = _text_review_prompt(text, compliance_doc_name)
+    request_config = json_config(REVIEW_SCHEMA)
+    def _generate():
+        # Only the document suffix is sent; the static prefix lives in a cached context
+        prefix = get_prefix_cache(get_genai_client(), "gemini-2.5-flash", base_review_prompt())
+        contents, config = prefix.build_request([formatted_instruction], request_config)
+        response = generate_content("gemini-2.5-flash", contents, config)
         response_text = response.text.strip() if hasattr(response, "text") else ""
         if not response_text:
             response_text = str(response)
+        return response_text
+
+    try:
+        response_text = cached_generate("gemini-2.5-flash", request_config, [full_prompt], _generate)
 
     except Exception as e:
         return {
@@ -71,7 +50,152 @@ def run_text_review(text:str):
             "sections": [],
             "overall_conclusion": f"Gemini API error: {str(e)}"
         }
-    return parse_response_to_json(response_text, "Text Review")
+    return parse_review(response_text, "Text Review")
+
+
+def run_text_review_stream(text: str):
+    """
+    Streaming run_text_review. Yields {"type": "section", "section": ...} for
+    each finding as soon as the model has finished writing it, then
+    {"type": "result", "result": ...} with the same report run_text_review returns.
+    """
+    if not text:
+        yield {"type": "result", "result": run_text_review(text)}
+        return
+    compliance_doc_name = "Document"
+    formatted_instruction, full_prompt = _text_review_prompt(text, compliance_doc_name)
+    request_config = json_config(REVIEW_SCHEMA)
+
+    def _open_stream():
+        prefix = get_prefix_cache(get_genai_client(), "gemini-2.5-flash", base_review_prompt())
+        contents, config = prefix.build_request([formatted_instruction], request_config)
+        for chunk in generate_content_stream("gemini-2.5-flash", contents, config):
+            yield getattr(chunk, "text", "") or ""
+
+    try:
+        yield from stream_review_events(
+            cached_stream("gemini-2.5-flash", request_config, [full_prompt], _open_stream),
+            lambda response_text: parse_review(response_text, "Text Review"),
+        )
+    except Exception as e:
+        yield {"type": "result", "result": {
+            "document_name": compliance_doc_name,
+            "sections": [],
+            "overall_conclusion": f"Gemini API error: {str(e)}"
+        }}
+
+
+#### CHUNKED (MAP-REDUCE) TEXT REVIEW #####
+
+CHUNK_TOKEN_BUDGET = int(os.getenv("TEXT_REVIEW_CHUNK_TOKENS", "4000"))
+CHUNK_MAX_WORKERS = int(os.getenv("TEXT_REVIEW_MAX_WORKERS", "4"))
+
+
+def _split_block(text: str, max_tokens: int) -> list:
+    """Split one page on markdown headings, then on blank lines, to fit the budget."""
+    if estimate_tokens(len(text)) <= max_tokens:
+        return [text]
+    pieces = re.split(r"\n(?=#{1,6} )", text)
+    if len(pieces) == 1:
+        pieces = re.split(r"\n\s*\n", text)
+    if len(pieces) == 1:
+        step = max_tokens * 4
+        return [text[i:i + step] for i in range(0, len(text), step)]
+
+    blocks, current = [], ""
+    for piece in pieces:
+        candidate = f"{current}\n{piece}" if current else piece
+        if current and estimate_tokens(len(candidate)) > max_tokens:
+            blocks.extend(_split_block(current, max_tokens))
+            current = piece
+        else:
+            current = candidate
+    if current:
+        blocks.extend(_split_block(current, max_tokens))
+    return blocks
+
+
+def split_markdown(document, max_tokens: int = CHUNK_TOKEN_BUDGET) -> list:
+    """
+    Split docling output into review chunks under a token budget.
+
+    `document` is either the docling page map ([{"page_no", "text"}]) or plain
+    markdown. Pages are packed together while they fit; an oversized page is
+    split on headings. Each chunk carries "--- Page N ---" markers and the
+    list of pages it covers.
+    """
+    if isinstance(document, str):
+        pages = [{"page_no": None, "text": document}]
+    else:
+        pages = document
+
+    chunks, current_text, current_pages = [], "", []
+    for page in pages:
+        text = re.sub(r"<!-- image -->", "", page["text"]).strip()
+        if not text:
+            continue
+        marker = f"--- Page {page['page_no']} ---\n" if page["page_no"] is not None else ""
+        for block in _split_block(text, max_tokens):
+            block = marker + block
+            if current_text and estimate_tokens(len(current_text) + 1 + len(block)) > max_tokens:
+                chunks.append({"pages": current_pages, "text": current_text})
+                current_text, current_pages = "", []
+            current_text = f"{current_text}\n{block}" if current_text else block
+            if page["page_no"] not in current_pages:
+                current_pages.append(page["page_no"])
+    if current_text:
+        chunks.append({"pages": current_pages, "text": current_text})
+    return chunks
+
+
+def _chunk_failed(review: dict) -> bool:
+    # API errors are reported in-band by run_text_review; parse failures keep the raw response
+    return "raw_response" in review or str(review.get("overall_conclusion", "")).startswith("Gemini API error")
+
+
+def merge_chunk_reviews(chunks: list, reviews: list) -> dict:
+    """
+    Merge per-chunk reports into one, keeping (or filling in) page numbers.
+    Chunks whose review failed are listed in "failed_chunks" (indexes), so a
+    partial review can be told from a complete one.
+    """
+    sections, conclusions, failed = [], [], []
+    for index, (chunk, review) in enumerate(zip(chunks, reviews)):
+        if _chunk_failed(review):
+            failed.append(index)
+            continue
+        for section in review.get("sections", []) or []:
+            page = str(section.get("page_number", "")).strip()
+            known_pages = [p for p in chunk["pages"] if p is not None]
+            if page in ("", "N/A", "None") and len(known_pages) == 1:
+                section["page_number"] = str(known_pages[0])
+            sections.append(section)
+        conclusion = review.get("overall_conclusion")
+        if conclusion and conclusion not in conclusions:
+            conclusions.append(conclusion)
+    sections.sort(key=page_sort_key)
+    return {
+        "document_name": "Document (Text Review)",
+        "sections": sections,
+        "overall_conclusion": "\n".join(conclusions),
+        "chunks": len(chunks),
+        "failed_chunks": failed,
+    }
+
+
+def run_text_review_chunked(document, max_tokens: int = CHUNK_TOKEN_BUDGET,
+                            max_workers: int = CHUNK_MAX_WORKERS) -> dict:
+    """
+    Map-reduce text review: split `document` (page map or markdown) into
+    chunks, review up to `max_workers` chunks at a time and merge the reports.
+    """
+    chunks = split_markdown(document, max_tokens)
+    if not chunks:
+        return run_text_review("")
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as pool:
+        # propagate() keeps the caller's telemetry stage/document on the worker threads
+        reviews = list(pool.map(propagate(lambda chunk: run_text_review(chunk["text"])), chunks))
+    return merge_chunk_reviews(chunks, reviews)
 
 
 text_chunk = '''Performance data represents past performance and does guarantee
@@ -1,24 +1,16 @@
-import re
 import json
 import uuid
-import pandas as pd
-from difflib import SequenceMatcher
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
-import os 
+from llm_cache import cached_generate
+from clients import generate_content
+from disclosure_match import match_disclosures, disclosure_status
+from disclosure_library import load_library
+from disclosure_detect import detect_disclosures
+from responses import DISCLOSURE_SCHEMA, json_config, parse_disclosures
+from document_handle import open_document
 
-def run_disclosure_analysis(excel_path: str, pdf_bytes: bytes) -> list:
-    # 1. Initialize client
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    client = genai.Client(api_key=api_key)
-
-    # 2. Load standard disclosures
-    df = pd.read_excel(excel_path, engine="openpyxl")
-    std_disclosures = df["Unnamed: 4"].dropna().astype(str).tolist()
-
-    # 3. Prompts
+def _extract_disclosures(pdf):
+    """Ask Gemini for every disclosure in the PDF; None when the API call fails."""
+    # Prompts
     system_prompt = (
         "You are an expert compliance checker. Extract all disclosure texts "
         "from the provided PDF document and return in JSON format, "
@@ -29,45 +21,49 @@ def run_disclosure_analysis(excel_path: str, pdf_bytes: bytes) -> list:
     )
 
     try:
-        pdf_part = types.Part.from_bytes(
-            data=pdf_bytes, 
-            mime_type="application/pdf"
+        document = open_document(pdf)
+        prompt_text = system_prompt + "\n\n" + user_prompt
+        config = json_config(DISCLOSURE_SCHEMA)
+        response_text = cached_generate(
+            "gemini-2.0-flash-exp",
+            config,
+            [document.data, prompt_text],
+            lambda: generate_content("gemini-2.0-flash-exp", [document.genai_part(), prompt_text], config).text,
         )
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=[pdf_part, system_prompt + "\n\n" + user_prompt]
-        )
-        
-        response_text = response.text
         
     except Exception as e:
         print(f"Gemini API error: {e}")
         print(f"Error type: {type(e).__name__}")
         import traceback
         traceback.print_exc()
-        return []
+        return None
+
+    return parse_disclosures(response_text)
 
-    try:
-        cleaned = re.sub(r"^```json\s*|\s*```$", "", response_text, flags=re.DOTALL)
-        ai_disclosures = json.loads(cleaned).get("disclosures", [])
-    except Exception as e:
-        print(f"JSON parsing error: {e}")
-        print(f"Response text: {response_text[:500]}")
-        ai_disclosures = []
+
+def run_disclosure_analysis(excel_path: str, pdf, pages: list = None) -> list:
+    """Partially present / missing library disclosures; None when the Gemini extraction failed."""
+    # 1. Load standard disclosures (precompiled artifact, rebuilt only when the Excel changes)
+    std_disclosures = load_library(excel_path).texts("excel")
+
+    # 2. Local-first: settle what the docling page map already shows
+    settled, unsettled = {}, std_disclosures
+    if pages:
+        settled, unsettled = detect_disclosures(std_disclosures, pages)
+
+    # 3. Gemini extraction only for the disclosures left unsettled
+    ai_disclosures = []
+    if unsettled:
+        ai_disclosures = _extract_disclosures(pdf)
+        if ai_disclosures is None:
+            return None  # extraction failed: nothing can be reported as missing
+    matches = dict(settled)
+    matches.update(zip(unsettled, match_disclosures(unsettled, ai_disclosures)))
 
     results = []
     for std in std_disclosures:
-        best = {"score": 0, "text": "", "pages": "N/A"}
-        for ai in ai_disclosures:
-            score = SequenceMatcher(None, std, ai.get("text", "")).ratio() * 100
-            if score > best["score"]:
-                best = {"score": score, "text": ai.get("text", ""), "pages": ai.get("pages", "N/A")}
-
-        status = (
-            "Present" if best["score"] == 100 else
-            "Partially Present" if best["score"] >= 80 else
-            "Not Present"
-        )
+        best = matches[std]
+        status = disclosure_status(best["score"])
 
         results.append({
             "id": str(uuid.uuid4()),
@@ -84,11 +80,8 @@ def run_disclosure_analysis(excel_path: str, pdf_bytes: bytes) -> list:
 # ------------------------------
 # Test
 # ------------------------------
-def disclosure(path):
-    pdf_path = path
-    with open(pdf_path, "rb") as f:
-        pdf_bytes = f.read()
-
-    disclosures = run_disclosure_analysis("data/Disclosure Library_TEMPLATE_DRAFT.xlsx", pdf_bytes)
+def disclosure(path, pages=None):
+    # path may also be a DocumentHandle; the PDF is only read if Gemini is needed
+    disclosures = run_disclosure_analysis("data/Disclosure Library_TEMPLATE_DRAFT.xlsx", path, pages)
     res = json.dumps(disclosures, indent=4)
     return res 
\ No newline at end of file
@@ -1,46 +1,23 @@
-import re
-import json
-import pandas as pd
-from typing import List, Dict, Any
-import base64
 from prompts import (
-    base_review_prompt_template,
-    text_input_instruction,
-    multimodal_input_instruction,
-    synthesis_prompt_template,
-    typo_date_prompt_sys,
-    typo_date_prompt_user,
-    false_positives_guardrails
+    base_review_prompt,
+    multimodal_review_suffix
 )
-from google import genai
-from dotenv import load_dotenv
 from pathlib import Path
-from google.genai import types
-import os 
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
+from llm_cache import cached_generate, cached_stream
+from prefix_cache import get_prefix_cache
+from clients import get_genai_client, generate_content, generate_content_stream
+from streaming import stream_review_events
+from responses import REVIEW_SCHEMA, json_config, parse_review
+from document_handle import open_document
+from multimodal_batches import (
+    MULTIMODAL_BATCH_MIN_PAGES,
+    MULTIMODAL_BATCH_OVERLAP,
+    MULTIMODAL_BATCH_PAGES,
+    review_batched,
+)
 review_config = {"temperature": 0.0, "top_p": 0.15, "top_k": 6}
 REVIEW_MODEL_NAME = "gemini-2.5-flash"
-review_model = genai.Client(api_key=api_key)
 
-def parse_response_to_json(response_text, source_name):
-    import json, re
-    try:
-        return json.loads(response_text)
-    except:
-        pass
-    json_match = re.search(r"\{.*\}", response_text, re.DOTALL)
-    if json_match:
-        try:
-            return json.loads(json_match.group())
-        except:
-            pass
-    return {
-        "document_name": source_name,
-        "sections": [],
-        "overall_conclusion": "Failed to parse JSON from model response.",
-        "raw_response": response_text
-    }
 
 def pdf_to_bytes(pdf_path) -> bytes:
     """
@@ -68,40 +45,76 @@ def pdf_to_bytes(pdf_path) -> bytes:
         return f.read()
 
 # Inference: take pdf files and generate review based on that 
-def run_multimodal_review(pdf_bytes: bytes) -> dict:
-    prompt_text = base_review_prompt_template + "\n\n" + multimodal_input_instruction
-    
-    # Create Part objects
-    pdf_part = types.Part.from_bytes(
-        data=pdf_bytes,
-        mime_type="application/pdf"
-    )
-    
-    content = [pdf_part, prompt_text]
-    
-    response = review_model.models.generate_content(
-        model=REVIEW_MODEL_NAME,
-        contents=content,
-        config={
-            "temperature": review_config["temperature"],
-            "top_p": review_config["top_p"],
-            "top_k": review_config["top_k"]
-        }
-    )
+def run_multimodal_review(pdf) -> dict:
+    """`pdf`: PDF bytes, a path or a DocumentHandle (uploaded once, shared with other stages)."""
+    document = open_document(pdf)
+    static_prefix = base_review_prompt()
+    suffix = multimodal_review_suffix("Document")
+    prompt_text = static_prefix + "\n\n" + suffix
     
-    response_text = (getattr(response, "text", "") or "").strip()
+    config = json_config(REVIEW_SCHEMA, {
+        "temperature": review_config["temperature"],
+        "top_p": review_config["top_p"],
+        "top_k": review_config["top_k"]
+    })
+
+    def _generate():
+        # Only the PDF and the short instruction are sent; the static prefix is cached
+        prefix = get_prefix_cache(get_genai_client(), REVIEW_MODEL_NAME, static_prefix)
+        content, request_config = prefix.build_request([document.genai_part(), suffix], config)
+        response = generate_content(REVIEW_MODEL_NAME, content, request_config)
+        return (getattr(response, "text", "") or "").strip()
+
+    response_text = cached_generate(REVIEW_MODEL_NAME, config, [document.data, prompt_text], _generate)
     # print(response_text)
     # print("*"*50)
-    result = parse_response_to_json(response_text, "Multimodal Review")
+    return _finish_multimodal(response_text)
+
+def _finish_multimodal(response_text: str) -> dict:
+    result = parse_review(response_text, "Multimodal Review")
     result["document_name"] = result.get("document_name", "").replace(
         "<placeholder>", "Multimodal Review"
     )
     return result
 
+
+def run_multimodal_review_stream(pdf):
+    """
+    Streaming run_multimodal_review: yields a "section" event per finding as it
+    completes, then a "result" event with the full report.
+    """
+    document = open_document(pdf)
+    static_prefix = base_review_prompt()
+    suffix = multimodal_review_suffix("Document")
+    prompt_text = static_prefix + "\n\n" + suffix
+    config = json_config(REVIEW_SCHEMA, review_config)
+
+    def _open_stream():
+        prefix = get_prefix_cache(get_genai_client(), REVIEW_MODEL_NAME, static_prefix)
+        content, request_config = prefix.build_request([document.genai_part(), suffix], config)
+        for chunk in generate_content_stream(REVIEW_MODEL_NAME, content, request_config):
+            yield getattr(chunk, "text", "") or ""
+
+    yield from stream_review_events(
+        cached_stream(REVIEW_MODEL_NAME, config, [document.data, prompt_text], _open_stream),
+        _finish_multimodal,
+    )
+
+
+def run_multimodal_review_batched(pdf, batch_pages: int = MULTIMODAL_BATCH_PAGES,
+                                  overlap: int = MULTIMODAL_BATCH_OVERLAP,
+                                  min_pages: int = MULTIMODAL_BATCH_MIN_PAGES) -> dict:
+    """
+    Review a PDF longer than `min_pages` as overlapping page ranges in
+    parallel and merge the partial reports into one, with page_number
+    absolute (see multimodal_batches.py). Shorter PDFs are reviewed whole.
+    """
+    return review_batched(run_multimodal_review, open_document(pdf), batch_pages, overlap, min_pages)
+
+
 def run_multimodal(path):
-    pdf_path = path
-    pdf_bytes = pdf_to_bytes(pdf_path=pdf_path)
-    result = run_multimodal_review(pdf_bytes=pdf_bytes)
+    """`path` may also be a DocumentHandle already opened by the pipeline."""
+    result = run_multimodal_review_batched(path)
     return  result
     # print("#"*50)
 
@@ -1,31 +1,84 @@
 import re 
-from docling.document_converter import DocumentConverter
+import time
+from concurrent.futures import ThreadPoolExecutor
 import os 
 os.environ["HF_HUB_DISABLE_SYMLINKS"] = "1"
-from test_compliance import run_text_review
+from test_compliance import run_text_review, run_text_review_chunked
 from test_desclosure import disclosure
 from test_multimodal import run_multimodal
 from test_syn import run_syn
+from conversion_cache import convert_pdf
+from document_handle import open_document
+import telemetry
 
 
-converter = DocumentConverter()
+def _timed(timings: dict, stage: str, document: str, fn, *args):
+    start = time.perf_counter()
+    try:
+        with telemetry.scope(stage=stage, document=document):
+            return fn(*args)
+    finally:
+        timings[stage] = round(time.perf_counter() - start, 3)
+
+
+def run_review_stages(clean_text: str, local_pdf: str, pages: list = None) -> dict:
+    """
+    Fan out the text, disclosure and multimodal reviews at the same time and
+    start synthesis as soon as the text and multimodal reports are both ready.
+    With a docling page map the text review runs chunked (map-reduce).
+
+    The PDF is read once into a DocumentHandle shared by the disclosure,
+    multimodal and synthesis stages, so it is uploaded once rather than sent
+    inline by each of them.
+
+    Returns every stage result plus a "timings" dict (seconds per stage,
+    "stage_sum" = what the old sequential run would have cost, "wall" = actual)
+    and the per-stage prompt/token/latency telemetry of this document.
+    """
+    timings = {}
+    start = time.perf_counter()
+    document = open_document(local_pdf)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        if pages:
+            text_future = pool.submit(_timed, timings, "text_review", local_pdf, run_text_review_chunked, pages)
+        else:
+            text_future = pool.submit(_timed, timings, "text_review", local_pdf, run_text_review, clean_text)
+        disclosure_future = pool.submit(_timed, timings, "disclosure", local_pdf, disclosure, document, pages)
+        multimodal_future = pool.submit(_timed, timings, "multimodal", local_pdf, run_multimodal, document)
 
-def extract_text_from_pdf(local_pdf:str)->str:
+        text_res = text_future.result()
+        multimodal_res = multimodal_future.result()
+        # disclosure keeps running in the pool while synthesis runs here
+        syn_res = _timed(timings, "synthesis", local_pdf, run_syn, text_res, multimodal_res, document)
+        desclosure_res = disclosure_future.result()
+
+    timings["stage_sum"] = round(sum(timings.values()), 3)
+    timings["wall"] = round(time.perf_counter() - start, 3)
+    return {
+        "text_review": text_res,
+        "disclosure": desclosure_res,
+        "multimodal": multimodal_res,
+        "synthesis": syn_res,
+        "timings": timings,
+        "telemetry": telemetry.report(document=local_pdf)["stages"],
+    }
+
+
+def extract_text_from_pdf(local_pdf:str)->dict:
     try:
-        result = converter.convert(local_pdf)
-        result = converter.convert(local_pdf)
-        markdown = result.document.export_to_markdown(strict_text=True)
-        clean_text = re.sub(r"<!-- image -->", "", markdown)
-
-        text_res = run_text_review(clean_text)
-        print(text_res)
-        desclosure_res = disclosure(local_pdf)
-        print(desclosure_res)
-        multimodal_res = run_multimodal(local_pdf)
-        print(multimodal_res)
-        syn_res = run_syn(text_res,multimodal_res)
-        print(syn_res)
-        return text_res
+        conversion = convert_pdf(local_pdf)
+        clean_text = re.sub(r"<!-- image -->", "", conversion["markdown"])
+
+        stages = run_review_stages(clean_text, local_pdf, conversion["pages"])
+        stages["timings"]["conversion"] = conversion["seconds"]
+        print(stages["text_review"])
+        print(stages["disclosure"])
+        print(stages["multimodal"])
+        print(stages["synthesis"])
+        print("Stage timings (s):", stages["timings"])
+        print("Model calls per stage:", stages["telemetry"])
+        # every stage result with its "timings" (conversion included) and "telemetry"
+        return stages
 
 
 